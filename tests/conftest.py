@@ -6,12 +6,17 @@ from virtwho.configure import VirtwhoSysConfig
 from virtwho.configure import VirtwhoGlobalConfig
 from virtwho.configure import RHSMConf
 from virtwho.configure import get_hypervisor_handler, virtwho_ssh_connect
+from virtwho.configure import virtwho_host_info
 from virtwho.configure import get_register_handler
 from virtwho.configure import hypervisor_create
 
 from virtwho.ssh import SSHConnect
-from virtwho.register import SubscriptionManager, Satellite, RHSM
+from virtwho.register import SubscriptionManager, Satellite, RHSM, RecordingProxy
+from virtwho.register import http_close, http_latency, wait_delete_verifications
 from virtwho import HYPERVISOR, REGISTER, RHEL_COMPOSE, logger
+from virtwho import hostpool
+from virtwho.cleanup import CleanupQueue
+from virtwho.logger import merge_worker_logs
 from virtwho.base import hostname_get
 
 import time
@@ -43,6 +48,31 @@ def log_virtwho_version(ssh_host):
     print(f"{'=' * 60}\n", flush=True)
 
 
+def pytest_sessionstart(session):
+    """Lease a virt-who host from the host pool for this worker, the
+    pytest-xdist controller doesn't run any test so it leases nothing."""
+    xdist_controller = getattr(session.config.option, "numprocesses", None) and (
+        not hasattr(session.config, "workerinput")
+    )
+    if not xdist_controller:
+        hostpool.lease()
+
+
+def pytest_sessionfinish(session):
+    """Release the virt-who host leased by this worker, wait for the
+    background delete verifications, log the register api latency, and
+    merge the log files of all the workers when the pytest-xdist
+    controller finishes."""
+    hostpool.release()
+    for failure in wait_delete_verifications(timeout=120):
+        logger.error(f"Background consumer delete verification: {failure}")
+    for endpoint, counter in sorted(http_latency().items()):
+        logger.info(f"Register api latency of {endpoint}: {counter}")
+    http_close()
+    if not hasattr(session.config, "workerinput"):
+        merge_worker_logs()
+
+
 def pytest_runtest_logstart(nodeid):
     logger.info(f"Started Test: {nodeid}")
 
@@ -104,6 +134,16 @@ def function_hypervisor():
     return hypervisor_create(HYPERVISOR, REGISTER)
 
 
+@pytest.fixture(scope="session")
+def cleanup_queue():
+    """The session queue of the deferred host deletes on the register
+    servers, see virtwho/cleanup.py. The remaining tasks are waited and
+    the cleanup latency is summarized at the session end."""
+    queue = CleanupQueue()
+    yield queue
+    queue.close(timeout=600)
+
+
 @pytest.fixture(scope="session")
 def globalconf():
     """Instantication of class VirtwhoGlobalConfig()"""
@@ -171,8 +211,20 @@ def function_debug_false(globalconf):
 
 @pytest.fixture(scope="session")
 def virtwho():
-    """Instantication of class VirtwhoRunner()"""
-    return VirtwhoRunner(HYPERVISOR, REGISTER)
+    """Instantication of class VirtwhoRunner()
+    Set [virtwho]:agent=true in virtwho.ini to analyze rhsm.log on the
+    virt-who host by the analysis agent."""
+    agent = config.virtwho.get("agent", "") == "true"
+    return VirtwhoRunner(HYPERVISOR, REGISTER, agent=agent)
+
+
+@pytest.fixture(scope="function")
+def function_fuzzy_mappings(virtwho):
+    """Match the uuids of the analyzed mappings case insensitively and
+    byte-swapped, such as the smbios uuid reported by esx and hyperv"""
+    virtwho.fuzzy = True
+    yield
+    virtwho.fuzzy = False
 
 
 @pytest.fixture(scope="session")
@@ -201,20 +253,12 @@ def sm_host():
     Instantication of class SubscriptionManager() for virt-who host
     with default org
     """
-    vw_server = config.virtwho.server
-    vw_username = config.virtwho.username
-    vw_password = config.virtwho.password
-    vw_port = config.virtwho.port or 22
-    if HYPERVISOR == "local":
-        vw_server = config.local.server
-        vw_username = config.local.username
-        vw_password = config.local.password
-        vw_port = config.local.port or 22
+    vw_host = virtwho_host_info(HYPERVISOR)
     return SubscriptionManager(
-        host=vw_server,
-        username=vw_username,
-        password=vw_password,
-        port=vw_port,
+        host=vw_host.server,
+        username=vw_host.username,
+        password=vw_host.password,
+        port=vw_host.port,
         register_type=REGISTER,
         org=register_handler.default_org,
     )
@@ -473,9 +517,10 @@ def _oneshot_discover(data):
         mode = "hyperv"
 
     try:
-        vw_host = config.virtwho.server
-        vw_user = config.virtwho.username
-        vw_port = config.virtwho.port or 22
+        vw_info = virtwho_host_info()
+        vw_host = vw_info.server
+        vw_user = vw_info.username
+        vw_port = vw_info.port
         sys.stderr.write(
             f"[oneshot-discover] connecting to virt-who host "
             f"{vw_user}@{vw_host}:{vw_port} for {hyp_type}\n"
@@ -484,7 +529,7 @@ def _oneshot_discover(data):
         ssh = SSHConnect(
             host=vw_host,
             user=vw_user,
-            pwd=config.virtwho.password,
+            pwd=vw_info.password,
             port=vw_port,
         )
 
@@ -731,6 +776,17 @@ def bad_proxy_was_used(ssh_host, container_name):
     return "TCP_DENIED" in logs or "403" in logs or "407" in logs
 
 
+@pytest.fixture(scope="function")
+def recording_proxy(ssh_host, function_hypervisor):
+    """Start the recording proxy on the virt-who host and send the
+    requests of function_hypervisor through it, the tests get the
+    mappings and the send number from the proxy records instead of the
+    rhsm.log, so they don't need the debug mode."""
+    with RecordingProxy(ssh_host) as proxy:
+        proxy.configure(function_hypervisor)
+        yield proxy
+
+
 @pytest.fixture(scope="session")
 def proxy_data():
     """Proxy data for testing (good proxy only; bad proxy comes from
@@ -413,7 +413,7 @@ class TestConfigurationPositive:
             result["error"] == 0
             and result["send"] == 1
             and result["thread"] == 1
-            and guest_uuid in str(result["mappings"])
+            and guest_uuid in result["mappings"]
         )
 
     @pytest.mark.tier1
@@ -8,8 +8,7 @@
 """
 
 import pytest
-from virtwho.settings import config
-from virtwho.configure import hypervisor_create
+from virtwho.configure import hypervisor_create, virtwho_host_info
 from virtwho.base import msg_search, ssh_access_no_password, expect_run
 from virtwho import HYPERVISOR, REGISTER, logger
 from virtwho.ssh import SSHConnect
@@ -129,8 +128,9 @@ class TestVirtwhoService:
             1. we can control the virt-who service in a remote host by
                 ssh login.
         """
-        server = config.virtwho.server
-        port = config.virtwho.port
+        vw_host = virtwho_host_info()
+        server = vw_host.server
+        port = vw_host.port
         ssh_access_no_password(ssh_guest, ssh_host, server, port)
         virtwho.operate_service(action="stop")
         virtwho.kill_pid("virt-who")
@@ -233,9 +233,10 @@ class TestVirtwhoService:
             1. virt-who service can start and report normally by the non_root
                 account.
         """
-        host = config.virtwho.server
+        vw_host = virtwho_host_info()
+        host = vw_host.server
         username_new = "tester"
-        password = config.virtwho.password
+        password = vw_host.password
         try:
             ssh_host.runcmd(f"userdel -rf {username_new} 2>/dev/null || true")
             ssh_host.runcmd(f"useradd {username_new}")
@@ -129,7 +129,7 @@ class TestAHVPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data in str(result["mappings"])
+                and hypervisor_id_data in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -161,7 +161,7 @@ class TestAHVPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data not in str(result["mappings"])
+                and hypervisor_id_data not in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -573,7 +573,7 @@ class TestAHVNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data in str(result["mappings"])
+                    and hypervisor_id_data in result["mappings"]
                 )
 
             function_hypervisor.delete("hypervisor_id")
@@ -589,7 +589,7 @@ class TestAHVNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
 
         # config filter_hosts with 'hostname' and "hostname"
@@ -600,7 +600,7 @@ class TestAHVNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
     @pytest.mark.tier2
@@ -644,7 +644,7 @@ class TestAHVNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data not in str(result["mappings"])
+                    and hypervisor_id_data not in result["mappings"]
                 )
 
         hostname = hypervisor_data["hypervisor_hostname"]
@@ -657,7 +657,7 @@ class TestAHVNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
         for exclude_hosts in [f"'{hostname}'", f'"{hostname}"']:
@@ -667,5 +667,5 @@ class TestAHVNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
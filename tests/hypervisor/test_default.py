@@ -238,10 +238,7 @@ class TestHypervisorPositive:
         # check host-to-guest association in rhsm.log
         if HYPERVISOR != "local":
             mappings = result["mappings"]
-            associated_hypervisor_in_mapping = mappings[default_org][guest_uuid][
-                "guest_hypervisor"
-            ]
-            assert associated_hypervisor_in_mapping == host_name
+            assert mappings.hypervisor_of(guest_uuid, default_org) == host_name
 
         # # check host-to-guest association in webui
         # if REGISTER == "rhsm":
@@ -259,6 +256,8 @@ class TestHypervisorPositive:
         rhsm,
         satellite,
         register_data,
+        function_debug_false,
+        recording_proxy,
     ):
         """
         :title: virt-who: hypervisor: test the mapping info
@@ -268,11 +267,12 @@ class TestHypervisorPositive:
         :customerscenario: false
         :upstream: no
         :steps:
-            1. Run the virt-who service by cli
-            2. Check the mapping info from the rhsm.log
+            1. Run the virt-who service by cli without debug through the
+            recording proxy
+            2. Check the mapping info from the proxy records
             3. Run the virt-who service by by starting service
-            4. Check the mapping info from the rhsm.log
-            5. Check the hypervisor facts from the rhsm.log
+            4. Check the mapping info from the proxy records
+            5. Check the hypervisor facts from the proxy records
 
         :expectedresults:
             2. The hypervisor is associated with guest in the result and for the
@@ -283,32 +283,34 @@ class TestHypervisorPositive:
         """
         host_name = hypervisor_data["hypervisor_hostname"]
         guest_uuid = hypervisor_data["guest_uuid"]
+        default_org = register_data["default_org"]
 
         # check fetch and send function by virt-who cli
-        result = virtwho.run_cli(debug=True, oneshot=False)
+        result = virtwho.run_cli(debug=False, oneshot=False)
         assert (
             result["error"] == 0
-            and result["send"] == 1
             and result["thread"] == 1
-            and virtwho.associate_in_mapping(
-                result, register_data["default_org"], host_name, guest_uuid
+            and recording_proxy.send_number(since_last=True) == 1
+            and recording_proxy.mappings().associated(
+                host_name, guest_uuid, default_org
             )
         )
 
         # check fetch and send function by virt-who service
         result = virtwho.run_service()
+        checkins = recording_proxy.checkins(since_last=True)
+        mappings = recording_proxy.mappings(checkins)
         assert (
             result["error"] == 0
-            and result["send"] == 1
             and result["thread"] == 1
-            and virtwho.associate_in_mapping(
-                result, register_data["default_org"], host_name, guest_uuid
-            )
+            and len(checkins) == 1
+            and checkins[0]["status"] in (200, 202)
+            and mappings.associated(host_name, guest_uuid, default_org)
         )
 
-        # check hypervisor's facts
-        facts = result["mappings"][register_data["default_org"]][host_name]
-        assert "hypervisors_async" in result["log"]
+        # check hypervisor's facts, which are sent by the async api
+        facts = mappings[default_org][host_name]
+        assert checkins[0]["path"].rstrip("/").endswith(f"/hypervisors/{default_org}")
         assert (
             "type" in facts.keys()
             and "version" in facts.keys()
@@ -149,7 +149,7 @@ class TestEsxPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data in str(result["mappings"])
+                and hypervisor_id_data in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -183,7 +183,7 @@ class TestEsxPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data not in str(result["mappings"])
+                and hypervisor_id_data not in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -223,7 +223,7 @@ class TestEsxPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data in str(result["mappings"])
+                and hypervisor_id_data in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -263,7 +263,7 @@ class TestEsxPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data not in str(result["mappings"])
+                and hypervisor_id_data not in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -292,7 +292,10 @@ class TestEsxPositive:
         assert result["error"] == 0 and result["send"] == 1 and result["thread"] == 1
 
     @pytest.mark.tier1
-    def test_fake_type(self, virtwho, function_hypervisor, hypervisor_data):
+    @pytest.mark.usefixtures("function_fuzzy_mappings")
+    def test_fake_type(
+        self, virtwho, function_hypervisor, hypervisor_data, register_data
+    ):
         """Test the fake type in /etc/virt-who.d/hypervisor.conf
 
         :title: virt-who: esx: test fake type
@@ -309,7 +312,7 @@ class TestEsxPositive:
         :expectedresults:
             1. Can find the json data in the specific path
             2. Succeed to run the virt-who service, can find the host_uuid and guest_uuid in the
-            rhsm.log file
+            rhsm.log file, and the host_uuid is associated with the guest_uuid in mapping
         """
         host_uuid = hypervisor_data["hypervisor_uuid"]
         guest_uuid = hypervisor_data["guest_uuid"]
@@ -327,7 +330,12 @@ class TestEsxPositive:
             and host_uuid in result["log"]
             and guest_uuid in result["log"]
         )
-        # Todo: Need to add the test cases for host-guest association in mapping, web
+        # The smbios uuid of esx may be reported in another case or
+        # byte order, the fuzzy mappings match both of them.
+        assert virtwho.associate_in_mapping(
+            result, register_data["default_org"], host_uuid, guest_uuid
+        )
+        # Todo: Need to add the test cases for host-guest association in web
 
     @pytest.mark.tier1
     def test_read_only_account(
@@ -705,7 +713,7 @@ class TestEsxNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data in str(result["mappings"])
+                    and hypervisor_id_data in result["mappings"]
                 )
 
             function_hypervisor.delete("hypervisor_id")
@@ -721,7 +729,7 @@ class TestEsxNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
 
         # config filter_hosts with 'hostname' and "hostname"
@@ -732,7 +740,7 @@ class TestEsxNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
     @pytest.mark.tier2
@@ -776,7 +784,7 @@ class TestEsxNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data not in str(result["mappings"])
+                    and hypervisor_id_data not in result["mappings"]
                 )
 
         hostname = hypervisor_data["hypervisor_hostname"]
@@ -789,7 +797,7 @@ class TestEsxNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
         for exclude_hosts in [f"'{hostname}'", f'"{hostname}"']:
@@ -799,7 +807,7 @@ class TestEsxNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
 
     @pytest.mark.tier2
@@ -835,7 +843,7 @@ class TestEsxNegative:
             result["error"] == 0
             and result["send"] == 1
             and result["thread"] == 1
-            and hypervisor_uuid not in str(result["mappings"])
+            and hypervisor_uuid not in result["mappings"]
         )
 
         # run virt-who with filter_hosts=* and exclude_hosts=[host_uuid]
@@ -846,7 +854,7 @@ class TestEsxNegative:
             result["error"] == 0
             and result["send"] == 1
             and result["thread"] == 1
-            and hypervisor_uuid not in str(result["mappings"])
+            and hypervisor_uuid not in result["mappings"]
         )
 
         # run virt-who with exclude_hosts= and filter_hosts=[host_uuid]
@@ -857,7 +865,7 @@ class TestEsxNegative:
             result["error"] == 0
             and result["send"] == 1
             and result["thread"] == 1
-            and hypervisor_uuid in str(result["mappings"])
+            and hypervisor_uuid in result["mappings"]
         )
 
     @pytest.mark.tier2
@@ -904,14 +912,14 @@ class TestEsxNegative:
                         result["error"] == 0
                         and result["send"] == 1
                         and result["thread"] == 1
-                        and hypervisor_id_data not in str(result["mappings"])
+                        and hypervisor_id_data not in result["mappings"]
                     )
                 else:
                     assert (
                         result["error"] == 0
                         and result["send"] == 1
                         and result["thread"] == 1
-                        and hypervisor_id_data in str(result["mappings"])
+                        and hypervisor_id_data in result["mappings"]
                     )
 
             function_hypervisor.delete("hypervisor_id")
@@ -961,14 +969,14 @@ class TestEsxNegative:
                         result["error"] == 0
                         and result["send"] == 1
                         and result["thread"] == 1
-                        and hypervisor_id_data in str(result["mappings"])
+                        and hypervisor_id_data in result["mappings"]
                     )
                 else:
                     assert (
                         result["error"] == 0
                         and result["send"] == 1
                         and result["thread"] == 1
-                        and hypervisor_id_data not in str(result["mappings"])
+                        and hypervisor_id_data not in result["mappings"]
                     )
 
             function_hypervisor.delete("hypervisor_id")
@@ -20,6 +20,7 @@ from virtwho import SECOND_HYPERVISOR_SECTION
 
 from virtwho.base import encrypt_password, is_host_responsive, msg_search
 from virtwho.configure import hypervisor_create
+from virtwho.scenario import ScenarioBatch
 
 from hypervisor.virt.hyperv.hypervcli import HypervCLI
 
@@ -132,7 +133,7 @@ class TestHypervPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data in str(result["mappings"])
+                and hypervisor_id_data in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -164,7 +165,7 @@ class TestHypervPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data not in str(result["mappings"])
+                and hypervisor_id_data not in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -526,9 +527,9 @@ class TestHypervNegative:
             1. Set hypervisor_id=hostname.
             2. Configure filter_hosts='*', run the virt-who service.
             3. Configure filter_hosts=wildcard, run the virt-who service.
-            4. Configure filter_hosts=, run the virt-who service.
-            5. Configure filter_hosts='', run the virt-who service.
-            6. Configure filter_hosts="", run the virt-who service.
+            4. Configure filter_hosts= in one config.
+            5. Configure filter_hosts='' in another config.
+            6. Configure filter_hosts="" in the third config, run virt-who once for them.
             7. Configure filter_hosts='{hostname}', run the virt-who service.
             8. Configure filter_hosts="{hostname}, run the virt-who service.
         :expectedresults:
@@ -553,7 +554,7 @@ class TestHypervNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data in str(result["mappings"])
+                    and hypervisor_id_data in result["mappings"]
                 )
 
             function_hypervisor.delete("hypervisor_id")
@@ -561,15 +562,22 @@ class TestHypervNegative:
         hostname = hypervisor_data["hypervisor_hostname"]
         function_hypervisor.update("hypervisor_id", "hostname")
 
-        # config filter_hosts with null option
-        for filter_hosts in ["", "''", '""']:
-            function_hypervisor.update("filter_hosts", filter_hosts)
-            result = virtwho.run_service()
+        # config filter_hosts with null option, all the variants are run
+        # by one virt-who run
+        with ScenarioBatch(virtwho) as batch:
+            for index, filter_hosts in enumerate(["", "''", '""']):
+                batch.add(
+                    f"virtwho-filter-null-{index}",
+                    hypervisor_id="hostname",
+                    filter_hosts=filter_hosts,
+                )
+            results = batch.run()
+        for result in results.values():
             assert (
                 result["error"] == 0
                 and result["send"] == 1
-                and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and result["reports"] == 1
+                and hostname not in result["mappings"]
             )
 
         # config filter_hosts with 'hostname' and "hostname"
@@ -580,7 +588,7 @@ class TestHypervNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
     @pytest.mark.tier2
@@ -624,7 +632,7 @@ class TestHypervNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data not in str(result["mappings"])
+                    and hypervisor_id_data not in result["mappings"]
                 )
 
         hostname = hypervisor_data["hypervisor_hostname"]
@@ -637,7 +645,7 @@ class TestHypervNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
         for exclude_hosts in [f"'{hostname}'", f'"{hostname}"']:
@@ -647,7 +655,7 @@ class TestHypervNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
 
     @pytest.mark.tier3
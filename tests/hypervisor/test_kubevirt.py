@@ -100,7 +100,7 @@ class TestKubevirtPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data in str(result["mappings"])
+                and hypervisor_id_data in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -132,7 +132,7 @@ class TestKubevirtPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data not in str(result["mappings"])
+                and hypervisor_id_data not in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -278,7 +278,7 @@ class TestKubevirtNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data in str(result["mappings"])
+                    and hypervisor_id_data in result["mappings"]
                 )
 
             function_hypervisor.delete("hypervisor_id")
@@ -294,7 +294,7 @@ class TestKubevirtNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
 
         # config filter_hosts with 'hostname' and "hostname"
@@ -305,7 +305,7 @@ class TestKubevirtNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
     @pytest.mark.tier2
@@ -349,7 +349,7 @@ class TestKubevirtNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data not in str(result["mappings"])
+                    and hypervisor_id_data not in result["mappings"]
                 )
 
         hostname = hypervisor_data["hypervisor_hostname"]
@@ -362,7 +362,7 @@ class TestKubevirtNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
         for exclude_hosts in [f"'{hostname}'", f'"{hostname}"']:
@@ -372,7 +372,7 @@ class TestKubevirtNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
 
     @pytest.mark.tier2
@@ -132,7 +132,7 @@ class TestLibvrtPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data in str(result["mappings"])
+                and hypervisor_id_data in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -164,7 +164,7 @@ class TestLibvrtPositive:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hypervisor_id_data not in str(result["mappings"])
+                and hypervisor_id_data not in result["mappings"]
             )
 
     @pytest.mark.tier1
@@ -479,7 +479,7 @@ class TestLibvirtNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data in str(result["mappings"])
+                    and hypervisor_id_data in result["mappings"]
                 )
 
             function_hypervisor.delete("hypervisor_id")
@@ -495,7 +495,7 @@ class TestLibvirtNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
 
         # config filter_hosts with 'hostname' and "hostname"
@@ -506,7 +506,7 @@ class TestLibvirtNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
     @pytest.mark.tier2
@@ -550,7 +550,7 @@ class TestLibvirtNegative:
                     result["error"] == 0
                     and result["send"] == 1
                     and result["thread"] == 1
-                    and hypervisor_id_data not in str(result["mappings"])
+                    and hypervisor_id_data not in result["mappings"]
                 )
 
         hostname = hypervisor_data["hypervisor_hostname"]
@@ -563,7 +563,7 @@ class TestLibvirtNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname in str(result["mappings"])
+                and hostname in result["mappings"]
             )
 
         for exclude_hosts in [f"'{hostname}'", f'"{hostname}"']:
@@ -573,5 +573,5 @@ class TestLibvirtNegative:
                 result["error"] == 0
                 and result["send"] == 1
                 and result["thread"] == 1
-                and hostname not in str(result["mappings"])
+                and hostname not in result["mappings"]
             )
@@ -10,7 +10,7 @@
 import pytest
 
 from virtwho import REGISTER, logger
-from virtwho.base import hypervisors_list, msg_search
+from virtwho.base import hypervisors_list
 from virtwho.configure import hypervisor_create
 from virtwho.configure import get_hypervisor_info
 
@@ -20,7 +20,7 @@ from virtwho.configure import get_hypervisor_info
 @pytest.mark.usefixtures("class_globalconf_clean")
 class TestMultiHypervisors:
     def test_multi_hypervisors_report_together(
-        self, virtwho, ssh_host, satellite, rhsm
+        self, virtwho, ssh_host, satellite, rhsm, cleanup_queue
     ):
         """Test virt-who can report multi hypervisors together
 
@@ -62,10 +62,9 @@ class TestMultiHypervisors:
                     hypervisor_hostname = get_hypervisor_info(mode, hostname)
                     guest_uuid = get_hypervisor_info(mode, "guest_uuid")
 
-                    if REGISTER == "rhsm":
-                        rhsm.host_delete(hypervisor_hostname, verify=False)
-                    else:
-                        satellite.host_delete(hypervisor_hostname)
+                    cleanup_queue.host_delete(
+                        rhsm if REGISTER == "rhsm" else satellite, hypervisor_hostname
+                    )
 
                     hypervisor_hostname_list.append(hypervisor_hostname)
                     guest_uuid_list.append(guest_uuid)
@@ -75,6 +74,10 @@ class TestMultiHypervisors:
                         ssh_host, config_file_list, single_file, delete=True
                     )
                 ssh_host.runcmd("ls /etc/virt-who.d/")
+                # the deletes run while the other configs are created, they
+                # must be done before virt-who reports the hypervisors, a
+                # failed delete is logged but doesn't fail the test
+                cleanup_queue.barrier(fail=False)
                 result = virtwho.run_service()
                 mappings = result["mappings"]
                 assert (
@@ -82,12 +85,8 @@ class TestMultiHypervisors:
                     and result["send"] == 1
                     and result["thread"] == 1
                 )
-                assert msg_search(
-                    output=str(mappings), msgs=hypervisor_hostname_list, check="and"
-                )
-                assert msg_search(
-                    output=str(mappings), msgs=guest_uuid_list, check="and"
-                )
+                assert mappings.contains_all(hypervisor_hostname_list)
+                assert mappings.contains_all(guest_uuid_list)
                 for hypervisor in hypervisor_hostname_list:
                     if REGISTER == "rhsm":
                         assert rhsm.consumers(host_name=hypervisor)
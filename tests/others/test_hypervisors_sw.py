@@ -11,7 +11,7 @@
 # the case is just used to test the environments to support Subscription Watch team.
 
 import pytest
-from virtwho.configure import config, hypervisor_create
+from virtwho.configure import config, hypervisor_create, virtwho_host_info
 from virtwho.register import SubscriptionManager, RHSM
 from virtwho.runner import VirtwhoRunner
 from virtwho.base import hostname_get
@@ -46,10 +46,11 @@ class TestHypervisorsSW:
         hypervisors = config.job.multi_hypervisors
         hosts = []
         virtwho = VirtwhoRunner(mode="", register_type="rhsm")
+        vw_host = virtwho_host_info()
         sm_host = SubscriptionManager(
-            host=config.virtwho.server,
-            username=config.virtwho.username,
-            password=config.virtwho.password,
+            host=vw_host.server,
+            username=vw_host.username,
+            password=vw_host.password,
             register_type="rhsm_sw",
         )
         rhsm = RHSM(rhsm="rhsm_sw")
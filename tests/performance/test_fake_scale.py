@@ -0,0 +1,132 @@
+"""Test cases Global fields
+
+:casecomponent: virt-who
+:testtype: nonfunctional
+:caseautomation: Automated
+:subsystemteam: rhel-sst-csi-client-tools
+:caselevel: Component
+"""
+
+# Run the suite separately, the largest inventory takes minutes:
+#     # pytest tests/performance -m performance
+# The results are saved to logs/performance/<virt-who NVR>.json, which is
+# the baseline of the next virt-who build.
+
+import pytest
+
+from virtwho import logger
+from virtwho.fake import FakeInventory, fake_config_create
+from virtwho.performance import (
+    baseline_result,
+    measure,
+    regressions,
+    save_result,
+    scaling_exponent,
+    thresholds,
+)
+
+# (hypervisors, guests of each hypervisor), 10 to 100k guests
+SIZES = [(1, 10), (10, 10), (10, 100), (100, 100), (100, 1000)]
+
+
+@pytest.fixture(scope="class")
+def scale_results(ssh_host):
+    """Collect the metrics of all the sizes and save them for the NVR"""
+    _, nvr = ssh_host.runcmd("rpm -q virt-who")
+    data = {"nvr": nvr.strip(), "points": list()}
+    yield data
+    if data["points"]:
+        save_result(data["nvr"], data)
+
+
+@pytest.mark.performance
+@pytest.mark.usefixtures("class_virtwho_d_conf_clean")
+@pytest.mark.usefixtures("class_globalconf_clean")
+class TestFakeScale:
+    @pytest.mark.parametrize(
+        "hypervisors, guests",
+        SIZES,
+        ids=[f"{h * g}guests" for h, g in SIZES],
+    )
+    def test_fake_scale_sweep(
+        self, virtwho, ssh_host, scale_results, hypervisors, guests
+    ):
+        """Measure virt-who reporting the fake inventories of the sizes
+
+        :title: virt-who: performance: measure fake inventory reporting at scale
+        :id: d9ba8f51-c8a1-4fb3-8ddc-4f69b185b223
+        :caseimportance: High
+        :tags: performance,fake,tier3
+        :customerscenario: false
+        :upstream: no
+        :steps:
+            1. Generate the fake json of the hypervisors and guests and
+                upload it to the virt-who host
+            2. Create the fake config with is_hypervisor=True
+            3. Run virt-who once with the fake config by the resource
+                usage wrapper
+            4. Analyze the rhsm.log for the sends and the mapping payload
+        :expectedresults:
+            1. Succeed to run virt-who, no error messages in the rhsm.log
+            2. The mapping is sent, including all the hypervisors and
+                guests of the inventory
+            3. The oneshot time, time to first send, cpu time, peak rss,
+                payload size and batches are recorded
+        """
+        inventory = FakeInventory(hypervisors=hypervisors, guests=guests)
+        remote_file = inventory.upload(ssh_host)[None]
+        fake_config = fake_config_create(remote_file=remote_file)
+        metrics = measure(virtwho, fake_config.remote_file)
+        metrics["inventory_hypervisors"] = hypervisors
+        metrics["inventory_guests"] = hypervisors * guests
+        scale_results["points"].append(metrics)
+        logger.info(f"Scale point of {hypervisors * guests} guests: {metrics}")
+        assert (
+            metrics["returncode"] == 0
+            and metrics["error"] == 0
+            and metrics["send"] >= 1
+        )
+        assert (
+            metrics["hypervisors"] == hypervisors
+            and metrics["guests"] == hypervisors * guests
+        )
+
+    def test_fake_scale_curve(self, scale_results):
+        """Check the scaling curves and compare them with the baseline build
+
+        :title: virt-who: performance: check the scaling curve of fake inventories
+        :id: 7d4e75a2-553a-4164-ba1b-42671ca4381d
+        :caseimportance: High
+        :tags: performance,fake,tier3
+        :customerscenario: false
+        :upstream: no
+        :steps:
+            1. Fit the slopes of the oneshot time and the peak rss to the
+                guests of the large inventories in log-log scale
+            2. Compare the metrics with the ones of the same sizes of the
+                last saved virt-who build
+        :expectedresults:
+            1. The oneshot time grows no faster than the time_exponent
+                and the peak rss no faster than the rss_exponent
+            2. No metric is larger than the regression ratio of the
+                baseline build
+        """
+        points = scale_results["points"]
+        if len(points) < len(SIZES):
+            pytest.skip("Not all the sizes are measured")
+        limits = thresholds()
+        time_exponent = scaling_exponent(points, "oneshot_time", limits["curve_from"])
+        rss_exponent = scaling_exponent(points, "peak_rss_mb", limits["curve_from"])
+        scale_results["time_exponent"] = time_exponent
+        scale_results["rss_exponent"] = rss_exponent
+        logger.info(
+            f"Scaling exponents of {scale_results['nvr']}: time {time_exponent}, "
+            f"rss {rss_exponent}"
+        )
+        assert time_exponent is not None and time_exponent <= limits["time_exponent"]
+        assert rss_exponent is not None and rss_exponent <= limits["rss_exponent"]
+
+        baseline = baseline_result(scale_results["nvr"])
+        if baseline:
+            messages = regressions(points, baseline, limits["regression"])
+            assert not messages, "\n".join(messages)
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from virtwho.rhsmlog import RhsmLog
+
+
+def loop_lines(loop, guests, org="Default_Organization"):
+    """
+    Generate the rhsm.log lines of one virt-who report loop in debug mode.
+    :param loop: the loop number, used to increase the timestamp
+    :param guests: the guest number of the hypervisor
+    :param org: the organization the mapping is sent to
+    :return: list of lines
+    """
+    seconds = loop * 3600
+    clock = "{:02d}:{:02d}:{:02d}".format(
+        seconds // 3600 % 24, seconds // 60 % 60, seconds % 60
+    )
+    head = f"2022-01-01 {clock},123 [virtwho.main DEBUG] MainProcess(1234):"
+    mapping = {
+        "hypervisors": [
+            {
+                "hypervisorId": {"hypervisorId": "hypervisor-0"},
+                "name": "hypervisor-0",
+                "guestIds": [
+                    {
+                        "guestId": f"{index:08x}-0000-0000-0000-000000000000",
+                        "state": 1,
+                        "attributes": {"active": 1, "virtWhoType": "esx"},
+                    }
+                    for index in range(guests)
+                ],
+                "facts": {
+                    "cpu.cpu_socket(s)": "2",
+                    "hypervisor.type": "VMware ESXi",
+                    "hypervisor.version": "7.0.0",
+                    "dmi.system.uuid": "hypervisor-0",
+                },
+            }
+        ]
+    }
+    lines = [
+        f"{head}Thread-1 @virt.py:_send_data:650 - "
+        f'Report for config "virtwho-config" gathered, placing in datastore',
+        f"{head}MainThread @subscriptionmanager.py:hypervisorCheckIn:300 - "
+        f"Host-to-guest mapping being sent to '{org}': ",
+    ]
+    lines.extend(json.dumps(mapping, indent=4).splitlines())
+    lines.append(
+        f"{head}MainThread @connection.py:_request:750 - Response: status=200, "
+        f'requestUuid=1, request="POST /subscription/hypervisors/{org}"'
+    )
+    return lines
+
+
+def benchmark(args):
+    """
+    Generate synthetic rhsm.log of the required sizes, and measure the
+    time to parse them, the throughput should be flat when the parsing
+    is linear to the log size.
+    """
+    for size in args.sizes:
+        lines = list()
+        length = 0
+        loop = 0
+        while length < size * 1024 * 1024:
+            block = loop_lines(loop, args.guests)
+            length += sum(len(line) + 1 for line in block)
+            lines.extend(block)
+            loop += 1
+        text = "\n".join(lines) + "\n"
+        start = time.perf_counter()
+        log = RhsmLog(text)
+        log.send_number(prefix="/subscription")
+        log.loop_info()
+        log.error_warning()
+        log.mapping_payloads()
+        cost = time.perf_counter() - start
+        print(
+            f"{size} MB, {len(lines)} lines, {loop} loops: "
+            f"{cost:.2f}s, {size / cost:.1f} MB/s"
+        )
+
+
+def arguments_parser():
+    """
+    Parse and convert the arguments from command line to parameters
+    for function using, and generate help and usage messages for
+    each arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[25, 50, 100],
+        help="The sizes (MB) of the generated rhsm.log, default to 25 50 100",
+    )
+    parser.add_argument(
+        "--guests",
+        type=int,
+        default=100,
+        help="The guest number in each mapping, default to 100",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = arguments_parser()
+    benchmark(args)
@@ -824,6 +824,33 @@ def hypervisors_list():
     return config.job.multi_hypervisors.strip("[").strip("]").split(",")
 
 
+def wait_until(predicate, timeout=60, interval=0.2, max_interval=5, message=None):
+    """
+    Wait until the predicate returns a true value, instead of sleeping a
+    fixed time. The polling interval starts from interval and grows 1.5
+    times after each check up to max_interval.
+    :param predicate: callable without argument
+    :param timeout: seconds to wait at most
+    :param interval: seconds of the first polling interval
+    :param max_interval: seconds of the max polling interval
+    :param message: description of the condition for the timeout log
+    :return: the value returned by the predicate, which is false when
+        timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        result = predicate()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if message:
+                logger.warning(f"Timeout ({timeout}s) when waiting for {message}")
+            return result
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 1.5, max_interval)
+
+
 def is_host_responsive(host):
     """
     Check if the host is responsive
@@ -0,0 +1,732 @@
+"""A local stand-in of the candlepin (RHSM) server for virt-who.
+
+It implements the endpoints used by virt-who and subscription-manager:
+status, owners, consumer register/get/update/delete, the async hypervisor
+check-in and heartbeat, and the jobs. Every request is recorded with its
+body and timing, and the latency, 429 and 500 responses can be injected,
+so virt-who runs are deterministic and need no external server.
+
+This module only depends on the python standard library (python>=3.6)
+and the openssl command for the certificates. It's uploaded to the
+virt-who host and run in background, see register.CandlepinStandIn:
+
+    # python3 candlepin.py --port 8443 --prefix /candlepin \\
+        --owner standin_org --ca-dir /etc/rhsm/ca \\
+        --fault 429:POST:/hypervisors:2 --record /tmp/standin.jsonl
+
+The faults and the records are also managed at runtime by the control
+endpoints under /__standin: GET/DELETE requests, GET/PUT faults.
+"""
+
+import argparse
+import base64
+import json
+import os
+import re
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+CONTROL_PREFIX = "/__standin"
+CA_FILE_NAME = "virtwho-standin-ca.pem"
+CAPABILITIES = [
+    "hypervisors_async",
+    "hypervisors_heartbeat",
+    "guest_limit",
+    "vcpu",
+    "cores",
+    "ram",
+    "instance_multiplier",
+    "derived_product",
+    "cert_v3",
+    "remove_by_pool_id",
+    "batch_bind",
+    "org_level_content_access",
+    "syspurpose",
+]
+
+
+def run_openssl(*args, stdin=None):
+    """Run the openssl command and return its stdout."""
+    process = subprocess.Popen(
+        ("openssl",) + args,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stdout, stderr = process.communicate(stdin)
+    if process.returncode != 0:
+        raise RuntimeError(f"openssl {args[0]} failed: {stderr.decode()}")
+    return stdout.decode()
+
+
+class Certificates:
+    """The CA, the server certificate and the consumer identity
+    certificates signed by the CA, generated by the openssl command."""
+
+    def __init__(self, cert_dir, hostname="localhost", ca_name="virtwho-standin-ca"):
+        """
+        :param cert_dir: the directory to keep the keys and certificates
+        :param hostname: the server hostname in the certificate
+        :param ca_name: CN of the CA
+        """
+        self.cert_dir = cert_dir
+        self.ca_key = os.path.join(cert_dir, "ca.key")
+        self.ca_cert = os.path.join(cert_dir, "ca.pem")
+        self.server_key = os.path.join(cert_dir, "server.key")
+        self.server_cert = os.path.join(cert_dir, "server.pem")
+        self.serial = int(time.time())
+        self.lock = threading.Lock()
+        os.makedirs(cert_dir, exist_ok=True)
+        if not os.path.exists(self.ca_cert):
+            run_openssl(
+                "req",
+                "-x509",
+                "-newkey",
+                "rsa:2048",
+                "-nodes",
+                "-days",
+                "30",
+                "-subj",
+                f"/CN={ca_name}",
+                "-keyout",
+                self.ca_key,
+                "-out",
+                self.ca_cert,
+            )
+        if not os.path.exists(self.server_cert):
+            self.sign(hostname, self.server_key, self.server_cert, hostname)
+
+    def sign(self, common_name, key_file, cert_file, hostname=None):
+        """
+        Create a key and a certificate signed by the CA.
+        :param common_name: CN of the certificate
+        :param key_file: the key file to write
+        :param cert_file: the certificate file to write
+        :param hostname: add the hostname (or ip) and 127.0.0.1 as
+            subjectAltName
+        """
+        with self.lock:
+            self.serial += 1
+            serial = self.serial
+        csr = run_openssl(
+            "req",
+            "-new",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-keyout",
+            key_file,
+            "-subj",
+            f"/CN={common_name}",
+        )
+        args = [
+            "x509",
+            "-req",
+            "-days",
+            "30",
+            "-CA",
+            self.ca_cert,
+            "-CAkey",
+            self.ca_key,
+            "-set_serial",
+            str(serial),
+            "-out",
+            cert_file,
+        ]
+        ext_file = None
+        if hostname:
+            fd, ext_file = tempfile.mkstemp(dir=self.cert_dir)
+            with os.fdopen(fd, "w") as f:
+                kind = "IP" if re.fullmatch(r"[\d.]+|[\da-fA-F:]+", hostname) else "DNS"
+                f.write(
+                    f"subjectAltName={kind}:{hostname},DNS:localhost,IP:127.0.0.1\n"
+                )
+            args += ["-extfile", ext_file]
+        try:
+            run_openssl(*args, stdin=csr.encode())
+        finally:
+            if ext_file:
+                os.remove(ext_file)
+        return serial
+
+    def identity(self, consumer_uuid):
+        """
+        Create the identity certificate of a consumer.
+        :param consumer_uuid: the consumer uuid as CN
+        :return: dict of the idCert of candlepin
+        """
+        key_file = os.path.join(self.cert_dir, f"{consumer_uuid}.key")
+        cert_file = os.path.join(self.cert_dir, f"{consumer_uuid}.pem")
+        try:
+            serial = self.sign(consumer_uuid, key_file, cert_file)
+            with open(key_file) as f:
+                key = f.read()
+            with open(cert_file) as f:
+                cert = f.read()
+        except (OSError, RuntimeError) as exc:
+            sys.stderr.write(f"Failed to create the identity certificate: {exc}\n")
+            serial, key, cert = 0, "", ""
+        return {"key": key, "cert": cert, "serial": {"id": serial, "serial": serial}}
+
+
+class StandInState:
+    """All the owners, consumers, jobs, records and faults of the server,
+    shared by the request threads under one lock."""
+
+    def __init__(self, owners, username=None, password=None, latency=0):
+        """
+        :param owners: list of the owner keys
+        :param username: the username of the basic auth, any when None
+        :param password: the password of the basic auth
+        :param latency: seconds added to every response
+        """
+        self.lock = threading.Lock()
+        self.owners = {
+            key: {"id": uuid.uuid4().hex, "key": key, "displayName": key}
+            for key in owners
+        }
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.consumers = dict()
+        self.hypervisors = dict()
+        self.jobs = dict()
+        self.records = list()
+        self.faults = list()
+        self.record_file = None
+
+    def owner(self, key):
+        """Get an owner, which is created when not exist."""
+        with self.lock:
+            if key not in self.owners:
+                self.owners[key] = {
+                    "id": uuid.uuid4().hex,
+                    "key": key,
+                    "displayName": key,
+                }
+            return self.owners[key]
+
+    def fault(self, method, path):
+        """
+        Get the injected fault of a request, the count of the fault is
+        decreased and it is skipped when used up.
+        :return: dict of the fault or None
+        """
+        with self.lock:
+            for fault in self.faults:
+                if fault.get("method", "*") not in ("*", method):
+                    continue
+                if not re.search(fault.get("path", ""), path):
+                    continue
+                count = fault.get("count", -1)
+                if count == 0:
+                    continue
+                if count > 0:
+                    fault["count"] = count - 1
+                return dict(fault)
+        return None
+
+    def record(self, item):
+        """Keep the record of a request, and append it to the record file."""
+        with self.lock:
+            self.records.append(item)
+            if self.record_file:
+                with open(self.record_file, "a") as f:
+                    f.write(json.dumps(item, separators=(",", ":")) + "\n")
+
+
+def consumer_summary(consumer):
+    """The consumer in the result data of the hypervisor check-in."""
+    return {
+        "uuid": consumer["uuid"],
+        "name": consumer["name"],
+        "owner": {"key": consumer["owner"]["key"]},
+    }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "virtwho-standin/1.0"
+
+    # the routes under the prefix as (method, regex, handler name)
+    ROUTES = [
+        ("GET", r"/?", "get_resources"),
+        ("GET", r"/status/?", "get_status"),
+        ("GET", r"/owners/?", "get_owners"),
+        ("GET", r"/owners/([^/]+)/?", "get_owner"),
+        ("GET", r"/owners/([^/]+)/consumers/?", "get_owner_consumers"),
+        ("GET", r"/users/([^/]+)/owners/?", "get_owners"),
+        ("POST", r"/consumers/?", "post_consumer"),
+        ("GET", r"/consumers/([^/]+)/?", "get_consumer"),
+        ("PUT", r"/consumers/([^/]+)/?", "put_consumer"),
+        ("DELETE", r"/consumers/([^/]+)/?", "delete_consumer"),
+        ("GET", r"/consumers/([^/]+)/guestids/([^/]+)/?", "get_guest"),
+        ("GET", r"/consumers/([^/]+)/guestids/?", "get_guests"),
+        ("GET", r"/consumers/([^/]+)/.*", "get_empty"),
+        ("POST", r"/hypervisors/?", "post_hypervisors"),
+        ("POST", r"/hypervisors/([^/]+)/?", "post_hypervisors"),
+        ("PUT", r"/hypervisors/([^/]+)/heartbeat/?", "put_heartbeat"),
+        ("GET", r"/jobs/([^/]+)/?", "get_job"),
+    ]
+
+    def log_message(self, format, *args):
+        """Log to stderr only when the server is verbose."""
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def read_body(self):
+        """Read the request body, decode it as json when possible."""
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if not raw:
+            return raw, None
+        try:
+            return raw, json.loads(raw.decode("utf-8"))
+        except ValueError:
+            return raw, raw.decode("utf-8", "replace")
+
+    def authorized(self):
+        """Check the basic auth, the consumer certificate is not checked."""
+        if self.state.username is None:
+            return True
+        value = self.headers.get("Authorization", "")
+        if not value.startswith("Basic "):
+            # the consumers authenticate by the identity certificate
+            return True
+        try:
+            user, _, password = base64.b64decode(value[6:]).decode().partition(":")
+        except ValueError:
+            return False
+        return user == self.state.username and password == self.state.password
+
+    def dispatch(self, method):
+        """Route the request, inject the faults and record it."""
+        started = time.time()
+        url = urlsplit(self.path)
+        path = url.path
+        query = {key: value[-1] for key, value in parse_qs(url.query).items()}
+        raw, body = self.read_body()
+        fault = None
+        if path.startswith(CONTROL_PREFIX):
+            status, data, headers = self.control(method, path, body)
+        else:
+            fault = self.state.fault(method, path)
+            delay = self.state.latency + (fault or dict()).get("latency", 0)
+            if delay:
+                time.sleep(delay)
+            if fault and fault.get("status"):
+                status, data, headers = self.failure(fault)
+            elif not self.authorized():
+                status, data, headers = 401, {"displayMessage": "Invalid user"}, {}
+            else:
+                status, data, headers = self.route(method, path, query, body)
+        payload = b"" if status == 204 else json.dumps(data).encode()
+        self.send_response(status)
+        if status != 204:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+        self.send_header("x-candlepin-request-uuid", str(uuid.uuid4()))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        if not path.startswith(CONTROL_PREFIX):
+            self.state.record(
+                {
+                    "time": started,
+                    "duration": round(time.time() - started, 6),
+                    "method": method,
+                    "path": path,
+                    "query": query,
+                    "status": status,
+                    "size": len(raw),
+                    "body": body,
+                    "fault": bool(fault),
+                }
+            )
+
+    def failure(self, fault):
+        """The injected error response."""
+        status = int(fault["status"])
+        headers = dict()
+        if status == 429:
+            headers["Retry-After"] = str(fault.get("retry_after", 1))
+            message = "Too many requests"
+        else:
+            message = f"Injected error {status}"
+        return status, {"displayMessage": message, "requestUuid": None}, headers
+
+    def control(self, method, path, body):
+        """The control endpoints of the stand-in itself."""
+        name = path[len(CONTROL_PREFIX) :].strip("/")
+        state = self.state
+        if name == "requests" and method == "GET":
+            with state.lock:
+                return 200, list(state.records), {}
+        if name == "requests" and method == "DELETE":
+            with state.lock:
+                state.records = list()
+            return 200, [], {}
+        if name == "faults" and method == "GET":
+            with state.lock:
+                return 200, list(state.faults), {}
+        if name == "faults" and method == "PUT":
+            with state.lock:
+                state.faults = list(body or [])
+                if isinstance(body, dict):
+                    state.faults = list(body.get("faults", []))
+                    state.latency = float(body.get("latency", state.latency))
+            return 200, state.faults, {}
+        if name == "state" and method == "GET":
+            with state.lock:
+                data = {
+                    "owners": list(state.owners),
+                    "consumers": len(state.consumers),
+                    "hypervisors": len(state.hypervisors),
+                    "jobs": len(state.jobs),
+                    "records": len(state.records),
+                    "latency": state.latency,
+                }
+            return 200, data, {}
+        return 404, {"displayMessage": f"Unknown control {method} {name}"}, {}
+
+    def route(self, method, path, query, body):
+        """Call the handler of the path under the prefix."""
+        prefix = self.server.prefix
+        if not path.startswith(prefix):
+            return 404, {"displayMessage": f"Unknown path {path}"}, {}
+        relative = path[len(prefix) :] or "/"
+        for route_method, pattern, name in self.ROUTES:
+            if route_method != method:
+                continue
+            match = re.fullmatch(pattern, relative)
+            if match:
+                return getattr(self, name)(query, body, *match.groups())
+        return 404, {"displayMessage": f"Unknown {method} {path}"}, {}
+
+    def get_resources(self, query, body):
+        names = ["consumers", "owners", "hypervisors", "jobs", "status", "users"]
+        return 200, [{"rel": name, "href": f"/{name}"} for name in names], {}
+
+    def get_status(self, query, body):
+        data = {
+            "result": True,
+            "version": "4.4.0",
+            "release": "1",
+            "standalone": True,
+            "rulesSource": "database",
+            "rulesVersion": "5.44",
+            "managerCapabilities": CAPABILITIES,
+        }
+        return 200, data, {}
+
+    def get_owners(self, query, body, user=None):
+        with self.state.lock:
+            return 200, list(self.state.owners.values()), {}
+
+    def get_owner(self, query, body, key):
+        return 200, self.state.owner(key), {}
+
+    def get_owner_consumers(self, query, body, key):
+        with self.state.lock:
+            consumers = [
+                consumer
+                for consumer in self.state.consumers.values()
+                if consumer["owner"]["key"] == key
+            ]
+        return 200, consumers, {}
+
+    def new_consumer(self, owner_key, name, consumer_type, facts=None):
+        """Create a consumer of an owner."""
+        consumer_uuid = str(uuid.uuid4())
+        consumer = {
+            "uuid": consumer_uuid,
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "type": {"label": consumer_type, "manifest": False},
+            "owner": self.state.owner(owner_key),
+            "facts": facts or dict(),
+            "guestIds": list(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime()),
+            "lastCheckin": None,
+        }
+        with self.state.lock:
+            self.state.consumers[consumer_uuid] = consumer
+        return consumer
+
+    def post_consumer(self, query, body):
+        body = body if isinstance(body, dict) else dict()
+        owner_key = query.get("owner") or next(iter(self.state.owners), "standin")
+        consumer_type = (body.get("type") or dict()).get("label", "system")
+        consumer = self.new_consumer(
+            owner_key, body.get("name", ""), consumer_type, body.get("facts")
+        )
+        data = dict(consumer)
+        data["idCert"] = self.server.certificates.identity(consumer["uuid"])
+        return 200, data, {}
+
+    def get_consumer(self, query, body, consumer_uuid):
+        with self.state.lock:
+            consumer = self.state.consumers.get(consumer_uuid)
+        if consumer is None:
+            return 410, {"displayMessage": f"Consumer {consumer_uuid} is deleted"}, {}
+        return 200, consumer, {}
+
+    def put_consumer(self, query, body, consumer_uuid):
+        with self.state.lock:
+            consumer = self.state.consumers.get(consumer_uuid)
+            if consumer is None:
+                return 410, {"displayMessage": f"Consumer {consumer_uuid} is gone"}, {}
+            if isinstance(body, dict):
+                if "guestIds" in body:
+                    consumer["guestIds"] = body["guestIds"]
+                if "facts" in body:
+                    consumer["facts"] = body["facts"]
+            consumer["lastCheckin"] = time.strftime(
+                "%Y-%m-%dT%H:%M:%S+0000", time.gmtime()
+            )
+        return 204, None, {}
+
+    def delete_consumer(self, query, body, consumer_uuid):
+        with self.state.lock:
+            consumer = self.state.consumers.pop(consumer_uuid, None)
+            if consumer:
+                for key, value in list(self.state.hypervisors.items()):
+                    if value == consumer_uuid:
+                        self.state.hypervisors.pop(key)
+        if consumer is None:
+            return 410, {"displayMessage": f"Consumer {consumer_uuid} is gone"}, {}
+        return 204, None, {}
+
+    def get_guests(self, query, body, consumer_uuid):
+        status, consumer, _ = self.get_consumer(query, body, consumer_uuid)
+        if status != 200:
+            return status, consumer, {}
+        return 200, consumer["guestIds"], {}
+
+    def get_guest(self, query, body, consumer_uuid, guest_id):
+        status, guests, _ = self.get_guests(query, body, consumer_uuid)
+        if status != 200:
+            return status, guests, {}
+        for guest in guests:
+            if isinstance(guest, dict) and guest.get("guestId") == guest_id:
+                return 200, guest, {}
+        return 404, {"displayMessage": f"Guest {guest_id} is not found"}, {}
+
+    def get_empty(self, query, body, consumer_uuid):
+        return 200, [], {}
+
+    def new_job(self, owner_key, result_data):
+        """Create a finished async job with its result data."""
+        job_id = f"hypervisor_update_{uuid.uuid4().hex}"
+        job = {
+            "id": job_id,
+            "key": "HypervisorUpdateJob",
+            "state": "FINISHED",
+            "ownerId": owner_key,
+            "resultData": result_data,
+            "statusPath": f"/jobs/{job_id}",
+        }
+        with self.state.lock:
+            self.state.jobs[job_id] = job
+        return job
+
+    def post_hypervisors(self, query, body, owner_key=None):
+        owner_key = owner_key or query.get("owner") or next(iter(self.state.owners))
+        self.state.owner(owner_key)
+        hypervisors = list()
+        if isinstance(body, dict):
+            hypervisors = body.get("hypervisors", list())
+        result = {"created": [], "updated": [], "unchanged": [], "failedUpdate": []}
+        for item in hypervisors:
+            hypervisor_id = (item.get("hypervisorId") or dict()).get("hypervisorId")
+            if not hypervisor_id:
+                result["failedUpdate"].append("The hypervisorId is missing")
+                continue
+            key = (owner_key, hypervisor_id.lower())
+            with self.state.lock:
+                consumer_uuid = self.state.hypervisors.get(key)
+                consumer = self.state.consumers.get(consumer_uuid)
+            if consumer is None:
+                consumer = self.new_consumer(
+                    owner_key, item.get("name") or hypervisor_id, "hypervisor"
+                )
+                consumer["hypervisorId"] = {"hypervisorId": hypervisor_id}
+                with self.state.lock:
+                    self.state.hypervisors[key] = consumer["uuid"]
+                bucket = "created"
+            else:
+                bucket = "updated"
+                if consumer["guestIds"] == item.get("guestIds", list()) and consumer[
+                    "facts"
+                ] == item.get("facts", dict()):
+                    bucket = "unchanged"
+            with self.state.lock:
+                consumer["name"] = item.get("name") or consumer["name"]
+                consumer["guestIds"] = item.get("guestIds", list())
+                consumer["facts"] = item.get("facts", dict())
+                consumer["lastCheckin"] = time.strftime(
+                    "%Y-%m-%dT%H:%M:%S+0000", time.gmtime()
+                )
+            result[bucket].append(consumer_summary(consumer))
+        return 200, self.new_job(owner_key, result), {}
+
+    def put_heartbeat(self, query, body, owner_key):
+        self.state.owner(owner_key)
+        return 200, self.new_job(owner_key, None), {}
+
+    def get_job(self, query, body, job_id):
+        with self.state.lock:
+            job = self.state.jobs.get(job_id)
+        if job is None:
+            return 404, {"displayMessage": f"Job {job_id} is not found"}, {}
+        return 200, job, {}
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """The threading HTTP(S) server of the stand-in."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, state, prefix, certificates=None, verbose=False):
+        """
+        :param address: (host, port) to listen on
+        :param state: StandInState
+        :param prefix: the api prefix, such as /candlepin
+        :param certificates: Certificates to serve https, http when None
+        :param verbose: log every request to stderr
+        """
+        HTTPServer.__init__(self, address, StandInHandler)
+        self.state = state
+        self.prefix = "/" + prefix.strip("/") if prefix.strip("/") else ""
+        self.certificates = certificates
+        self.verbose = verbose
+        if certificates is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certificates.server_cert, certificates.server_key)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+
+def parse_fault(value):
+    """
+    Parse the fault from the command line.
+    :param value: STATUS:METHOD:PATH[:COUNT[:LATENCY]], such as
+        429:POST:/hypervisors:2, the method can be '*', the count -1 is
+        for all the requests, and the status 0 is only to add latency.
+    :return: dict of the fault
+    """
+    parts = value.split(":")
+    if len(parts) < 3:
+        raise argparse.ArgumentTypeError(f"Invalid fault {value}")
+    fault = {"status": int(parts[0]), "method": parts[1], "path": parts[2]}
+    fault["count"] = int(parts[3]) if len(parts) > 3 and parts[3] else -1
+    if len(parts) > 4 and parts[4]:
+        fault["latency"] = float(parts[4])
+    return fault
+
+
+def serve(args):
+    """Run the stand-in server until it's killed."""
+    certificates = None
+    if not args.http:
+        certificates = Certificates(args.cert_dir, args.hostname)
+        if args.ca_dir:
+            os.makedirs(args.ca_dir, exist_ok=True)
+            shutil.copyfile(
+                certificates.ca_cert, os.path.join(args.ca_dir, CA_FILE_NAME)
+            )
+    state = StandInState(args.owner, args.username, args.password, args.latency)
+    state.faults = list(args.fault)
+    state.record_file = args.record
+    server = StandInServer(
+        (args.bind, args.port), state, args.prefix, certificates, args.verbose
+    )
+    scheme = "http" if args.http else "https"
+    sys.stdout.write(
+        f"Serving {scheme}://{args.hostname}:{server.server_address[1]}"
+        f"{server.prefix}\n"
+    )
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def arguments_parser():
+    """
+    Parse and convert the arguments from command line to parameters
+    for function using, and generate help and usage messages for
+    each arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bind", default="0.0.0.0", help="The address to listen")
+    parser.add_argument("--port", type=int, default=8443, help="The port to listen")
+    parser.add_argument(
+        "--hostname", default="localhost", help="The hostname of the certificate"
+    )
+    parser.add_argument("--prefix", default="/candlepin", help="The api prefix")
+    parser.add_argument(
+        "--owner",
+        action="append",
+        default=list(),
+        help="The owner (org) key, can be used multiple times",
+    )
+    parser.add_argument("--username", default=None, help="The basic auth username")
+    parser.add_argument("--password", default=None, help="The basic auth password")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds added to every response"
+    )
+    parser.add_argument(
+        "--fault",
+        action="append",
+        type=parse_fault,
+        default=list(),
+        help="Inject STATUS:METHOD:PATH[:COUNT[:LATENCY]], can be used multiple times",
+    )
+    parser.add_argument(
+        "--record", default=None, help="Append the requests to the json-lines file"
+    )
+    parser.add_argument(
+        "--cert-dir",
+        default=os.path.join(tempfile.gettempdir(), "virtwho-standin"),
+        help="The directory of the keys and certificates",
+    )
+    parser.add_argument(
+        "--ca-dir",
+        default=None,
+        help="Install the CA certificate to the directory, such as /etc/rhsm/ca",
+    )
+    parser.add_argument("--http", action="store_true", help="Serve http, not https")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    serve(arguments_parser())
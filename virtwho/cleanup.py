@@ -0,0 +1,194 @@
+"""Deferred cleanup of the hosts on the register servers.
+
+Deleting the hypervisor/guest hosts from stage or Satellite is slow and
+the tests rarely need to wait for it. The deletes are enqueued to the
+session CleanupQueue and drained by its worker threads while the test
+goes on. A test that needs the clean state waits for the
+queue by barrier() before the step that depends on it:
+
+    cleanup_queue.host_delete(rhsm, hypervisor_hostname)
+    ...  # create the configs
+    cleanup_queue.barrier()
+    result = virtwho.run_service()
+
+The queue and wait time of the tasks are summarized at the session end.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from virtwho import logger, FailException
+
+
+class CleanupTask:
+    """One cleanup call with its timing and result."""
+
+    __slots__ = (
+        "name",
+        "func",
+        "args",
+        "kwargs",
+        "queued",
+        "started",
+        "ended",
+        "attempts",
+        "error",
+        "future",
+    )
+
+    def __init__(self, name, func, args, kwargs):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.queued = time.monotonic()
+        self.started = None
+        self.ended = None
+        self.attempts = 0
+        self.error = None
+        self.future = None
+
+    @property
+    def wait_time(self):
+        """Seconds from enqueued to started."""
+        return (self.started or self.queued) - self.queued
+
+    @property
+    def run_time(self):
+        """Seconds from started to ended, including the retries."""
+        if self.started is None or self.ended is None:
+            return 0
+        return self.ended - self.started
+
+
+class CleanupQueue:
+    def __init__(self, workers=4, retries=1, backoff=2):
+        """
+        :param workers: the worker threads draining the queue
+        :param retries: the max attempts of one task, the register api
+            requests are retried by their sessions already, see
+            register.http_session().
+        :param backoff: the seconds before the first retry, doubled for
+            the next ones.
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.tasks = list()
+        # the tasks before it are checked by barrier() already
+        self.checked = 0
+
+    def enqueue(self, func, *args, name=None, **kwargs):
+        """
+        Enqueue a cleanup call, it's run by a worker thread.
+        :param func: the callable
+        :param args: the arguments of func
+        :param name: the task name in the logs, default to the func name
+        :param kwargs: the keyword arguments of func
+        :return: CleanupTask
+        """
+        task = CleanupTask(name or func.__name__, func, args, kwargs)
+        with self.lock:
+            task.future = self.executor.submit(self.run, task)
+            self.tasks.append(task)
+        logger.info(f"Enqueued the cleanup task {task.name}")
+        return task
+
+    def host_delete(self, register, host):
+        """
+        Enqueue deleting a host from stage or Satellite.
+        :param register: RHSM or Satellite
+        :param host: the host name (uuid/hwuuid for Satellite)
+        :return: CleanupTask
+        """
+        name = f"{type(register).__name__}.host_delete({host})"
+        if hasattr(register, "consumers"):
+            # stage has eventual consistency, the delete isn't verified
+            return self.enqueue(register.host_delete, host, verify=False, name=name)
+        return self.enqueue(register.host_delete, host, name=name)
+
+    def run(self, task):
+        """Run a task by the worker thread, retry it on the exceptions."""
+        task.started = time.monotonic()
+        try:
+            for attempt in range(self.retries):
+                task.attempts = attempt + 1
+                try:
+                    task.func(*task.args, **task.kwargs)
+                    task.error = None
+                    return
+                except Exception as exc:
+                    task.error = f"{type(exc).__name__}: {exc}"
+                    logger.warning(
+                        f"Cleanup task {task.name} failed: {task.error}, "
+                        f"attempt {task.attempts}/{self.retries}"
+                    )
+                    if task.attempts < self.retries:
+                        time.sleep(self.backoff * 2**attempt)
+        finally:
+            task.ended = time.monotonic()
+
+    def pending(self):
+        """The tasks not finished yet."""
+        with self.lock:
+            return [task for task in self.tasks if not task.future.done()]
+
+    def barrier(self, timeout=None, fail=True):
+        """
+        Wait for all the tasks enqueued since the last barrier.
+        :param timeout: the max seconds to wait
+        :param fail: raise FailException when a task is failed or not
+            finished in time.
+        :return: list of the failed or unfinished tasks
+        """
+        with self.lock:
+            tasks = self.tasks[self.checked :]
+            self.checked = len(self.tasks)
+        start = time.monotonic()
+        wait([task.future for task in tasks], timeout=timeout)
+        failed = [task for task in tasks if not task.future.done() or task.error]
+        logger.info(
+            f"Cleanup barrier waited {time.monotonic() - start:.1f}s for "
+            f"{len(tasks)} task(s), {len(failed)} failed or unfinished"
+        )
+        if failed and fail:
+            raise FailException(
+                "Failed to clean up: "
+                + ", ".join(f"{task.name} ({task.error})" for task in failed)
+            )
+        return failed
+
+    def summary(self):
+        """
+        Summarize the tasks.
+        :return: dict of the task number, failed, retried, and the mean
+            and max seconds of the wait time and run time.
+        """
+        with self.lock:
+            tasks = [task for task in self.tasks if task.future.done()]
+        data = {
+            "tasks": len(tasks),
+            "failed": len([task for task in tasks if task.error]),
+            "retried": len([task for task in tasks if task.attempts > 1]),
+        }
+        for key in ("wait_time", "run_time"):
+            values = [getattr(task, key) for task in tasks] or [0]
+            data[f"{key}_mean"] = round(sum(values) / len(values), 3)
+            data[f"{key}_max"] = round(max(values), 3)
+        return data
+
+    def close(self, timeout=None):
+        """
+        Wait for the tasks and stop the worker threads.
+        :param timeout: the max seconds to wait for the tasks
+        :return: the summary
+        """
+        failed = self.barrier(timeout=timeout, fail=False)
+        for task in failed:
+            logger.error(f"Cleanup task {task.name} failed: {task.error}")
+        self.executor.shutdown(wait=False)
+        summary = self.summary()
+        logger.info(f"Cleanup queue summary: {summary}")
+        return summary
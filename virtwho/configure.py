@@ -1,6 +1,7 @@
 import os
 import pytest
-from virtwho.settings import Configure
+from virtwho import hostpool
+from virtwho.settings import AttrDict, Configure
 from virtwho.settings import config
 from virtwho.settings import TEMP_DIR
 from virtwho.ssh import SSHConnect
@@ -30,10 +31,9 @@ class VirtwhoHypervisorConfig:
         self.hypervisor = get_hypervisor_handler(mode)
         self.remote_ssh = virtwho_ssh_connect(mode)
         self.rhevm_hypervisor_url = None
-        if not os.path.exists(TEMP_DIR):
-            os.mkdir(TEMP_DIR)
-        self.local_file = os.path.join(TEMP_DIR, f"{mode}.conf")
+        os.makedirs(TEMP_DIR, exist_ok=True)
         self.remote_file = config_name or f"/etc/virt-who.d/{mode}.conf"
+        self.local_file = os.path.join(TEMP_DIR, os.path.basename(self.remote_file))
         self.cfg = Configure(self.local_file, self.remote_ssh, self.remote_file)
         logger.info(f"*** Init {self.remote_file}")
 
@@ -42,51 +42,57 @@ class VirtwhoHypervisorConfig:
         :param rhsm: True is to add all rhsm related options, False will not.
         """
         self.destroy()
-        if self.mode == "fake":
-            self.update("type", "fake")
-            self.update("file", PRINT_JSON_FILE)
-            is_hypervisor = "True"
-            if HYPERVISOR == "local":
-                is_hypervisor = "False"
-            self.update("is_hypervisor", is_hypervisor)
-            self.update("owner", self.register.default_org)
-        else:
-            if self.mode == "local":
-                self.update("type", "libvirt")
+        with self.batch():
+            if self.mode == "fake":
+                self.update("type", "fake")
+                self.update("file", PRINT_JSON_FILE)
+                is_hypervisor = "True"
+                if HYPERVISOR == "local":
+                    is_hypervisor = "False"
+                self.update("is_hypervisor", is_hypervisor)
+                self.update("owner", self.register.default_org)
             else:
-                self.update("type", self.mode)
-                self.update("hypervisor_id", "hostname")
-            if self.mode == "kubevirt":
-                self.update("kubeconfig", self.hypervisor.config_file)
-            if self.mode in ("esx", "hyperv", "rhevm", "libvirt", "ahv"):
-                hypervisor_server = self.hypervisor.server
-                if self.mode == "rhevm":
-                    ssh_rhevm = SSHConnect(
-                        host=self.hypervisor.server,
-                        user=self.hypervisor.ssh_username,
-                        pwd=self.hypervisor.ssh_password,
-                    )
-                    hypervisor_server = (
-                        f"https://{hostname_get(ssh_rhevm)}:443/ovirt-engine"
-                    )
-                    self.rhevm_hypervisor_url = hypervisor_server
-                self.update("server", hypervisor_server)
-                self.update("username", self.hypervisor.username)
-                self.update("password", self.hypervisor.password)
-            self.update("owner", self.register.default_org)
-        if rhsm is True and HYPERVISOR != "local":
-            self.update("rhsm_hostname", self.register.server)
-            self.update("rhsm_username", self.register.username)
-            self.update("rhsm_password", self.register.password)
-            self.update("rhsm_prefix", self.register.prefix)
-            self.update("rhsm_port", self.register.port)
-            # proxy related settings to use
-            # due to CCT-1772 a property 'proxy_scheme' is not used
-            for property_name in ["proxy_hostname", "proxy_port"]:
-                if hasattr(self.register, property_name):
-                    self.update(
-                        f"rhsm_{property_name}", getattr(self.register, property_name)
-                    )
+                if self.mode == "local":
+                    self.update("type", "libvirt")
+                else:
+                    self.update("type", self.mode)
+                    self.update("hypervisor_id", "hostname")
+                if self.mode == "kubevirt":
+                    self.update("kubeconfig", self.hypervisor.config_file)
+                if self.mode in ("esx", "hyperv", "rhevm", "libvirt", "ahv"):
+                    hypervisor_server = self.hypervisor.server
+                    if self.mode == "rhevm":
+                        ssh_rhevm = SSHConnect(
+                            host=self.hypervisor.server,
+                            user=self.hypervisor.ssh_username,
+                            pwd=self.hypervisor.ssh_password,
+                        )
+                        hypervisor_server = (
+                            f"https://{hostname_get(ssh_rhevm)}:443/ovirt-engine"
+                        )
+                        self.rhevm_hypervisor_url = hypervisor_server
+                    self.update("server", hypervisor_server)
+                    self.update("username", self.hypervisor.username)
+                    self.update("password", self.hypervisor.password)
+                self.update("owner", self.register.default_org)
+            if rhsm is True and HYPERVISOR != "local":
+                self.update("rhsm_hostname", self.register.server)
+                self.update("rhsm_username", self.register.username)
+                self.update("rhsm_password", self.register.password)
+                self.update("rhsm_prefix", self.register.prefix)
+                self.update("rhsm_port", self.register.port)
+                # proxy related settings to use
+                # due to CCT-1772 a property 'proxy_scheme' is not used
+                for property_name in ["proxy_hostname", "proxy_port"]:
+                    if hasattr(self.register, property_name):
+                        self.update(
+                            f"rhsm_{property_name}",
+                            getattr(self.register, property_name),
+                        )
+
+    def batch(self):
+        """See Configure.batch()."""
+        return self.cfg.batch()
 
     def update(self, option, value):
         """Add or update an option
@@ -108,7 +114,7 @@ class VirtwhoHypervisorConfig:
         """Remove both the local and remote files"""
         os.remove(self.local_file)
         self.remote_ssh.remove_file(self.remote_file)
-        self.cfg = Configure(self.local_file, self.remote_ssh, self.remote_file)
+        self.cfg.reset()
 
 
 class VirtwhoGlobalConfig:
@@ -123,8 +129,7 @@ class VirtwhoGlobalConfig:
         """
         self.mode = mode
         self.remote_ssh = virtwho_ssh_connect(self.mode)
-        if not os.path.exists(TEMP_DIR):
-            os.mkdir(TEMP_DIR)
+        os.makedirs(TEMP_DIR, exist_ok=True)
         self.local_file = os.path.join(TEMP_DIR, "virt-who.conf")
         self.remote_file = "/etc/virt-who.conf"
         self.save_file = os.path.join(TEMP_DIR, VIRTWHO_CONF_BACKUP)
@@ -133,6 +138,10 @@ class VirtwhoGlobalConfig:
         self.cfg = Configure(self.local_file, self.remote_ssh, self.remote_file)
         logger.info(f"*** Init {self.remote_file}")
 
+    def batch(self):
+        """See Configure.batch()."""
+        return self.cfg.batch()
+
     def update(self, section, option, value):
         """Add section, add option or update option
         :param section: Section will be added if not exist.
@@ -176,8 +185,7 @@ class VirtwhoSysConfig:
 
         self.mode = mode
         self.remote_ssh = virtwho_ssh_connect(self.mode)
-        if not os.path.exists(TEMP_DIR):
-            os.mkdir(TEMP_DIR)
+        os.makedirs(TEMP_DIR, exist_ok=True)
         self.local_file = os.path.join(TEMP_DIR, "virt-who")
         self.remote_file = SYSCONFIG_FILE
         self.save_file = os.path.join(TEMP_DIR, "virt-who.save")
@@ -223,8 +231,7 @@ class RHSMConf:
         """
         self.mode = mode
         self.remote_ssh = virtwho_ssh_connect(mode)
-        if not os.path.exists(TEMP_DIR):
-            os.mkdir(TEMP_DIR)
+        os.makedirs(TEMP_DIR, exist_ok=True)
         self.local_file = os.path.join(TEMP_DIR, "rhsm.conf")
         self.remote_file = "/etc/rhsm/rhsm.conf"
         self.save_file = os.path.join(TEMP_DIR, RHSM_CONF_BACKUP)
@@ -234,6 +241,10 @@ class RHSMConf:
         self.cfg = Configure(self.local_file, self.remote_ssh, self.remote_file)
         logger.info(f"*** Init {self.remote_file}")
 
+    def batch(self):
+        """See Configure.batch()."""
+        return self.cfg.batch()
+
     def update(self, section, option, value):
         """Add section, add option or update option
         :param section: Section will be added if not exist.
@@ -262,19 +273,53 @@ class RHSMConf:
         logger.info("*** Recover /etc/rhsm/rhsm.conf")
 
 
-def virtwho_ssh_connect(mode=None):
-    """Define the ssh connection of virt-who host, get data from
-    virtwho.ini file.
+def virtwho_host_info(mode=None):
+    """Get the access of virt-who host, which is the host leased from
+    the host pool by the current worker, or the [virtwho] host defined
+    in virtwho.ini file.
     :param mode: The test hypervisor mode.
+    :return: AttrDict with server, username, password and port
     """
     virtwho = config.virtwho
     if mode == "local":
         virtwho = config.local
-    host = virtwho.server
-    username = virtwho.username
-    password = virtwho.password
-    port = virtwho.port or 22
-    return SSHConnect(host=host, user=username, pwd=password, port=port)
+    info = AttrDict(
+        server=virtwho.server,
+        username=virtwho.username,
+        password=virtwho.password,
+        port=virtwho.port or 22,
+    )
+    lease = hostpool.current()
+    if lease is not None and mode != "local":
+        info.server = lease.server
+        info.port = lease.port
+        info.username = lease.username
+        info.password = lease.password
+    return info
+
+
+def virtwho_ssh_connect(mode=None):
+    """Define the ssh connection of virt-who host, get data from
+    virtwho.ini file or the host pool.
+    :param mode: The test hypervisor mode.
+    """
+    info = virtwho_host_info(mode)
+    return SSHConnect(
+        host=info.server, user=info.username, pwd=info.password, port=info.port
+    )
+
+
+# The default register section of the local candlepin stand-in, which
+# can be overridden by [standin] of virtwho.ini.
+STANDIN_REGISTER = {
+    "server": "localhost",
+    "username": "admin",
+    "password": "admin",
+    "prefix": "/candlepin",
+    "port": "8443",
+    "default_org": "standin_org",
+    "baseurl": "https://localhost",
+}
 
 
 def get_register_handler(register_type):
@@ -289,6 +334,10 @@ def get_register_handler(register_type):
         register = config.rhsm_sw
     if register_type == "rhsm_product":
         register = config.rhsm_product
+    if register_type == "standin":
+        register = AttrDict(STANDIN_REGISTER, **getattr(config, "standin", dict()))
+        for option, value in STANDIN_REGISTER.items():
+            register[option] = register[option] or value
     return register
 
 
@@ -0,0 +1,278 @@
+"""Generate the json files of the virt-who fake mode.
+
+The fake mode reads the hypervisors and the guests from the json file
+printed by 'virt-who -p', so any inventory can be reported without the
+real hypervisors. FakeInventory generates such files deterministically:
+all the ids are derived from the seed and the indexes, so the same
+arguments always give the same file, and any id can be computed again
+for asserting without keeping the inventory in memory.
+
+The files are written hypervisor by hypervisor and guest by guest, to a
+local file or gzip-compressed straight to the virt-who host over ssh, so
+the inventories of 100k guests never need to fit in memory:
+
+    inventory = FakeInventory(hypervisors=100, guests=1000, orgs=["A", "B"])
+    files = inventory.upload(ssh)
+    for org, remote_file in files.items():
+        fake_config_create(org, remote_file)
+
+The hypervisors are assigned to the orgs round-robin, and each org has
+its own file and fake config as a fake config reports to one owner only.
+"""
+
+import json
+import os
+import uuid
+import zlib
+
+from virtwho import logger, FailException, PRINT_JSON_FILE, REGISTER
+from virtwho.configure import hypervisor_create
+
+# hypervisor.type fact reported by each mode
+HYPERVISOR_TYPES = {
+    "esx": "VMware ESXi",
+    "hyperv": "hyperv",
+    "rhevm": "qemu",
+    "libvirt": "QEMU",
+    "kubevirt": "qemu",
+    "ahv": "AHV",
+}
+
+# The guest states of virt-who, the running and paused guests are active.
+STATE_RUNNING = 1
+STATE_PAUSED = 3
+STATE_SHUTOFF = 5
+ACTIVE_STATES = (STATE_RUNNING, STATE_PAUSED)
+
+# The number of bytes compressed and sent to the channel in one time.
+CHUNK_SIZE = 1024 * 1024
+
+
+class FakeInventory:
+    def __init__(
+        self,
+        hypervisors=1,
+        guests=1,
+        orgs=None,
+        mode="esx",
+        seed=0,
+        clusters=1,
+        sockets=2,
+        version="8.0.0",
+        states=None,
+        name="fake-hypervisor",
+    ):
+        """
+        :param hypervisors: the number of hypervisors
+        :param guests: the number of guests of each hypervisor
+        :param orgs: list of the orgs, the hypervisors are assigned to
+            them round-robin. None is for the default org of the config.
+        :param mode: the hypervisor mode, for virtWhoType and the
+            hypervisor.type fact.
+        :param seed: the seed of all the ids
+        :param clusters: the number of clusters, 0 for no cluster fact
+        :param sockets: the cpu.cpu_socket(s) fact
+        :param version: the hypervisor.version fact
+        :param states: the mix of the guest states as {state: weight},
+            such as {1: 8, 5: 2} for 80% running and 20% shutoff guests,
+            default to all running.
+        :param name: the prefix of the hypervisor hostnames
+        """
+        if mode not in HYPERVISOR_TYPES:
+            raise FailException(f"Unsupported hypervisor mode {mode} of fake json")
+        self.hypervisors = hypervisors
+        self.guests = guests
+        self.orgs = list(orgs) if orgs else [None]
+        self.mode = mode
+        self.seed = seed
+        self.clusters = clusters
+        self.sockets = sockets
+        self.version = version
+        self.name = name
+        self.states = list()
+        for state, weight in sorted((states or {STATE_RUNNING: 1}).items()):
+            self.states.extend([state] * weight)
+        self.namespace = uuid.uuid5(uuid.NAMESPACE_OID, f"virtwho-fake-{seed}")
+
+    def uuid(self, *keys):
+        """
+        Get the deterministic uuid of the keys.
+        :param keys: such as ('hypervisor', 1)
+        """
+        return str(uuid.uuid5(self.namespace, "-".join(str(key) for key in keys)))
+
+    def org_hypervisors(self, org):
+        """
+        Get the indexes of the hypervisors assigned to an org.
+        :param org: the org
+        :return: range of the hypervisor indexes
+        """
+        return range(self.orgs.index(org), self.hypervisors, len(self.orgs))
+
+    def hypervisor_id(self, index):
+        """The uuid of the hypervisor."""
+        return self.uuid("hypervisor", index)
+
+    def hypervisor_name(self, index):
+        """The hostname of the hypervisor."""
+        return f"{self.name}-{index}"
+
+    def guest_id(self, index, guest):
+        """
+        The uuid of a guest.
+        :param index: the index of the hypervisor
+        :param guest: the index of the guest in the hypervisor
+        """
+        return self.uuid("guest", index, guest)
+
+    def guest(self, index, guest):
+        """
+        Get a guest of a hypervisor.
+        :param index: the index of the hypervisor
+        :param guest: the index of the guest in the hypervisor
+        :return: dict of the guest in print.json
+        """
+        number = index * self.guests + guest
+        state = self.states[number % len(self.states)]
+        return {
+            "guestId": self.guest_id(index, guest),
+            "state": state,
+            "attributes": {
+                "active": 1 if state in ACTIVE_STATES else 0,
+                "virtWhoType": self.mode,
+            },
+        }
+
+    def facts(self, index):
+        """
+        Get the facts of a hypervisor.
+        :param index: the index of the hypervisor
+        :return: dict of the facts in print.json
+        """
+        facts = {
+            "cpu.cpu_socket(s)": str(self.sockets),
+            "hypervisor.type": HYPERVISOR_TYPES[self.mode],
+            "hypervisor.version": self.version,
+            "dmi.system.uuid": self.uuid("dmi", index),
+        }
+        if self.clusters:
+            facts["hypervisor.cluster"] = f"fake-cluster-{index % self.clusters}"
+        return facts
+
+    def chunks(self, org=None):
+        """
+        Generate the print.json of an org piece by piece, only one guest
+        is in memory at a time.
+        :param org: the org
+        :return: generator of str
+        """
+        yield '{"hypervisors": ['
+        for number, index in enumerate(self.org_hypervisors(org)):
+            head = json.dumps(
+                {"uuid": self.hypervisor_id(index), "name": self.hypervisor_name(index)}
+            )
+            yield f'{", " if number else ""}{head[:-1]}, "guests": ['
+            for guest in range(self.guests):
+                yield f'{", " if guest else ""}{json.dumps(self.guest(index, guest))}'
+            yield f'], "facts": {json.dumps(self.facts(index))}}}'
+        yield "]}\n"
+
+    def write(self, fp, org=None):
+        """
+        Write the print.json of an org to a file-like object.
+        :param fp: the file-like object opened for writing text
+        :param org: the org
+        """
+        for chunk in self.chunks(org):
+            fp.write(chunk)
+
+    def file_name(self, org):
+        """
+        Get the file name of an org, print.json for the single org.
+        :param org: the org
+        """
+        if len(self.orgs) == 1:
+            return os.path.basename(PRINT_JSON_FILE)
+        return f"print-{org}.json"
+
+    def save(self, local_dir):
+        """
+        Write the print.json of each org to a local directory.
+        :param local_dir: the local directory
+        :return: dict of {org: local_file}
+        """
+        os.makedirs(local_dir, exist_ok=True)
+        files = dict()
+        for org in self.orgs:
+            local_file = os.path.join(local_dir, self.file_name(org))
+            with open(local_file, "w") as f:
+                self.write(f, org)
+            files[org] = local_file
+        return files
+
+    def upload(self, ssh, remote_dir=None):
+        """
+        Stream the print.json of each org to the virt-who host, the json
+        is gzip-compressed on the fly and decompressed by the remote
+        gzip, the remote file is replaced only when it's complete.
+        :param ssh: ssh access of the virt-who host
+        :param remote_dir: the remote directory, default to the directory
+            of PRINT_JSON_FILE.
+        :return: dict of {org: remote_file}
+        """
+        remote_dir = remote_dir or os.path.dirname(PRINT_JSON_FILE)
+        files = dict()
+        for org in self.orgs:
+            remote_file = os.path.join(remote_dir, self.file_name(org))
+            channel = ssh.open_channel(
+                f"gzip -dc > {remote_file}.part && mv -f {remote_file}.part "
+                f"{remote_file}"
+            )
+            try:
+                compressor = zlib.compressobj(wbits=31)
+                buffer = list()
+                size = 0
+                for chunk in self.chunks(org):
+                    buffer.append(chunk)
+                    size += len(chunk)
+                    if size >= CHUNK_SIZE:
+                        channel.sendall(compressor.compress("".join(buffer).encode()))
+                        buffer, size = list(), 0
+                channel.sendall(compressor.compress("".join(buffer).encode()))
+                channel.sendall(compressor.flush())
+                channel.shutdown_write()
+                ret = channel.recv_exit_status()
+            finally:
+                channel.close()
+            if ret != 0:
+                raise FailException(f"Failed to upload the fake json {remote_file}")
+            logger.info(
+                f"Uploaded the fake json {remote_file} with "
+                f"{len(self.org_hypervisors(org))} hypervisors and "
+                f"{len(self.org_hypervisors(org)) * self.guests} guests"
+            )
+            files[org] = remote_file
+        return files
+
+
+def fake_config_create(org=None, remote_file=PRINT_JSON_FILE, register_type=REGISTER):
+    """
+    Create the fake config reading a fake json file as hypervisors.
+    :param org: the owner, None for the default org
+    :param remote_file: the fake json file on the virt-who host
+    :param register_type: the subscription server. (rhsm, satellite)
+    :return: VirtwhoHypervisorConfig
+    """
+    name = f"fake-{org}" if org else "fake"
+    config = hypervisor_create(
+        mode="fake",
+        register_type=register_type,
+        config_name=f"/etc/virt-who.d/{name}.conf",
+        section=f"virtwho-{name}",
+    )
+    with config.batch():
+        config.update("file", remote_file)
+        config.update("is_hypervisor", "True")
+        if org:
+            config.update("owner", org)
+    return config
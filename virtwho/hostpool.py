@@ -0,0 +1,149 @@
+"""Pool of the virt-who hosts to run the tests in parallel.
+
+The hosts are configured in virtwho.ini as below, the username and
+password of [virtwho] are used for all the hosts:
+
+    [virtwho]
+    servers=10.0.0.1,10.0.0.2:2222,10.0.0.3
+
+Each pytest-xdist worker leases one host for its whole session by an
+exclusive lock file, so all the fixtures and the ssh connections of the
+worker are bound to the same host, and no other worker can use it. Run
+with '--dist loadscope' to keep the test classes (and modules) on one
+worker and therefore on one host:
+
+    # pytest -n 3 --dist loadscope tests/hypervisor
+
+The lock is released when the worker process exits, even when it's
+killed, so a crashed worker never keeps a host.
+"""
+
+import fcntl
+import os
+import tempfile
+import time
+
+from virtwho import logger, FailException
+from virtwho.logger import WORKER_ID
+from virtwho.settings import config
+
+LOCK_DIR = os.path.join(tempfile.gettempdir(), "virtwho-host-leases")
+
+# The host leased by the current process, see lease().
+_lease = None
+
+
+class HostLease:
+    """One virt-who host leased by the current worker."""
+
+    def __init__(self, server, port, username, password, lock_file=None):
+        """
+        :param server: hostname or ip of the virt-who host
+        :param port: ssh port
+        :param username: ssh username
+        :param password: ssh password
+        :param lock_file: the opened and locked lease file
+        """
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.lock_file = lock_file
+
+    def release(self):
+        """Unlock the lease file, the host can be leased again."""
+        if self.lock_file is not None:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+                self.lock_file.close()
+            except Exception:
+                pass
+            self.lock_file = None
+
+    def __repr__(self):
+        return f"{self.server}:{self.port}"
+
+
+def pool_hosts():
+    """
+    Get all the virt-who hosts of the pool from virtwho.ini, which is
+    [virtwho]:servers, or [virtwho]:server when the pool is not defined.
+    :return: list of (server, port)
+    """
+    virtwho = config.virtwho
+    default_port = virtwho.port or 22
+    servers = virtwho.get("servers") or virtwho.server or ""
+    hosts = list()
+    for item in servers.strip("[]").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        server, _, port = item.partition(":")
+        hosts.append((server, int(port or default_port)))
+    return hosts
+
+
+def worker_id():
+    """The pytest-xdist worker id, such as gw0, 'master' without xdist."""
+    return WORKER_ID or "master"
+
+
+def lease(timeout=3600, interval=5):
+    """
+    Lease a free virt-who host of the pool for the current process, the
+    same lease is returned when it's leased already. Wait for a host to
+    be released by other workers when all the hosts are leased.
+    :param timeout: seconds to wait for a free host
+    :param interval: seconds between two tries
+    :return: HostLease
+    """
+    global _lease
+    if _lease is not None:
+        return _lease
+    hosts = pool_hosts()
+    if not hosts:
+        raise FailException("No virt-who host is defined in virtwho.ini")
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        for server, port in hosts:
+            lock_file = open(os.path.join(LOCK_DIR, f"{server}_{port}.lock"), "a+")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(f"{worker_id()} {os.getpid()}\n")
+            lock_file.flush()
+            _lease = HostLease(
+                server,
+                port,
+                config.virtwho.username,
+                config.virtwho.password,
+                lock_file,
+            )
+            logger.info(f"Worker {worker_id()} leased virt-who host {_lease}")
+            return _lease
+        if time.monotonic() >= deadline:
+            raise FailException("No free virt-who host in the pool")
+        logger.info(f"All the virt-who hosts are leased, retry after {interval}s")
+        time.sleep(interval)
+
+
+def release():
+    """Release the host leased by the current process."""
+    global _lease
+    if _lease is not None:
+        logger.info(f"Worker {worker_id()} released virt-who host {_lease}")
+        _lease.release()
+        _lease = None
+
+
+def current():
+    """
+    Get the host leased by the current process.
+    :return: HostLease or None when no host is leased.
+    """
+    return _lease
@@ -1,7 +1,19 @@
+import glob
+import heapq
 import os
+import re
 import time
 import logging
 
+# The pytest-xdist worker id (gw0, gw1, ...), empty without xdist.
+WORKER_ID = os.environ.get("PYTEST_XDIST_WORKER", "")
+
+LOG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "logs"
+)
+
+RECORD_RE = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]")
+
 
 class Logger:
     """
@@ -18,19 +30,15 @@ class Logger:
         """
         The log message will output to file and console.
         Define the log path, log file, log level, log formatter.
-        The default log directory is logs.
+        The default log directory is logs, each pytest-xdist worker logs
+        to its own file which is merged by merge_worker_logs().
         """
         self.logger = logging.getLogger(logger)
         self.logger.setLevel(logging.DEBUG)
         self.logger.handlers = []
-        self.log_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "logs"
-        )
-        if not os.path.exists(self.log_path):
-            os.mkdir(self.log_path)
-        self.log_name = os.path.join(
-            self.log_path, "%s.log" % time.strftime("%Y_%m_%d")
-        )
+        self.log_path = LOG_PATH
+        os.makedirs(self.log_path, exist_ok=True)
+        self.log_name = log_file(WORKER_ID)
         self.formatter = logging.Formatter(
             "[%(asctime)s] - [%(filename)s] - %(levelname)s: %(message)s",
             "%Y-%m-%d %H:%M:%S",
@@ -59,3 +67,60 @@ def getLogger(name=None):
     and connect the main logger instance.
     """
     return Logger(name).getlog()
+
+
+def log_file(worker=""):
+    """
+    Get the daily log file, or the daily log file of a pytest-xdist worker.
+    :param worker: the worker id, such as gw0
+    """
+    suffix = f".{worker}" if worker else ""
+    return os.path.join(LOG_PATH, "%s%s.log" % (time.strftime("%Y_%m_%d"), suffix))
+
+
+def _records(file, worker):
+    """
+    Read the log records of a worker log file, the lines without a
+    timestamp (such as tracebacks) belong to the previous record.
+    :param file: the worker log file
+    :param worker: the worker id to tag the records
+    :return: generator of (timestamp, record)
+    """
+    with open(file, encoding="utf-8", errors="replace") as f:
+        stamp, lines = "", list()
+        for line in f:
+            match = RECORD_RE.match(line)
+            if match and lines:
+                yield stamp, "".join(lines)
+                lines = list()
+            if match:
+                stamp = match.group(1)
+                line = f"{line[:match.end()]} - [{worker}]{line[match.end():]}"
+            lines.append(line)
+        if lines:
+            yield stamp, "".join(lines)
+
+
+def merge_worker_logs():
+    """
+    Merge the log files of the pytest-xdist workers into the daily log
+    files ordered by time, the records are tagged with the worker id,
+    and the worker log files are removed after merging.
+    :return: the merged worker log files
+    """
+    pattern = re.compile(r"(\d{4}_\d{2}_\d{2})\.(gw\d+)\.log$")
+    days = dict()
+    for file in sorted(glob.glob(os.path.join(LOG_PATH, "*.gw*.log"))):
+        match = pattern.search(file)
+        if match:
+            days.setdefault(match.group(1), list()).append((file, match.group(2)))
+    merged = list()
+    for day, files in sorted(days.items()):
+        sources = [_records(file, worker) for file, worker in files]
+        with open(os.path.join(LOG_PATH, f"{day}.log"), "a", encoding="utf-8") as f:
+            for _, record in heapq.merge(*sources, key=lambda item: item[0]):
+                f.write(record)
+        for file, _ in files:
+            os.remove(file)
+            merged.append(file)
+    return merged
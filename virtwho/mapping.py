@@ -0,0 +1,493 @@
+"""Indexed model of the host-to-guest mappings reported by virt-who.
+
+The mappings are indexed when they are built, so the lookups such as
+guest -> hypervisor, hypervisor -> guests and org -> hypervisors don't
+need to walk or stringify the whole mapping. The ids are matched
+exactly as the analyzer did before. With fuzzy=True the uuid lookups are
+case insensitive and also accept the byte-swapped form of a uuid, which
+is how some hypervisors (such as esx and hyperv) report the smbios uuid.
+
+The items can still be read like the dicts the analyzer returned before:
+    mappings[org][guest_uuid]["guest_hypervisor"]
+    mappings[org][hypervisor_id]["guests"]
+    mappings["orgs"]
+
+This module only depends on the python standard library.
+"""
+
+import re
+
+UUID_RE = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I
+)
+
+
+def swap_uuid(value):
+    """
+    Get the byte-swapped form of a uuid, the first three fields are
+    little endian in the smbios uuid.
+    :param value: uuid string
+    :return: the byte-swapped uuid, or None when it's not a uuid.
+    """
+    if not value or not UUID_RE.match(value):
+        return None
+    fields = value.split("-")
+    for index in range(3):
+        field = fields[index]
+        fields[index] = "".join(field[i : i + 2] for i in range(len(field) - 2, -1, -2))
+    return "-".join(fields)
+
+
+def lookup_keys(value, fuzzy=False):
+    """
+    Get all the index keys of an id, which is the id itself, or the lower
+    case id and the lower case byte-swapped id for a uuid when fuzzy.
+    :param value: hypervisor id, hostname or uuid
+    :param fuzzy: match the ids case insensitively and byte-swapped
+    """
+    if not value:
+        return []
+    if not fuzzy:
+        return [str(value)]
+    key = str(value).lower()
+    swapped = swap_uuid(key)
+    if swapped and swapped != key:
+        return [key, swapped]
+    return [key]
+
+
+class _Record:
+    """Base class of the mapping records, which can be read as a dict by
+    the keys defined in _fields as {key: attribute}.
+    """
+
+    __slots__ = ()
+    _fields = {}
+
+    def keys(self):
+        return self._fields.keys()
+
+    def items(self):
+        return [(key, self[key]) for key in self._fields]
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            return self[key]
+        return default
+
+    def __getitem__(self, key):
+        return getattr(self, self._fields[key])
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return self is other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class Guest(_Record):
+    """One guest of the mapping."""
+
+    __slots__ = ("uuid", "hypervisor", "state", "active", "type", "org")
+    _fields = {
+        "guest_hypervisor": "hypervisor_id",
+        "state": "state",
+        "active": "active",
+        "type": "type",
+    }
+
+    def __init__(self, uuid, state, active, type, hypervisor=None, org=None):
+        """
+        :param uuid: guest uuid
+        :param state: guest state
+        :param active: the active attribute
+        :param type: the virtWhoType attribute
+        :param hypervisor: the Hypervisor running the guest, None for
+            the local mode.
+        :param org: the organization the guest is reported to
+        """
+        self.uuid = uuid
+        self.state = state
+        self.active = active
+        self.type = type
+        self.hypervisor = hypervisor
+        self.org = org
+
+    @property
+    def hypervisor_id(self):
+        """The id of the hypervisor, '' for the local mode."""
+        return self.hypervisor.id if self.hypervisor else ""
+
+
+class Hypervisor(_Record):
+    """One hypervisor of the mapping with its facts and guests."""
+
+    __slots__ = (
+        "id",
+        "name",
+        "type",
+        "version",
+        "socket",
+        "dmi",
+        "cluster",
+        "guests",
+        "org",
+    )
+    _fields = {
+        "name": "name",
+        "type": "type",
+        "version": "version",
+        "socket": "socket",
+        "dmi": "dmi",
+        "cluster": "cluster",
+        "guests": "guest_ids",
+    }
+
+    def __init__(self, id, name, type, version, socket, dmi, cluster, org=None):
+        """
+        :param id: the hypervisor id, which is the hostname, uuid or
+            hwuuid according to the hypervisor_id option.
+        :param name: the hypervisor hostname
+        :param type: hypervisor.type fact
+        :param version: hypervisor.version fact
+        :param socket: cpu.cpu_socket(s) fact
+        :param dmi: dmi.system.uuid fact
+        :param cluster: hypervisor.cluster fact
+        :param org: the organization the hypervisor is reported to
+        """
+        self.id = id
+        self.name = name
+        self.type = type
+        self.version = version
+        self.socket = socket
+        self.dmi = dmi
+        self.cluster = cluster
+        self.guests = []
+        self.org = org
+
+    @property
+    def guest_ids(self):
+        """The uuids of all the guests."""
+        return [guest.uuid for guest in self.guests]
+
+    @classmethod
+    def from_json(cls, item, org=None):
+        """
+        Create the Hypervisor with its guests from one item of the
+        'hypervisors' list sent to the register server.
+        :param item: dict of one hypervisor
+        :param org: the organization
+        """
+        facts = item["facts"]
+        hypervisor = cls(
+            id=item["hypervisorId"]["hypervisorId"],
+            name=item.get("name", ""),
+            type=facts["hypervisor.type"],
+            version=str(facts["hypervisor.version"]),
+            socket=facts["cpu.cpu_socket(s)"],
+            dmi=facts["dmi.system.uuid"],
+            cluster=facts.get("hypervisor.cluster", ""),
+            org=org,
+        )
+        for guest in item["guestIds"]:
+            hypervisor.guests.append(
+                Guest(
+                    uuid=guest["guestId"],
+                    state=guest["state"],
+                    active=guest["attributes"]["active"],
+                    type=guest["attributes"]["virtWhoType"],
+                    hypervisor=hypervisor,
+                    org=org,
+                )
+            )
+        return hypervisor
+
+
+class OrgMapping:
+    """The mapping reported to one organization."""
+
+    __slots__ = ("name", "fuzzy", "hypervisors", "_hypervisors", "_guests")
+
+    def __init__(self, name, fuzzy=False):
+        """
+        :param name: the organization
+        :param fuzzy: match the ids case insensitively and byte-swapped
+        """
+        self.name = name
+        self.fuzzy = fuzzy
+        self.hypervisors = []
+        self._hypervisors = {}
+        self._guests = {}
+
+    def add(self, hypervisor):
+        """
+        Add a hypervisor and index it by the id, hostname and dmi uuid,
+        and index all its guests by uuid.
+        :param hypervisor: Hypervisor
+        """
+        self.hypervisors.append(hypervisor)
+        for value in (hypervisor.id, hypervisor.name, hypervisor.dmi):
+            for key in lookup_keys(value, self.fuzzy):
+                self._hypervisors.setdefault(key, hypervisor)
+        for guest in hypervisor.guests:
+            self.add_guest(guest)
+
+    def add_guest(self, guest):
+        """
+        Index a guest by uuid.
+        :param guest: Guest
+        """
+        for key in lookup_keys(guest.uuid, self.fuzzy):
+            self._guests[key] = guest
+
+    def hypervisor(self, value):
+        """
+        Get the hypervisor by id, hostname or dmi uuid.
+        :param value: the hypervisor id, hostname or uuid
+        :return: Hypervisor or None
+        """
+        for key in lookup_keys(value, self.fuzzy):
+            if key in self._hypervisors:
+                return self._hypervisors[key]
+        return None
+
+    def guest(self, uuid):
+        """
+        Get the guest by uuid.
+        :param uuid: the guest uuid
+        :return: Guest or None
+        """
+        for key in lookup_keys(uuid, self.fuzzy):
+            if key in self._guests:
+                return self._guests[key]
+        return None
+
+    @property
+    def hypervisor_num(self):
+        return len(self.hypervisors)
+
+    def keys(self):
+        keys = ["hypervisor_num"]
+        keys.extend(hypervisor.id for hypervisor in self.hypervisors)
+        keys.extend(guest.uuid for guest in self._guests.values())
+        return list(dict.fromkeys(keys))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        if key == "hypervisor_num":
+            return self.hypervisor_num
+        item = self.guest(key) or self.hypervisor(key)
+        if item is None:
+            raise KeyError(key)
+        return item
+
+    def __contains__(self, value):
+        return bool(self.guest(value) or self.hypervisor(value))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return repr({key: self[key] for key in self.keys()})
+
+
+class Mappings:
+    """All the host-to-guest mappings found in one virt-who run.
+
+    Usage:
+        mappings = Mappings()
+        mappings.add(org, payload)
+        mappings.hypervisor_of(guest_uuid)
+        hostname in mappings
+    """
+
+    __slots__ = ("orgs", "fuzzy", "_orgs", "_local")
+
+    def __init__(self, fuzzy=False):
+        """
+        :param fuzzy: match the ids case insensitively and byte-swapped
+        """
+        self.orgs = []
+        self.fuzzy = fuzzy
+        self._orgs = {}
+        self._local = OrgMapping(None, fuzzy)
+
+    def add(self, org, payload):
+        """
+        Add the mapping sent to an organization, which replaces the
+        mapping sent to it before.
+        :param org: the organization
+        :param payload: the decoded json sent to the register server,
+            as {"hypervisors": [...]}
+        """
+        mapping = OrgMapping(org, self.fuzzy)
+        for item in payload["hypervisors"]:
+            mapping.add(Hypervisor.from_json(item, org))
+        self._orgs[org] = mapping
+
+    def add_local(self, domains):
+        """
+        Add the guests of the local mode, which have no hypervisor.
+        :param domains: the decoded json of 'Domain info:'
+        """
+        for item in domains:
+            self._local.add_guest(
+                Guest(
+                    uuid=item["guestId"],
+                    state=item["state"],
+                    active=item["attributes"]["active"],
+                    type=item["attributes"]["virtWhoType"],
+                )
+            )
+
+    def org(self, name):
+        """
+        Get the mapping of an organization.
+        :param name: the organization
+        :return: OrgMapping or None
+        """
+        return self._orgs.get(name)
+
+    def _scope(self, org=None):
+        """Get the OrgMappings to search in."""
+        if org is not None:
+            mapping = self._orgs.get(org)
+            return [mapping] if mapping else []
+        return list(self._orgs.values()) + [self._local]
+
+    def guest(self, uuid, org=None):
+        """
+        Get the guest by uuid.
+        :param uuid: the guest uuid
+        :param org: search in the organization only
+        :return: Guest or None
+        """
+        for mapping in self._scope(org):
+            guest = mapping.guest(uuid)
+            if guest:
+                return guest
+        return None
+
+    def hypervisor(self, value, org=None):
+        """
+        Get the hypervisor by id, hostname or dmi uuid.
+        :param value: the hypervisor id, hostname or uuid
+        :param org: search in the organization only
+        :return: Hypervisor or None
+        """
+        for mapping in self._scope(org):
+            hypervisor = mapping.hypervisor(value)
+            if hypervisor:
+                return hypervisor
+        return None
+
+    def hypervisor_of(self, uuid, org=None):
+        """
+        Get the id of the hypervisor running the guest.
+        :param uuid: the guest uuid
+        :param org: search in the organization only
+        :return: hypervisor id or ''
+        """
+        guest = self.guest(uuid, org)
+        return guest.hypervisor_id if guest else ""
+
+    def guests_of(self, value, org=None):
+        """
+        Get the guests of a hypervisor.
+        :param value: the hypervisor id, hostname or uuid
+        :param org: search in the organization only
+        :return: list of guest uuids
+        """
+        hypervisor = self.hypervisor(value, org)
+        return hypervisor.guest_ids if hypervisor else []
+
+    def hypervisors(self, org):
+        """
+        Get the hypervisors reported to an organization.
+        :param org: the organization
+        :return: list of Hypervisor
+        """
+        mapping = self._orgs.get(org)
+        return list(mapping.hypervisors) if mapping else []
+
+    def associated(self, hypervisor, guest, org=None):
+        """
+        Check if the guest is reported under the hypervisor id.
+        :param hypervisor: the hypervisor id, such as hostname, uuid or
+            hwuuid according to the hypervisor_id option.
+        :param guest: the guest uuid
+        :param org: search in the organization only
+        """
+        hypervisor_id = self.hypervisor_of(guest, org)
+        if not self.fuzzy:
+            return bool(hypervisor_id) and hypervisor_id == hypervisor
+        return bool(hypervisor_id) and hypervisor_id.lower() in lookup_keys(
+            hypervisor, fuzzy=True
+        )
+
+    def contains_all(self, values):
+        """
+        Check if all the hypervisors/guests are found in the mappings.
+        :param values: list of hypervisor id, hostname or guest uuid
+        """
+        return all(value in self for value in values)
+
+    def keys(self):
+        keys = list(self._orgs)
+        keys.extend(self._local.keys()[1:])
+        if self.orgs:
+            keys.append("orgs")
+        return keys
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        if key == "orgs" and self.orgs:
+            return self.orgs
+        if key in self._orgs:
+            return self._orgs[key]
+        guest = self._local.guest(key)
+        if guest is None:
+            raise KeyError(key)
+        return guest
+
+    def __contains__(self, value):
+        """Check if a hypervisor (by id, hostname or dmi uuid) or a guest
+        (by uuid) is found in any organization."""
+        if value in self._orgs or (value == "orgs" and self.orgs):
+            return True
+        return bool(self.guest(value) or self.hypervisor(value))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __bool__(self):
+        return bool(self._orgs or self._local.keys()[1:])
+
+    def __repr__(self):
+        return repr({key: self[key] for key in self.keys()})
@@ -0,0 +1,274 @@
+"""Measure virt-who at scale with the fake mode inventories.
+
+virt-who is run once by a stdlib python wrapper on the virt-who host,
+which records the wall time and the resource usage of the virt-who
+process (RUSAGE_CHILDREN), and the rhsm.log of the run gives the time to
+the first send, the mapping payload size and the number of the report
+batches. The results of a virt-who build are saved as one json file per
+NVR, which is the baseline of the following builds:
+
+    metrics = measure(virtwho, "/etc/virt-who.d/fake.conf")
+    save_result(nvr, {"points": [metrics]})
+"""
+
+import json
+import math
+import os
+from datetime import datetime
+
+from virtwho import logger, FailException
+from virtwho.base import wait_until
+from virtwho.logger import LOG_PATH
+from virtwho.rhsmlog import RhsmLog
+from virtwho.settings import config
+
+RESULT_DIR = os.path.join(LOG_PATH, "performance")
+
+RUSAGE_FILE = "/tmp/virtwho_rusage.json"
+
+# Run the command in argv[2:] and write its wall time and resource usage
+# to argv[1], the start time is in the same format as rhsm.log.
+RUSAGE_SCRIPT = (
+    "import json,resource,subprocess,sys,time;"
+    "s=time.time();r=subprocess.call(sys.argv[2:]);e=time.time();"
+    "u=resource.getrusage(resource.RUSAGE_CHILDREN);"
+    "t=time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(s))+',%03d'%(s%1*1000);"
+    "open(sys.argv[1],'w').write(json.dumps(dict(ret=r,start=t,wall=e-s,"
+    "utime=u.ru_utime,stime=u.ru_stime,maxrss=u.ru_maxrss)))"
+)
+
+# The default thresholds, which can be overridden in [performance] of
+# virtwho.ini.
+THRESHOLDS = {
+    # the max slope of log(oneshot time) to log(guests) of the large sizes
+    "time_exponent": 1.3,
+    # the max slope of log(peak rss) to log(guests) of the large sizes
+    "rss_exponent": 1.0,
+    # the sizes (guests) to fit the slopes
+    "curve_from": 1000,
+    # the max ratio of a metric to the one of the baseline build
+    "regression": 1.5,
+}
+
+# The metrics compared with the baseline build.
+REGRESSION_METRICS = ("oneshot_time", "first_send_time", "cpu_time", "peak_rss_mb")
+
+
+def thresholds():
+    """
+    Get the thresholds updated by [performance] of virtwho.ini.
+    :return: dict of the thresholds
+    """
+    data = dict(THRESHOLDS)
+    section = getattr(config, "performance", dict())
+    for key, value in data.items():
+        if section.get(key):
+            data[key] = type(value)(section.get(key))
+    return data
+
+
+def rusage_command(cmd):
+    """
+    Wrap the command to record its wall time and resource usage.
+    :param cmd: the command to run virt-who
+    """
+    return (
+        f"rm -f {RUSAGE_FILE}; "
+        f"$(command -v python3 || echo /usr/libexec/platform-python) "
+        f'-c "{RUSAGE_SCRIPT}" {RUSAGE_FILE} {cmd}'
+    )
+
+
+def rusage_get(ssh, timeout=30):
+    """
+    Get the resource usage written by the wrapper.
+    :param ssh: ssh access of the virt-who host
+    :param timeout: seconds to wait for the wrapper to exit
+    :return: dict of the usage
+    """
+
+    def usage():
+        ret, output = ssh.runcmd(f"cat {RUSAGE_FILE}", log_print=False)
+        if ret == 0 and output.strip():
+            return json.loads(output)
+        return None
+
+    data = wait_until(usage, timeout=timeout, interval=1, message=RUSAGE_FILE)
+    if not data:
+        raise FailException("Failed to get the resource usage of virt-who")
+    return data
+
+
+def day_time(timestamp):
+    """
+    Get the time of the day in seconds from a timestamp of rhsm.log.
+    :param timestamp: such as '2023-06-13 04:33:37,164'
+    """
+    stamp = datetime.strptime(timestamp[:19], "%Y-%m-%d %H:%M:%S")
+    fraction = timestamp[20:]
+    return (
+        stamp.hour * 3600
+        + stamp.minute * 60
+        + stamp.second
+        + (float(f"0.{fraction}") if fraction.isdigit() else 0)
+    )
+
+
+def log_metrics(log, start=None):
+    """
+    Get the metrics of a virt-who run from its rhsm.log.
+    :param log: RhsmLog of the run
+    :param start: the start time of virt-who in the format of rhsm.log
+    :return: dict with first_send_time (None when not sent), batches,
+        payload_bytes, max_payload_bytes, hypervisors and guests.
+    """
+    mapping_positions = {position for _, position in log.mapping_events}
+    send_events = [
+        event
+        for position, event in enumerate(log.events)
+        if position in mapping_positions
+        or "Sending updated Host-to-guest mapping" in event.message
+    ]
+    first_send_time = None
+    if send_events and start:
+        first_send_time = send_events[0].time - day_time(start)
+        if first_send_time < 0:
+            first_send_time += 24 * 3600
+    sizes = list()
+    for _, position in log.mapping_events:
+        text = log.text(log.events[position])
+        sizes.append(len(text) - text.find("{", text.find(": ") + 2))
+    hypervisors = guests = 0
+    for payload in log.mapping_payloads().values():
+        for hypervisor in (payload or dict()).get("hypervisors", list()):
+            hypervisors += 1
+            guests += len(hypervisor.get("guestIds", list()))
+    return {
+        "first_send_time": first_send_time,
+        "batches": len(log.mapping_events) or log.remote_sends,
+        "payload_bytes": sum(sizes),
+        "max_payload_bytes": max(sizes) if sizes else 0,
+        "hypervisors": hypervisors,
+        "guests": guests,
+    }
+
+
+def measure(virtwho, config_file, debug=True):
+    """
+    Run virt-who once with a config and measure it.
+    :param virtwho: VirtwhoRunner
+    :param config_file: the virt-who config file on the virt-who host
+    :param debug: use '-d' option when set True, the mapping payloads
+        are only logged in debug mode.
+    :return: dict of the metrics, including the analyzer send, error
+        and warning, oneshot_time, cpu_time, peak_rss_mb and the metrics
+        of log_metrics().
+    """
+    cmd = "virt-who "
+    if debug is True:
+        cmd += "-d "
+    cmd += f"-o -c {config_file}"
+    result = virtwho.run_until_exit(rusage_command(cmd))
+    usage = rusage_get(virtwho.ssh)
+    metrics = {
+        "send": result["send"],
+        "error": result["error"],
+        "warning": result["warning"],
+        "returncode": usage["ret"],
+        "oneshot_time": round(usage["wall"], 3),
+        "cpu_time": round(usage["utime"] + usage["stime"], 3),
+        "peak_rss_mb": round(usage["maxrss"] / 1024, 1),
+    }
+    metrics.update(log_metrics(RhsmLog(result["log"]), usage["start"]))
+    logger.info(f"virt-who metrics: {metrics}")
+    return metrics
+
+
+def scaling_exponent(points, metric, curve_from=0):
+    """
+    Fit the slope of log(metric) to log(guests) by least squares, which
+    is about 1 for a linear growth.
+    :param points: list of the metrics dict, with the key guests
+    :param metric: the metric, such as oneshot_time
+    :param curve_from: only the points of at least so many guests
+    :return: the slope, or None when less than 2 points
+    """
+    pairs = [
+        (math.log(point["guests"]), math.log(point[metric]))
+        for point in points
+        if point["guests"] >= curve_from and point["guests"] > 0 and point[metric]
+    ]
+    if len(pairs) < 2:
+        return None
+    mean_x = sum(x for x, _ in pairs) / len(pairs)
+    mean_y = sum(y for _, y in pairs) / len(pairs)
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    denominator = sum((x - mean_x) ** 2 for x, _ in pairs)
+    if not denominator:
+        return None
+    return numerator / denominator
+
+
+def result_file(nvr):
+    """The result file of a virt-who build."""
+    return os.path.join(RESULT_DIR, f"{nvr}.json")
+
+
+def save_result(nvr, data):
+    """
+    Save the results of a virt-who build, the file is replaced only when
+    it's complete.
+    :param nvr: the virt-who NVR, such as virt-who-1.31.26-1.el9
+    :param data: dict of the results
+    :return: the result file
+    """
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    path = result_file(nvr)
+    with open(f"{path}.part", "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.part", path)
+    logger.info(f"Saved the performance results to {path}")
+    return path
+
+
+def baseline_result(nvr):
+    """
+    Get the results of the latest saved build other than nvr.
+    :param nvr: the current virt-who NVR
+    :return: dict of the results or None
+    """
+    if not os.path.isdir(RESULT_DIR):
+        return None
+    files = [
+        os.path.join(RESULT_DIR, name)
+        for name in os.listdir(RESULT_DIR)
+        if name.endswith(".json") and name != f"{nvr}.json"
+    ]
+    if not files:
+        return None
+    with open(max(files, key=os.path.getmtime)) as f:
+        return json.load(f)
+
+
+def regressions(points, baseline, ratio):
+    """
+    Compare the metrics with the ones of the same size in the baseline.
+    :param points: list of the metrics dict of the current build
+    :param baseline: dict of the baseline results
+    :param ratio: the max ratio of a metric to the baseline
+    :return: list of the regression messages
+    """
+    base_points = {point["guests"]: point for point in baseline.get("points", [])}
+    messages = list()
+    for point in points:
+        base = base_points.get(point["guests"])
+        if not base:
+            continue
+        for metric in REGRESSION_METRICS:
+            value, base_value = point.get(metric), base.get(metric)
+            if value and base_value and value > base_value * ratio:
+                messages.append(
+                    f"{metric} of {point['guests']} guests: {value} > "
+                    f"{ratio} * {base_value} of {baseline.get('nvr')}"
+                )
+    return messages
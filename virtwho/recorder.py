@@ -0,0 +1,534 @@
+"""A recording forward proxy between virt-who and the subscription server.
+
+virt-who is configured with rhsm_proxy_hostname/rhsm_proxy_port pointing
+to this proxy, which forwards every request to the real server (or to
+the next proxy) and records the request and the response: method, path,
+status, body sizes, latency and the decoded json bodies. The tests read
+the mappings from the recorded check-in requests instead of scraping the
+rhsm.log, so virt-who doesn't need to run in debug mode.
+
+The https requests are tunneled by CONNECT as usual, and the tunnel is
+terminated by a certificate of the target host signed by the proxy CA,
+which is installed to /etc/rhsm/ca for virt-who to trust it. The
+upstream certificates are verified by the other CAs of /etc/rhsm/ca and
+the system CAs.
+
+This module only depends on the python standard library (python>=3.6),
+candlepin.py for the certificates and the openssl command. It's uploaded
+to the virt-who host together with candlepin.py and run in background,
+see register.RecordingProxy:
+
+    # python3 recorder.py --port 3128 --ca-dir /etc/rhsm/ca \\
+        --record /tmp/recorder.jsonl
+
+The records are managed at runtime by the control endpoints under
+/__recorder of the proxy port: GET/DELETE requests, GET status.
+"""
+
+import argparse
+import glob
+import http.client
+import json
+import os
+import re
+import shutil
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from virtwho.candlepin import Certificates
+except ImportError:
+    # run as a script next to candlepin.py on the virt-who host
+    from candlepin import Certificates
+
+CONTROL_PREFIX = "/__recorder"
+CA_FILE_NAME = "virtwho-recorder-ca.pem"
+
+# the headers of one connection, which are not forwarded
+HOP_HEADERS = (
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+)
+
+
+def decode_body(raw, headers):
+    """
+    Decode a json body, the gzip and deflate encodings are supported.
+    :param raw: the body bytes
+    :param headers: the headers of the body
+    :return: the decoded json, or None when it's not json
+    """
+    if not raw or "json" not in (headers.get("Content-Type") or ""):
+        return None
+    try:
+        if (headers.get("Content-Encoding") or "").lower() in ("gzip", "deflate"):
+            # 47 detects both the gzip and the zlib header
+            raw = zlib.decompress(raw, 47)
+        return json.loads(raw.decode("utf-8"))
+    except (ValueError, zlib.error):
+        return None
+
+
+class RecorderState:
+    """The records of the proxy, shared by the request threads under one
+    lock."""
+
+    def __init__(self, record_file=None):
+        """
+        :param record_file: append the records to the json-lines file
+        """
+        self.lock = threading.Lock()
+        self.records = list()
+        self.record_file = record_file
+        self.last_id = 0
+
+    def record(self, item):
+        """Keep the record of a request, and append it to the record file."""
+        with self.lock:
+            self.last_id += 1
+            item["id"] = self.last_id
+            self.records.append(item)
+            if self.record_file:
+                with open(self.record_file, "a") as f:
+                    f.write(json.dumps(item, separators=(",", ":")) + "\n")
+
+    def select(self, since=0, method=None, path=None, body=True):
+        """
+        Get the records.
+        :param since: only the records after the id
+        :param method: only the records of the method
+        :param path: only the records whose path matches the regex
+        :param body: False is to drop the json bodies
+        :return: list of the records
+        """
+        with self.lock:
+            records = [record for record in self.records if record["id"] > since]
+        records = [
+            record
+            for record in records
+            if (method is None or record["method"] == method)
+            and (path is None or re.search(path, record["path"]))
+        ]
+        if not body:
+            records = [
+                {
+                    key: value
+                    for key, value in record.items()
+                    if key not in ("body", "response")
+                }
+                for record in records
+            ]
+        return records
+
+
+class RecorderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "virtwho-recorder/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # (host, port) of the CONNECT tunnel, None for the plain requests
+        self.tunnel = None
+        # the keep-alive connections to the upstream
+        self.upstreams = dict()
+
+    def finish(self):
+        for connection in self.upstreams.values():
+            connection.close()
+        BaseHTTPRequestHandler.finish(self)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def do_CONNECT(self):
+        """Terminate the tunnel by the certificate of the target host and
+        handle the requests in it."""
+        host, _, port = self.path.rpartition(":")
+        if not host or not port.isdigit():
+            self.send_error(400, f"Invalid CONNECT target {self.path}")
+            return
+        try:
+            context = self.server.tunnel_context(host)
+        except (OSError, RuntimeError, ssl.SSLError) as exc:
+            self.send_error(502, f"Failed to create the certificate of {host}: {exc}")
+            return
+        self.send_response(200, "Connection Established")
+        self.end_headers()
+        self.wfile.flush()
+        try:
+            connection = context.wrap_socket(self.connection, server_side=True)
+        except (OSError, ssl.SSLError) as exc:
+            self.log_message("TLS handshake of %s failed: %s", self.path, exc)
+            self.close_connection = True
+            return
+        self.connection = connection
+        self.rfile = connection.makefile("rb", self.rbufsize)
+        self.wfile = connection.makefile("wb")
+        self.tunnel = (host, int(port))
+        self.close_connection = False
+        try:
+            while not self.close_connection:
+                self.handle_one_request()
+        except (OSError, ssl.SSLError) as exc:
+            self.log_message("Tunnel %s is closed: %s", self.path, exc)
+        self.close_connection = True
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_HEAD(self):
+        self.dispatch("HEAD")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def read_body(self):
+        """Read the request body of the content length or the chunks."""
+        if "chunked" in (self.headers.get("Transfer-Encoding") or "").lower():
+            chunks = list()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # the trailers end with an empty line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def target(self):
+        """
+        Get the target of the request.
+        :return: (scheme, host, port, path), None for the control requests
+        """
+        if self.tunnel is not None:
+            return ("https",) + self.tunnel + (self.path,)
+        url = urlsplit(self.path)
+        if url.scheme != "http" or not url.hostname:
+            return None
+        path = url.path or "/"
+        if url.query:
+            path += f"?{url.query}"
+        return "http", url.hostname, url.port or 80, path
+
+    def upstream(self, scheme, host, port):
+        """
+        Get the keep-alive connection to the upstream, through the next
+        proxy when it's set.
+        :return: (connection, reused)
+        """
+        key = (scheme, host, port)
+        if key in self.upstreams:
+            return self.upstreams[key], True
+        proxy = self.server.upstream_proxy
+        timeout = self.server.timeout
+        if scheme == "https":
+            if proxy:
+                connection = http.client.HTTPSConnection(
+                    *proxy, timeout=timeout, context=self.server.upstream_context
+                )
+                connection.set_tunnel(host, port)
+            else:
+                connection = http.client.HTTPSConnection(
+                    host, port, timeout=timeout, context=self.server.upstream_context
+                )
+        else:
+            connection = http.client.HTTPConnection(
+                *(proxy or (host, port)), timeout=timeout
+            )
+        self.upstreams[key] = connection
+        return connection, False
+
+    def forward(self, method, target, raw):
+        """
+        Send the request to the upstream, the connection is opened again
+        once when a reused one was closed by the upstream.
+        :return: (status, reason, headers, body)
+        """
+        scheme, host, port, path = target
+        if scheme == "http" and self.server.upstream_proxy:
+            path = self.path
+        headers = {
+            key: value
+            for key, value in self.headers.items()
+            if key.lower() not in HOP_HEADERS
+        }
+        if raw or method in ("POST", "PUT", "PATCH"):
+            headers["Content-Length"] = str(len(raw))
+        while True:
+            connection, reused = self.upstream(scheme, host, port)
+            try:
+                connection.request(method, path, raw, headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                del self.upstreams[(scheme, host, port)]
+                if reused:
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+                del self.upstreams[(scheme, host, port)]
+            return response.status, response.reason, response.headers, body
+
+    def dispatch(self, method):
+        """Forward the request, or call the control endpoints."""
+        target = self.target()
+        if target is None:
+            self.control(method)
+            return
+        started = time.time()
+        raw = self.read_body()
+        error = None
+        try:
+            status, reason, headers, body = self.forward(method, target, raw)
+        except (OSError, http.client.HTTPException) as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            status, reason, headers = 502, "Bad Gateway", http.client.HTTPMessage()
+            body = json.dumps({"displayMessage": error}).encode()
+            headers["Content-Type"] = "application/json"
+        duration = round(time.time() - started, 6)
+        self.send_response(status, reason)
+        for key, value in headers.items():
+            if key.lower() not in HOP_HEADERS + ("content-length",):
+                self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if method != "HEAD":
+            self.wfile.write(body)
+        url = urlsplit(target[3])
+        self.state.record(
+            {
+                "time": started,
+                "duration": duration,
+                "scheme": target[0],
+                "host": target[1],
+                "port": target[2],
+                "method": method,
+                "path": url.path,
+                "query": {key: value[-1] for key, value in parse_qs(url.query).items()},
+                "status": status,
+                "size": len(raw),
+                "response_size": len(body),
+                "body": decode_body(raw, self.headers),
+                "response": decode_body(body, headers),
+                "error": error,
+            }
+        )
+
+    def control(self, method):
+        """The control endpoints of the proxy itself."""
+        url = urlsplit(self.path)
+        name = url.path[len(CONTROL_PREFIX) :].strip("/")
+        query = {key: value[-1] for key, value in parse_qs(url.query).items()}
+        self.read_body()
+        status, data = 404, {"displayMessage": f"Unknown control {method} {name}"}
+        if not url.path.startswith(CONTROL_PREFIX):
+            status, data = 400, {"displayMessage": f"Not a proxy request {self.path}"}
+        elif name == "requests" and method == "GET":
+            status, data = 200, self.state.select(
+                since=int(query.get("since") or 0),
+                method=query.get("method"),
+                path=query.get("path"),
+                body=query.get("body", "1") != "0",
+            )
+        elif name == "requests" and method == "DELETE":
+            with self.state.lock:
+                self.state.records = list()
+            status, data = 200, []
+        elif name == "status" and method == "GET":
+            with self.state.lock:
+                data = {
+                    "records": len(self.state.records),
+                    "last_id": self.state.last_id,
+                    "upstream_proxy": self.server.upstream_proxy,
+                }
+            status = 200
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class RecorderServer(ThreadingMixIn, HTTPServer):
+    """The threading HTTP server of the proxy."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        address,
+        state,
+        certificates,
+        upstream_context,
+        upstream_proxy=None,
+        timeout=120,
+        verbose=False,
+    ):
+        """
+        :param address: (host, port) to listen on
+        :param state: RecorderState
+        :param certificates: Certificates to sign the tunnel certificates
+        :param upstream_context: ssl context to verify the upstream
+        :param upstream_proxy: (host, port) of the next proxy or None
+        :param timeout: seconds to wait for the upstream
+        :param verbose: log every request to stderr
+        """
+        HTTPServer.__init__(self, address, RecorderHandler)
+        self.state = state
+        self.certificates = certificates
+        self.upstream_context = upstream_context
+        self.upstream_proxy = upstream_proxy
+        self.timeout = timeout
+        self.verbose = verbose
+        self.contexts = dict()
+        self.contexts_lock = threading.Lock()
+
+    def tunnel_context(self, host):
+        """
+        Get the ssl context of a tunnel target, whose certificate is
+        signed by the CA on the first use and kept in the cert dir.
+        :param host: the hostname or ip of the target
+        """
+        with self.contexts_lock:
+            if host not in self.contexts:
+                name = re.sub(r"[^\w.-]", "_", host)
+                cert_dir = self.certificates.cert_dir
+                key_file = os.path.join(cert_dir, f"host-{name}.key")
+                cert_file = os.path.join(cert_dir, f"host-{name}.pem")
+                if not os.path.exists(cert_file):
+                    self.certificates.sign(host, key_file, cert_file, host)
+                context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+                context.load_cert_chain(cert_file, key_file)
+                self.contexts[host] = context
+            return self.contexts[host]
+
+
+def upstream_context(ca_dir=None, insecure=False):
+    """
+    Get the ssl context to verify the upstream servers by the system CAs
+    and the CAs of ca_dir, except the CA of the proxy itself.
+    :param ca_dir: the directory of the CA files, such as /etc/rhsm/ca
+    :param insecure: don't verify the upstream servers
+    """
+    context = ssl.create_default_context()
+    if insecure:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+    for ca_file in sorted(glob.glob(os.path.join(ca_dir or "", "*.pem"))):
+        if os.path.basename(ca_file) == CA_FILE_NAME:
+            continue
+        try:
+            context.load_verify_locations(ca_file)
+        except (OSError, ssl.SSLError) as exc:
+            sys.stderr.write(f"Skipped the CA file {ca_file}: {exc}\n")
+    return context
+
+
+def parse_address(value):
+    """Parse HOST:PORT from the command line."""
+    host, _, port = value.rpartition(":")
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"Invalid address {value}")
+    return host, int(port)
+
+
+def serve(args):
+    """Run the proxy until it's killed."""
+    certificates = Certificates(args.cert_dir, ca_name="virtwho-recorder-ca")
+    if args.ca_dir:
+        os.makedirs(args.ca_dir, exist_ok=True)
+        shutil.copyfile(certificates.ca_cert, os.path.join(args.ca_dir, CA_FILE_NAME))
+    server = RecorderServer(
+        (args.bind, args.port),
+        RecorderState(args.record),
+        certificates,
+        upstream_context(args.ca_dir, args.insecure),
+        args.upstream_proxy,
+        args.timeout,
+        args.verbose,
+    )
+    sys.stdout.write(f"Recording proxy on {args.bind}:{server.server_address[1]}\n")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def arguments_parser():
+    """
+    Parse and convert the arguments from command line to parameters
+    for function using, and generate help and usage messages for
+    each arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bind", default="0.0.0.0", help="The address to listen")
+    parser.add_argument("--port", type=int, default=3128, help="The port to listen")
+    parser.add_argument(
+        "--upstream-proxy",
+        type=parse_address,
+        default=None,
+        help="Forward the requests through the next proxy HOST:PORT",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=120, help="Seconds to wait for the upstream"
+    )
+    parser.add_argument(
+        "--insecure", action="store_true", help="Don't verify the upstream servers"
+    )
+    parser.add_argument(
+        "--record", default=None, help="Append the requests to the json-lines file"
+    )
+    parser.add_argument(
+        "--cert-dir",
+        default=os.path.join(tempfile.gettempdir(), "virtwho-recorder"),
+        help="The directory of the keys and certificates",
+    )
+    parser.add_argument(
+        "--ca-dir",
+        default=None,
+        help="Install the CA certificate to the directory and trust the "
+        "other CAs in it for the upstream, such as /etc/rhsm/ca",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    serve(arguments_parser())
@@ -1,13 +1,40 @@
+import abc
+import codecs
+import hashlib
 import json
+import os
+import shlex
+import threading
 import time
 import requests
 
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
-from virtwho import logger, FailException
-from virtwho.configure import get_register_handler
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote, urlsplit
+from urllib3.util.retry import Retry
+from virtwho import logger, FailException, REGISTER
+from virtwho import candlepin, recorder
+from virtwho.base import wait_until
+from virtwho.configure import get_register_handler, virtwho_ssh_connect
+from virtwho.mapping import Mappings
+from virtwho.settings import config
 from virtwho.ssh import SSHConnect
 import re
 
+# the consumers got in one page of the register api
+CONSUMER_PAGE_SIZE = 100
+# seconds to keep a name -> id entry of NameIndex
+INDEX_TTL = 300
+# the hosts resolved by one search of Satellite.host_ids
+SATELLITE_SEARCH_BATCH = 50
+# the bytes of the streamed responses decoded in one time
+CHUNK_SIZE = 64 * 1024
+# the max concurrent DELETE requests of RHSM.host_delete
+DELETE_WORKERS = 8
+# the consumers checked by one request of the delete verification
+DELETE_BATCH = 50
+
 
 class SubscriptionManager:
     def __init__(
@@ -67,6 +94,9 @@ class SubscriptionManager:
                 cmd += f"--baseurl={self.baseurl}"
             ret, output = self.ssh.runcmd(cmd)
             if "The system has been registered" in output:
+                # the host is a new consumer/host with a new id
+                consumer_index.clear()
+                satellite_index.clear()
                 logger.info(f"Succeeded to register host({self.host})")
                 return output
             else:
@@ -87,6 +117,8 @@ class SubscriptionManager:
         if ret == 0:
             # if self.register_type == 'satellite':
             #     self.satellite_cert_uninstall()
+            consumer_index.clear()
+            satellite_index.clear()
             logger.info("Succeeded to unregister host")
         else:
             raise FailException(f"Failed to unregister {self.host}.")
@@ -166,6 +198,101 @@ class SubscriptionManager:
         return dict()
 
 
+class NameIndex:
+    """The name -> id index of the register servers, such as the consumer
+    uuids of RHSM and the host and organization ids of Satellite, so an
+    object is got by its id instead of searching the org again. The
+    entries expire after the ttl, and they are dropped when the objects
+    are deleted or the hosts are registered again.
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        """
+        :param ttl: seconds to keep an entry
+        """
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = dict()
+
+    def get(self, api, org, name, exact=True):
+        """
+        Get the id by name, the name matches the indexed name exactly, or
+        is a part of it as the host searches do when exact=False, which
+        may match a longer name (host-1 matches host-10).
+        :param api: the register api url
+        :param org: the org of the object
+        :param name: the host name (uuid/hwuuid) or the org label
+        :param exact: only match the indexed name exactly
+        :return: the id or None
+        """
+        now = time.monotonic()
+        with self.lock:
+            for key, (value, expire) in list(self.entries.items()):
+                if expire < now:
+                    del self.entries[key]
+            value, _ = self.entries.get((api, org, name), (None, None))
+            if value or exact:
+                return value
+            for (key_api, key_org, key_name), (value, _) in self.entries.items():
+                if key_api == api and key_org == org and name in key_name:
+                    return value
+        return None
+
+    def put(self, api, org, name, value):
+        """Add or refresh the id of a name."""
+        with self.lock:
+            self.entries[(api, org, name)] = (value, time.monotonic() + self.ttl)
+
+    def discard(self, value):
+        """Drop the entries of a deleted object."""
+        with self.lock:
+            for key, (entry, _) in list(self.entries.items()):
+                if entry == value:
+                    del self.entries[key]
+
+    def clear(self):
+        """Drop all the entries."""
+        with self.lock:
+            self.entries.clear()
+
+
+# consumer name -> uuid of RHSM
+consumer_index = NameIndex()
+# host name -> host id of Satellite
+satellite_index = NameIndex()
+# org label -> org id of Satellite
+organization_index = NameIndex()
+
+_delete_executor = None
+_delete_verifications = list()
+_delete_lock = threading.Lock()
+
+
+def delete_executor():
+    """The executor of the background delete verifications."""
+    global _delete_executor
+    with _delete_lock:
+        if _delete_executor is None:
+            _delete_executor = ThreadPoolExecutor(max_workers=2)
+        return _delete_executor
+
+
+def wait_delete_verifications(timeout=None):
+    """
+    Wait for all the background delete verifications.
+    :param timeout: the max seconds to wait for each one
+    :return: list of the failure messages
+    """
+    failures = list()
+    while _delete_verifications:
+        future = _delete_verifications.pop(0)
+        try:
+            future.result(timeout=timeout)
+        except Exception as exc:
+            failures.append(str(exc))
+    return failures
+
+
 class RHSM:
     def __init__(self, rhsm="rhsm"):
         """
@@ -178,23 +305,97 @@ class RHSM:
         self.api = f"https://{register.server}/subscription"
         self.auth = (register.username, register.password)
 
+    def iter_consumers(self, host_name=None, page_size=CONSUMER_PAGE_SIZE):
+        """
+        Iterate the consumers of the org whose name includes host_name.
+        Candlepin can't filter the consumers by name, so the consumers
+        are first searched by the server side filters, the hypervisor id
+        (a hypervisor reported by virt-who) and the hostname fact (a
+        registered system). The other consumers of the org are scanned
+        page by page after them, the newest first.
+        :param host_name: only the consumers whose name includes it
+        :param page_size: the consumers of one page
+        :return: generator of the consumers
+        """
+        found = set()
+        if host_name:
+            for filters in (
+                {"hypervisor_id": host_name},
+                {"fact": f"network.hostname:{host_name}"},
+            ):
+                for consumer in self.consumer_pages(filters, page_size):
+                    if host_name in consumer["name"] and consumer["uuid"] not in found:
+                        found.add(consumer["uuid"])
+                        yield consumer
+        for consumer in self.consumer_pages(None, page_size):
+            if not host_name or host_name in consumer["name"]:
+                if consumer["uuid"] not in found:
+                    yield consumer
+
+    def consumer_pages(self, filters=None, page_size=CONSUMER_PAGE_SIZE):
+        """
+        Iterate the consumers of the org page by page, the newest first.
+        Each page is decoded consumer by consumer while it's downloaded,
+        so the download stops as soon as the iteration stops. All the
+        consumers seen are added to the name->uuid index.
+        :param filters: the server side filters, such as hypervisor_id
+        :param page_size: the consumers of one page
+        :return: generator of the consumers
+        """
+        page = 1
+        while True:
+            params = {
+                "page": page,
+                "per_page": page_size,
+                "sort_by": "created",
+                "order": "desc",
+            }
+            params.update(filters or dict())
+            res = http_request(
+                "GET",
+                f"{self.api}/owners/{self.org}/consumers",
+                self.auth,
+                params=params,
+                stream=True,
+            )
+            with res:
+                if res.status_code != 200:
+                    logger.warning(
+                        f"Failed to get the consumers of {self.org}, "
+                        f"status code {res.status_code}"
+                    )
+                    return
+                count = 0
+                for consumer in json_items(res.iter_content(CHUNK_SIZE)):
+                    count += 1
+                    consumer_index.put(
+                        self.api, self.org, consumer["name"], consumer["uuid"]
+                    )
+                    yield consumer
+            if count < page_size:
+                return
+            page += 1
+
     def consumers(self, host_name=None):
         """
         Search consumer host information.
         :param host_name: host name, search all consumers if host_name=None.
         :return: one consumer or all consumers to a list.
         """
-        status, consumers = request_get(
-            url=f"{self.api}/owners/{self.org}/consumers", auth=self.auth
-        )
-        if status == 200:
-            if host_name:
-                for consumer in consumers:
-                    if host_name in consumer["name"]:
-                        return consumer
-            else:
-                return consumers
-        return None
+        if not host_name:
+            return list(self.iter_consumers()) or None
+        uuid = consumer_index.get(self.api, self.org, host_name)
+        if uuid:
+            status, consumer = request_get(
+                url=f"{self.api}/consumers/{uuid}", auth=self.auth
+            )
+            if status == 200 and host_name in consumer.get("name", ""):
+                return consumer
+            consumer_index.discard(uuid)
+        consumer = next(self.iter_consumers(host_name), None)
+        if consumer:
+            consumer_index.put(self.api, self.org, host_name, consumer["uuid"])
+        return consumer
 
     def uuid(self, host_name):
         """
@@ -223,54 +424,103 @@ class RHSM:
             return info
         raise FailException(f"Failed to get consumer info for {host_name}")
 
-    def host_delete(self, host_name=None, verify=True):
+    def consumer_delete(self, uuid):
+        """
+        Delete a consumer, the 429/5xx responses are retried by the
+        session, see http_session().
+        :param uuid: the consumer uuid
+        :return: the status code
+        """
+        status = request_delete(url=f"{self.api}/consumers/{uuid}", auth=self.auth)
+        if status in (200, 204, 404, 410):
+            consumer_index.discard(uuid)
+            return status
+        raise FailException(f"Failed to delete consumer {uuid} on stage ({status})")
+
+    def visible(self, uuids):
+        """
+        Get the consumers still listed in the org, the uuids are checked
+        by the uuid filters of DELETE_BATCH consumers in one request.
+        :param uuids: list of the consumer uuids
+        :return: list of the visible uuids
+        """
+        remaining = list()
+        for index in range(0, len(uuids), DELETE_BATCH):
+            batch = uuids[index : index + DELETE_BATCH]
+            res = http_request(
+                "GET",
+                f"{self.api}/owners/{self.org}/consumers",
+                self.auth,
+                params={"uuid": batch},
+            )
+            if res.status_code != 200:
+                logger.warning(
+                    f"Failed to check the deleted consumers, "
+                    f"status code {res.status_code}"
+                )
+                remaining.extend(batch)
+                continue
+            remaining.extend(
+                consumer["uuid"] for consumer in res.json() if consumer["uuid"] in batch
+            )
+        return remaining
+
+    def delete_verify(self, uuids, retries=10, interval=5):
+        """
+        Wait for the deleted consumers to disappear from the listing,
+        stage has eventual consistency. Only the still visible ones are
+        checked again in the next retry.
+        :param uuids: list of the deleted consumer uuids
+        :param retries: the max checks
+        :param interval: the seconds before each check
+        :return: True or Fail
+        """
+        for attempt in range(retries):
+            time.sleep(interval)
+            uuids = self.visible(uuids)
+            if not uuids:
+                logger.info("Succeeded to delete consumer(s) on stage")
+                return True
+            logger.warning(
+                f"{len(uuids)} consumer(s) still visible after delete, "
+                f"retry {attempt + 1}/{retries}"
+            )
+        raise FailException(f"Failed to delete consumer(s) on stage: {uuids}")
+
+    def host_delete(
+        self, host_name=None, verify=True, workers=DELETE_WORKERS, background=False
+    ):
         """
         Delete only one consumer or clean all consumers.
         :param host_name: host name, will clean all consumers if host_name=None.
         :param verify: wait for consumer to disappear from listing (stage has
             eventual consistency; set False when delete is just cleanup).
-        :return: True or Fail
+        :param workers: the max concurrent DELETE requests
+        :param background: verify in a background thread and return its
+            Future at once, so the next test starts during the
+            verification, see wait_delete_verifications().
+        :return: True, the Future of the verification or Fail
         """
-        consumers = self.consumers()
-        if consumers:
-            for consumer in consumers:
-                uuid = consumer["uuid"]
-                if not host_name or (host_name and host_name in consumer["name"]):
-                    for attempt in range(3):
-                        status = request_delete(
-                            url=f"{self.api}/consumers/{uuid}", auth=self.auth
-                        )
-                        if status in (200, 204, 404, 410):
-                            break
-                        logger.warning(
-                            f"DELETE consumer {uuid} returned {status}, "
-                            f"retry {attempt + 1}/3"
-                        )
-                        time.sleep(5)
-                    else:
-                        raise FailException(
-                            f"Failed to delete consumer {uuid} on stage "
-                            f"(last status={status})"
-                        )
-            if not verify:
-                logger.info(
-                    "DELETE request(s) succeeded; skipping verification"
-                )
-                return True
-            for attempt in range(10):
-                time.sleep(5)
-                if not self.consumers(host_name=host_name):
-                    logger.info("Succeeded to delete consumer(s) on stage")
-                    return True
-                logger.warning(
-                    f"Consumer(s) still visible after delete, "
-                    f"retry {attempt + 1}/10"
-                )
-            raise FailException("Failed to delete consumer(s) on stage")
-        logger.info(
-            "Succeeded to delete consumer(s) on stage because no consumer found"
-        )
-        return True
+        # the deletes shift the pages, so all the uuids are got first
+        uuids = [consumer["uuid"] for consumer in self.iter_consumers(host_name)]
+        if not uuids:
+            logger.info(
+                "Succeeded to delete consumer(s) on stage because no consumer found"
+            )
+            return True
+        with ThreadPoolExecutor(max_workers=min(workers, len(uuids))) as executor:
+            # all the deletes are done before the first failure is raised
+            list(executor.map(self.consumer_delete, uuids))
+        logger.info(f"Deleted {len(uuids)} consumer(s) on stage")
+        if not verify:
+            logger.info("DELETE request(s) succeeded; skipping verification")
+            return True
+        if background:
+            future = delete_executor().submit(self.delete_verify, uuids)
+            _delete_verifications.append(future)
+            logger.info("Verifying the deleted consumer(s) in background")
+            return future
+        return self.delete_verify(uuids)
 
     def associate(self, host_name, guest_uuid):
         """
@@ -311,11 +561,408 @@ class RHSM:
         raise FailException(f"Failed to {sca} SCA for rhsm")
 
 
+class RemoteServer(abc.ABC):
+    """Base class of the stdlib servers (virtwho/candlepin.py and
+    virtwho/recorder.py) uploaded to the virt-who host and run in
+    background. The subclasses define the modules to upload, the command
+    line arguments and the control endpoints."""
+
+    # the uploaded modules, the first one is run
+    modules = ()
+    # the control endpoints prefix of the server
+    control_prefix = ""
+    name = "server"
+
+    def __init__(self, ssh=None, port=None, url=None):
+        """
+        :param ssh: ssh access of the virt-who host, default to the
+            leased virt-who host.
+        :param port: the port to listen
+        :param url: the base url to reach the control endpoints
+        """
+        self.ssh = ssh or virtwho_ssh_connect()
+        self.port = port
+        self.url = url
+        self.pid = None
+        self.remote_dir = None
+        self.log_file = f"/tmp/virtwho_{self.module_name()}.log"
+
+    def module_name(self):
+        """The name of the module run as the server, such as candlepin."""
+        return self.modules[0].__name__.rsplit(".", 1)[-1]
+
+    def upload(self):
+        """
+        Upload the modules to the virt-who host, the directory name
+        includes the digest, so the changed modules are uploaded again.
+        :return: the remote file of the first module
+        """
+        digest = hashlib.md5()
+        for module in self.modules:
+            with open(module.__file__, "rb") as f:
+                digest.update(f.read())
+        self.remote_dir = f"/tmp/virtwho_{self.module_name()}_{digest.hexdigest()[:12]}"
+        self.ssh.runcmd(f"mkdir -p {self.remote_dir}")
+        for module in self.modules:
+            self.ssh.put_file(
+                module.__file__,
+                f"{self.remote_dir}/{os.path.basename(module.__file__)}",
+            )
+        return f"{self.remote_dir}/{os.path.basename(self.modules[0].__file__)}"
+
+    @abc.abstractmethod
+    def arguments(self):
+        """The command line arguments of the server."""
+
+    @abc.abstractmethod
+    def status(self):
+        """The http status code of the server."""
+
+    def cleanup(self):
+        """Remove the files left by the server on the virt-who host."""
+
+    def start(self, timeout=60):
+        """Start the server in background and wait until it's serving."""
+        self.stop()
+        cmd = (
+            f"nohup $(command -v python3 || echo /usr/libexec/platform-python) "
+            f"{self.upload()} {self.arguments()} > {self.log_file} 2>&1 & echo $!"
+        )
+        ret, output = self.ssh.runcmd(cmd)
+        if ret != 0 or not output.strip().isdigit():
+            raise FailException(f"Failed to start the {self.name}: {output}")
+        self.pid = output.strip()
+        serving = wait_until(
+            lambda: self.status() == "200",
+            timeout=timeout,
+            interval=0.5,
+            message=f"the {self.name} serving",
+        )
+        if not serving:
+            _, log = self.ssh.runcmd(f"cat {self.log_file}")
+            raise FailException(f"The {self.name} is not serving: {log}")
+        logger.info(f"Started the {self.name} on port {self.port}")
+        return self
+
+    def stop(self):
+        """Stop the server and clean up its files."""
+        if self.pid:
+            self.ssh.runcmd(f"kill {self.pid} 2>/dev/null")
+            logger.info(f"Stopped the {self.name}")
+            self.pid = None
+        self.cleanup()
+
+    def control(self, method, name, data=None, query=""):
+        """
+        Call a control endpoint of the server.
+        :param method: GET, PUT or DELETE
+        :param name: the endpoint name, such as requests
+        :param data: the json data to send
+        :param query: the url query string
+        :return: the decoded json response
+        """
+        url = f"{self.url}{self.control_prefix}/{name}"
+        if query:
+            url += f"?{query}"
+        cmd = f"curl -sk --noproxy '*' -X {method} {shlex.quote(url)}"
+        if data is not None:
+            cmd += f" -H 'Content-Type: application/json' -d {shlex.quote(json.dumps(data))}"
+        ret, output = self.ssh.runcmd(cmd, if_stdout=True, log_print=False)
+        try:
+            return json.loads(output)
+        except (TypeError, ValueError):
+            raise FailException(f"Failed to call the {self.name}: {output}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class CandlepinStandIn(RemoteServer):
+    """Run the local candlepin stand-in (virtwho/candlepin.py) on the
+    virt-who host, so virt-who reports to localhost instead of the live
+    candlepin. The virt-who configs use it by the register type
+    'standin', whose rhsm_hostname/rhsm_prefix come from [standin] of
+    virtwho.ini.
+
+    Usage:
+        with CandlepinStandIn(faults=["429:POST:/hypervisors:1"]) as standin:
+            hypervisor_create(HYPERVISOR, "standin")
+            result = virtwho.run_service()
+            requests = standin.requests()
+    """
+
+    modules = (candlepin,)
+    control_prefix = candlepin.CONTROL_PREFIX
+    name = "candlepin stand-in"
+
+    def __init__(self, ssh=None, register_type="standin", latency=0, faults=None):
+        """
+        :param ssh: ssh access of the virt-who host, default to the
+            leased virt-who host.
+        :param register_type: the register section of the stand-in
+        :param latency: seconds added to every response
+        :param faults: list of the injected faults as
+            STATUS:METHOD:PATH[:COUNT[:LATENCY]] or dict
+        """
+        register = get_register_handler(register_type)
+        port = int(register.port or 8443)
+        RemoteServer.__init__(self, ssh, port, f"https://localhost:{port}")
+        self.prefix = register.prefix or "/candlepin"
+        self.username = register.username
+        self.password = register.password
+        self.org = register.default_org
+        self.latency = latency
+        self.faults = [
+            fault if isinstance(fault, dict) else candlepin.parse_fault(fault)
+            for fault in faults or list()
+        ]
+        self.cert_dir = "/tmp/virtwho-standin"
+        self.ca_dir = "/etc/rhsm/ca"
+        self.record_file = "/tmp/virtwho_standin.jsonl"
+
+    def arguments(self):
+        """The command line arguments of the stand-in."""
+        args = (
+            f"--port {self.port} --prefix {self.prefix} "
+            f"--owner {shlex.quote(self.org)} --latency {self.latency} "
+            f"--cert-dir {self.cert_dir} --ca-dir {self.ca_dir} "
+            f"--record {self.record_file}"
+        )
+        if self.username:
+            args += (
+                f" --username {shlex.quote(self.username)}"
+                f" --password {shlex.quote(self.password or '')}"
+            )
+        for fault in self.faults:
+            args += (
+                f" --fault {fault['status']}:{fault.get('method', '*')}:"
+                f"{fault.get('path', '')}:{fault.get('count', -1)}:"
+                f"{fault.get('latency', 0)}"
+            )
+        return args
+
+    def start(self, timeout=60):
+        """
+        Start the stand-in in background and wait until it's serving,
+        the CA is installed to /etc/rhsm/ca for virt-who to trust it.
+        """
+        self.ssh.runcmd(f"rm -f {self.record_file}")
+        return RemoteServer.start(self, timeout)
+
+    def status(self):
+        """The http status code of the stand-in status endpoint."""
+        _, output = self.ssh.runcmd(
+            f"curl -sk --noproxy '*' -o /dev/null -w '%{{http_code}}' "
+            f"{self.url}{self.prefix}/status",
+            log_print=False,
+        )
+        return output.strip()
+
+    def cleanup(self):
+        """Remove the CA of the stand-in from /etc/rhsm/ca."""
+        self.ssh.runcmd(f"rm -f {self.ca_dir}/{candlepin.CA_FILE_NAME}")
+
+    def requests(self, method=None, path=None, clear=False):
+        """
+        Get the recorded requests, including the body and the timing.
+        :param method: only the requests of the method
+        :param path: only the requests whose path contains it
+        :param clear: clear the records after getting them
+        :return: list of the records
+        """
+        records = self.control("GET", "requests")
+        if clear:
+            self.control("DELETE", "requests")
+        return [
+            record
+            for record in records
+            if (method is None or record["method"] == method)
+            and (path is None or path in record["path"])
+        ]
+
+    def inject(self, faults=None, latency=None):
+        """
+        Replace the injected faults and the latency at runtime.
+        :param faults: list of the faults, see __init__()
+        :param latency: seconds added to every response
+        """
+        self.faults = [
+            fault if isinstance(fault, dict) else candlepin.parse_fault(fault)
+            for fault in faults or list()
+        ]
+        if latency is not None:
+            self.latency = latency
+        return self.control(
+            "PUT", "faults", {"faults": self.faults, "latency": self.latency}
+        )
+
+
+class RecordingProxy(RemoteServer):
+    """Run the recording forward proxy (virtwho/recorder.py) on the
+    virt-who host between virt-who and the subscription server. The
+    requests and responses are recorded with the decoded json bodies, so
+    the tests get the mappings and the send number without debug logging
+    or scraping the rhsm.log.
+
+    Usage:
+        with RecordingProxy() as proxy:
+            proxy.configure(hypervisor)
+            virtwho.run_cli(debug=False)
+            assert proxy.send_number() == 1
+            assert proxy.mappings().associated(hypervisor_id, guest_uuid, org)
+    """
+
+    modules = (recorder, candlepin)
+    control_prefix = recorder.CONTROL_PREFIX
+    name = "recording proxy"
+
+    def __init__(self, ssh=None, port=3128, register_type=REGISTER, insecure=False):
+        """
+        :param ssh: ssh access of the virt-who host, default to the
+            leased virt-who host.
+        :param port: the port to listen
+        :param register_type: the subscription server, the requests go
+            through its proxy_hostname/proxy_port when they are set.
+        :param insecure: don't verify the subscription server
+        """
+        RemoteServer.__init__(self, ssh, port, f"http://localhost:{port}")
+        register = get_register_handler(register_type)
+        self.upstream_proxy = None
+        if getattr(register, "proxy_hostname", None) and getattr(
+            register, "proxy_port", None
+        ):
+            self.upstream_proxy = f"{register.proxy_hostname}:{register.proxy_port}"
+        self.insecure = insecure
+        self.cert_dir = "/tmp/virtwho-recorder"
+        self.ca_dir = "/etc/rhsm/ca"
+        self.record_file = "/tmp/virtwho_recorder.jsonl"
+        # the id of the last record read by requests(since_last=True)
+        self.last_id = 0
+
+    def arguments(self):
+        """The command line arguments of the proxy."""
+        args = (
+            f"--port {self.port} --cert-dir {self.cert_dir} "
+            f"--ca-dir {self.ca_dir} --record {self.record_file}"
+        )
+        if self.upstream_proxy:
+            args += f" --upstream-proxy {self.upstream_proxy}"
+        if self.insecure:
+            args += " --insecure"
+        return args
+
+    def start(self, timeout=60):
+        """
+        Start the proxy in background and wait until it's serving, the
+        CA is installed to /etc/rhsm/ca for virt-who to trust it.
+        """
+        self.ssh.runcmd(f"rm -f {self.record_file}")
+        self.last_id = 0
+        return RemoteServer.start(self, timeout)
+
+    def status(self):
+        """The http status code of the proxy status endpoint."""
+        _, output = self.ssh.runcmd(
+            f"curl -s --noproxy '*' -o /dev/null -w '%{{http_code}}' "
+            f"{self.url}{self.control_prefix}/status",
+            log_print=False,
+        )
+        return output.strip()
+
+    def cleanup(self):
+        """Remove the CA of the proxy from /etc/rhsm/ca."""
+        self.ssh.runcmd(f"rm -f {self.ca_dir}/{recorder.CA_FILE_NAME}")
+
+    def configure(self, hypervisor):
+        """
+        Send the requests of a virt-who config through the proxy.
+        :param hypervisor: VirtwhoHypervisorConfig
+        """
+        with hypervisor.batch():
+            hypervisor.update("rhsm_proxy_hostname", "localhost")
+            hypervisor.update("rhsm_proxy_port", str(self.port))
+
+    def requests(self, method=None, path=None, body=True, since_last=False):
+        """
+        Get the recorded requests and responses.
+        :param method: only the requests of the method
+        :param path: only the requests whose path matches the regex
+        :param body: False is to drop the decoded json bodies
+        :param since_last: only the requests after the last call
+        :return: list of the records, see recorder.RecorderHandler.dispatch()
+        """
+        query = [f"since={self.last_id if since_last else 0}"]
+        if method:
+            query.append(f"method={method}")
+        if path:
+            query.append(f"path={quote(path)}")
+        if not body:
+            query.append("body=0")
+        records = self.control("GET", "requests", query="&".join(query))
+        if records:
+            self.last_id = max(self.last_id, records[-1]["id"])
+        return records
+
+    def clear(self):
+        """Clear the records."""
+        self.control("DELETE", "requests")
+
+    def checkins(self, since_last=False):
+        """
+        Get the hypervisor check-in requests, which are the mapping
+        reports of virt-who.
+        :param since_last: only the requests after the last call
+        :return: list of the records
+        """
+        return self.requests("POST", r"/hypervisors(/[^/]+)?/?$", since_last=since_last)
+
+    def send_number(self, since_last=False):
+        """
+        The number of the mapping reports accepted by the server.
+        :param since_last: only the requests after the last call
+        """
+        return len(
+            [
+                record
+                for record in self.checkins(since_last)
+                if record["status"] in (200, 202)
+            ]
+        )
+
+    def mappings(self, records=None, fuzzy=False):
+        """
+        Get the last mapping reported to each org.
+        :param records: the check-in records, default to all of them
+        :param fuzzy: match the uuids case insensitively and byte-swapped
+        :return: Mappings of the remote mode
+        """
+        data = Mappings(fuzzy=fuzzy)
+        payloads = dict()
+        orgs = list()
+        for record in records if records is not None else self.checkins():
+            org = record["path"].rstrip("/").rsplit("/", 1)[-1]
+            if org == "hypervisors":
+                org = record["query"].get("owner")
+            orgs.append(org)
+            if record["body"] is not None:
+                payloads[org] = record["body"]
+        for org, payload in payloads.items():
+            data.add(org, payload)
+        data.orgs = orgs
+        return data
+
+
 class Satellite:
     def __init__(self, server=None, org=None, activation_key=None):
         """
-        Using hammer command to set satellite, handle organization and activation key.
-        Using api to check the host-to-guest associations.
+        Using the satellite REST api (/api/v2 and /katello/api) to set
+        satellite, handle organization and activation key, and check the
+        host-to-guest associations. The hammer command over ssh is the
+        fallback when the api can't be used, or [satellite]:api=false is
+        set in virtwho.ini.
         :param server: satellite server ip/hostname, use the server configured
             in virtwho.ini as default.
         :param org: organization label, use the default_org configured
@@ -331,13 +978,95 @@ class Satellite:
             host=self.server, user=register.ssh_username, pwd=register.ssh_password
         )
         self.hammer = "hammer --output=json"
+        self.api = f"https://{self.server}"
+        self.auth = (register.username, register.password)
+        self.use_api = str(getattr(register, "api", "") or "true").lower() != "false"
         try:
             self.org_id = self.organization_id()
         except FailException:  # retry by creating org first
             self.org_create(name=self.org, label=self.org)
             self.org_id = self.organization_id()
-        self.api = f"https://{self.server}"
-        self.auth = (register.username, register.password)
+
+    def api_call(self, method, path, params=None, json_data=None):
+        """
+        Call the satellite REST api by the shared session.
+        :param method: GET, POST, PUT or DELETE
+        :param path: the api path, such as /api/v2/hosts
+        :param params: the query parameters
+        :param json_data: json data to send in the body
+        :return: (status code, decoded json or None), or None when the
+            api can't be used and the hammer command should be used.
+        """
+        if not self.use_api:
+            return None
+        try:
+            res = http_request(
+                method, f"{self.api}{path}", self.auth, params=params, json=json_data
+            )
+        except requests.RequestException as exc:
+            logger.warning(f"Satellite api is not reachable, use hammer: {exc}")
+            self.use_api = False
+            return None
+        if res.status_code in (401, 403) or res.status_code >= 500:
+            logger.warning(
+                f"Satellite api {method} {path} returned {res.status_code}, "
+                f"use hammer"
+            )
+            return None
+        try:
+            data = res.json()
+        except ValueError:
+            data = None
+        return res.status_code, data
+
+    def api_results(self, path, params=None):
+        """
+        Get all the results of a list api, page by page.
+        :param path: the api path, such as /api/v2/hosts
+        :param params: the query parameters
+        :return: list of the results, or None to use hammer
+        """
+        params = dict(params or {})
+        params.setdefault("per_page", 1000)
+        results = list()
+        page = 1
+        while True:
+            params["page"] = page
+            result = self.api_call("GET", path, params=params)
+            if result is None:
+                return None
+            status, data = result
+            if status != 200 or not isinstance(data, dict):
+                return None
+            items = data.get("results") or list()
+            results.extend(items)
+            if len(items) < int(params["per_page"]) or len(results) >= int(
+                data.get("subtotal") or 0
+            ):
+                return results
+            page += 1
+
+    def task_wait(self, data, timeout=300):
+        """
+        Wait for the foreman task returned by an async api.
+        :param data: the decoded json of the task
+        :param timeout: the max seconds to wait
+        :return: True when the task succeeded
+        """
+        if not isinstance(data, dict) or "id" not in data or "state" not in data:
+            return True
+        task = {"data": data}
+
+        def finished():
+            result = self.api_call("GET", f"/foreman_tasks/api/tasks/{data['id']}")
+            if result is None or result[0] != 200:
+                return False
+            task["data"] = result[1]
+            return task["data"].get("state") in ("stopped", "paused")
+
+        if task["data"].get("state") not in ("stopped", "paused"):
+            wait_until(finished, timeout=timeout, interval=1, message="satellite task")
+        return task["data"].get("result") == "success"
 
     def organization_id(self, org=None):
         """
@@ -347,6 +1076,18 @@ class Satellite:
         :return: organization id
         """
         org = org or self.org
+        org_id = organization_index.get(self.api, None, org)
+        if org_id:
+            return org_id
+        results = self.api_results(
+            "/katello/api/organizations", params={"search": f'label="{org}"'}
+        )
+        if results is not None:
+            for item in results:
+                if item.get("label") == org:
+                    organization_index.put(self.api, None, org, item["id"])
+                    return item["id"]
+            raise FailException(f"Failed to get the organization id for {org}")
         ret, output = self.ssh.runcmd(
             f'{self.hammer} organization info --label "{org}" --fields Id'
         )
@@ -356,6 +1097,7 @@ class Satellite:
             raise FailException(f"Failed to get the organization id for {org}")
 
         if ret == 0 and output:
+            organization_index.put(self.api, None, org, output["Id"])
             return output["Id"]
         raise FailException(f"Failed to get the organization id for {org}")
 
@@ -368,6 +1110,20 @@ class Satellite:
         :return: True or raise Fail
         """
         description = description or ""
+        result = self.api_call(
+            "POST",
+            "/katello/api/organizations",
+            json_data={"name": name, "label": label, "description": description},
+        )
+        if result is not None:
+            status, data = result
+            if status in (200, 201):
+                logger.info(f"Succeeded to create organization:{name}")
+                return True
+            if status == 422 and "already been taken" in str(data):
+                logger.info(f"The organization:{name} already existed")
+                return True
+            raise FailException(f"Failed to create organization:{name}")
         _, output = self.ssh.runcmd(
             f"hammer organization create "
             f'--name "{name}" '
@@ -391,6 +1147,26 @@ class Satellite:
         :param label: organization label
         :return: True or raise Fail
         """
+        org_id = organization_index.get(self.api, None, label)
+        if org_id:
+            organization_index.discard(org_id)
+        results = self.api_results(
+            "/katello/api/organizations", params={"search": f'label="{label}"'}
+        )
+        if results is not None:
+            org_ids = [item["id"] for item in results if item.get("label") == label]
+            if not org_ids:
+                logger.info(f"The organization:{label} does not exist already")
+                return True
+            result = self.api_call("DELETE", f"/katello/api/organizations/{org_ids[0]}")
+            if (
+                result is not None
+                and result[0] in (200, 202)
+                and self.task_wait(result[1])
+            ):
+                logger.info(f"Succeeded to delete organization:{label}")
+                return True
+            raise FailException(f"Failed to delete organization:{label}")
         _, output = self.ssh.runcmd(f'hammer organization delete --label "{label}"')
         if "100%" in output:
             logger.info(f"Succeeded to delete organization:{label}")
@@ -400,24 +1176,100 @@ class Satellite:
             return True
         raise FailException(f"Failed to delete organization:{label}")
 
-    def host_id(self, host):
+    def host_cached(self, host):
         """
-        Get the host id by host name or uuid or hwuuid.
+        Get the host id from the index, the host is the host name or the
+        same uuid/hwuuid resolved before.
         :param host: host name/uuid/hwuuid
         :return: host id or None
         """
-        ret, output = self.ssh.runcmd(
-            f"{self.hammer} host list --organization-id {self.org_id} --search {host}"
+        return satellite_index.get(self.api, self.org_id, host)
+
+    def host_search(self, hosts):
+        """
+        Search the hosts by one query, the results are added to the index.
+        :param hosts: list of host name/uuid/hwuuid
+        :return: list of the hosts, such as [{"Id": 1, "Name": "xxx"}]
+        """
+        search = " or ".join(f'name ~ "{host}"' for host in hosts)
+        items = self.api_results(
+            "/api/v2/hosts", params={"organization_id": self.org_id, "search": search}
         )
-        output = json.loads(output)
-        if ret == 0 and len(output) >= 1:
-            for item in output:
-                if host in item["Name"] or host.lower() in item["Name"]:
-                    host_id = item["Id"]
-                    logger.info(f"Succeeded to get the host id, {host}:{host_id}")
-                    return host_id
-        logger.warning(f"Failed to get the host id for {host}")
-        return None
+        if items is not None:
+            items = [{"Id": item["id"], "Name": item["name"]} for item in items]
+        else:
+            ret, output = self.ssh.runcmd(
+                f"{self.hammer} host list --organization-id {self.org_id} "
+                f"--search '{search}'"
+            )
+            try:
+                items = json.loads(output) if ret == 0 else list()
+            except JSONDecodeError:
+                items = list()
+        for item in items:
+            satellite_index.put(self.api, self.org_id, item["Name"], item["Id"])
+        return items
+
+    def host_ids(self, hosts, refresh=False):
+        """
+        Get the host ids of many hosts, the hosts not in the index are
+        searched by batches of SATELLITE_SEARCH_BATCH hosts instead of one
+        search per host.
+        :param hosts: list of host name/uuid/hwuuid
+        :param refresh: search all the hosts, ignore the index
+        :return: dict of host: host id, None when the host is not found
+        """
+        ids = dict()
+        for host in hosts:
+            ids[host] = None if refresh else self.host_cached(host)
+        missed = [host for host, host_id in ids.items() if not host_id]
+        for start in range(0, len(missed), SATELLITE_SEARCH_BATCH):
+            batch = missed[start : start + SATELLITE_SEARCH_BATCH]
+            items = self.host_search(batch)
+            for host in batch:
+                # the exact name first, so host-1 doesn't get host-10
+                matched = [
+                    item
+                    for item in items
+                    if host in item["Name"] or host.lower() in item["Name"]
+                ]
+                matched.sort(key=lambda item: item["Name"] not in (host, host.lower()))
+                if matched:
+                    ids[host] = matched[0]["Id"]
+                    satellite_index.put(self.api, self.org_id, host, ids[host])
+        for host, host_id in ids.items():
+            if host_id:
+                logger.info(f"Succeeded to get the host id, {host}:{host_id}")
+            else:
+                logger.warning(f"Failed to get the host id for {host}")
+        return ids
+
+    def host_id(self, host):
+        """
+        Get the host id by host name or uuid or hwuuid, the id in the
+        index is checked to be the same host before it's used.
+        :param host: host name/uuid/hwuuid
+        :return: host id or None
+        """
+        host_id = self.host_cached(host)
+        if host_id:
+            result = self.api_call("GET", f"/api/v2/hosts/{host_id}")
+            if result is not None:
+                status, data = result
+                name = (data or dict()).get("name", "") if status == 200 else ""
+            else:
+                ret, output = self.ssh.runcmd(
+                    f"{self.hammer} host info --id {host_id} --fields Name"
+                )
+                try:
+                    name = json.loads(output).get("Name", "") if ret == 0 else ""
+                except JSONDecodeError:
+                    name = ""
+            if host in name or host.lower() in name:
+                logger.info(f"Succeeded to get the host id, {host}:{host_id}")
+                return host_id
+            satellite_index.discard(host_id)
+        return self.host_ids([host], refresh=True)[host]
 
     def host_delete(self, host):
         """
@@ -427,10 +1279,18 @@ class Satellite:
         """
         host_id = self.host_id(host)
         if host_id:
-            self.ssh.runcmd(
-                f"hammer host delete --organization-id {self.org_id} --id {host_id}"
-            )
-            if self.host_id(host) is None:
+            result = self.api_call("DELETE", f"/api/v2/hosts/{host_id}")
+            satellite_index.discard(host_id)
+            if result is not None:
+                # the deleted host is checked by its id, no search again
+                result = self.api_call("GET", f"/api/v2/hosts/{host_id}")
+                deleted = result is not None and result[0] == 404
+            else:
+                self.ssh.runcmd(
+                    f"hammer host delete --organization-id {self.org_id} --id {host_id}"
+                )
+                deleted = self.host_id(host) is None
+            if deleted:
                 logger.info(f"Succeeded to delete {host} from satellite")
                 return True
             raise FailException(f"Failed to Delete {host} from satellite")
@@ -449,6 +1309,34 @@ class Satellite:
         :return: True or raise Fail.
         """
         key = key or self.activation_key
+        environments = self.api_results(
+            f"/katello/api/organizations/{self.org_id}/environments",
+            params={"name": environment},
+        )
+        content_views = self.api_results(
+            "/katello/api/content_views",
+            params={"organization_id": self.org_id, "name": content_view},
+        )
+        if environments and content_views:
+            result = self.api_call(
+                "POST",
+                "/katello/api/activation_keys",
+                json_data={
+                    "organization_id": self.org_id,
+                    "name": key,
+                    "environment_id": environments[0]["id"],
+                    "content_view_id": content_views[0]["id"],
+                },
+            )
+            if result is not None:
+                status, data = result
+                if status in (200, 201):
+                    logger.info(f"Succeeded to create activation key:{key}")
+                    return True
+                if status == 422 and "already been taken" in str(data):
+                    logger.info(f"Activation key:{key} already exists")
+                    return True
+                raise FailException(f"Failed to create activation key:{key}")
         _, output = self.ssh.runcmd(
             f"hammer activation-key create "
             f"--organization-id {self.org_id} "
@@ -471,6 +1359,22 @@ class Satellite:
         :return: True or raise Fail.
         """
         key = key or self.activation_key
+        results = self.api_results(
+            "/katello/api/activation_keys",
+            params={"organization_id": self.org_id, "name": key},
+        )
+        if results is not None:
+            key_ids = [item["id"] for item in results if item.get("name") == key]
+            if not key_ids:
+                logger.info(f"Activation key:{key} was not found")
+                return True
+            result = self.api_call(
+                "DELETE", f"/katello/api/activation_keys/{key_ids[0]}"
+            )
+            if result is not None and result[0] in (200, 202, 204):
+                logger.info(f"Succeeded to delete activation key:{key}")
+                return True
+            raise FailException(f"Failed to delete activation key:{key}")
         _, output = self.ssh.runcmd(
             f"hammer activation-key delete --organization-id {self.org_id} --name {key}"
         )
@@ -489,6 +1393,14 @@ class Satellite:
         :param value: the value.
         :return: True or raise Fail.
         """
+        result = self.api_call(
+            "PUT", f"/api/v2/settings/{name}", json_data={"setting": {"value": value}}
+        )
+        if result is not None:
+            if result[0] == 200:
+                logger.info(f"Succeeded to set {name}:{value} for satellite")
+                return True
+            raise FailException(f"Failed to set {name}:{value} for satellite")
         ret, output = self.ssh.runcmd(
             f"hammer settings set --name={name} --value={value}"
         )
@@ -503,13 +1415,24 @@ class Satellite:
         :param guest: guest name
         :param hypervisor: hypervisor host name/uuid/hwuuid
         """
-        host_id = self.host_id(host=hypervisor)
-        guest_id = self.host_id(host=guest)
+        # both the hosts are searched by one query, the ids in the index
+        # are searched again when their pages are not found
+        for refresh in (False, True):
+            ids = self.host_ids([hypervisor, guest], refresh=refresh)
+            host_id, guest_id = ids[hypervisor], ids[guest]
+            if not (host_id and guest_id):
+                break
+            pages = [
+                request_get(url=f"{self.api}/api/v2/hosts/{item}", auth=self.auth)
+                for item in (host_id, guest_id)
+            ]
+            if all(ret != 404 for ret, _ in pages):
+                break
+            satellite_index.discard(host_id)
+            satellite_index.discard(guest_id)
         if host_id and guest_id:
             # Find the guest in hypervisor page
-            ret, output = request_get(
-                url=f"{self.api}/api/v2/hosts/{host_id}", auth=self.auth
-            )
+            ret, output = pages[0]
             if guest.lower() in str(output):
                 logger.info("Succeeded to find the associated guest in hypervisor page")
 
@@ -517,9 +1440,7 @@ class Satellite:
                 logger.warning("Failed to find the associated guest in hypervisor page")
                 return False
             # Find the hypervisor in guest page
-            ret, output = request_get(
-                url=f"{self.api}/api/v2/hosts/{guest_id}", auth=self.auth
-            )
+            ret, output = pages[1]
             if hypervisor.lower() in str(output):
                 logger.info("Succeeded to find the associated hypervisor in guest page")
             else:
@@ -549,7 +1470,16 @@ class Satellite:
         :return: True or raise fail.
         """
         org = org or self.org
-        org_id = self.organization_id(org=org)
+        org_id = self.org_id if org == self.org else self.organization_id(org=org)
+        result = self.api_call(
+            "PUT", f"/katello/api/organizations/{org_id}/simple_content_access/{sca}"
+        )
+        # the endpoints are removed from the satellite only supporting SCA
+        if result is not None and result[0] != 404:
+            if result[0] in (200, 202) and self.task_wait(result[1]):
+                logger.info(f"Succeeded to {sca} SCA for satellite:{org}")
+                return True
+            raise FailException(f"Failed to {sca} SCA for satellite:{org}")
         ret, output = self.ssh.runcmd(
             f"hammer simple-content-access {sca} --organization-id {org_id}"
         )
@@ -560,10 +1490,18 @@ class Satellite:
 
     def facts_get(self, host_id):
         """
-        Get the host facts information by hammer command
+        Get the host facts information
         :param host_id:
         :return: host facts information
         """
+        result = self.api_call(
+            "GET", f"/api/v2/hosts/{host_id}/facts", params={"per_page": 10000}
+        )
+        if result is not None:
+            status, data = result
+            if status != 200 or not isinstance(data, dict):
+                return False
+            return json.dumps(data.get("results") or dict())
         ret, output = self.ssh.runcmd(f"{self.hammer} host facts --id {host_id}")
         if ret:
             return False
@@ -571,6 +1509,209 @@ class Satellite:
             return output
 
 
+# The default settings of the register api sessions, which can be
+# overridden in [http] of virtwho.ini.
+HTTP_SETTINGS = {
+    # seconds to connect and to wait for the response
+    "connect_timeout": 10.0,
+    "read_timeout": 120.0,
+    # retries on the connection errors and the 429/5xx responses of the
+    # idempotent requests, POST is only retried on 429 with Retry-After
+    "retries": 3,
+    # the sleep between retries is backoff * 2 ** (retry - 1) seconds,
+    # the Retry-After header of 429/503 is honored instead when it's sent
+    "backoff": 2.0,
+    # the max connections kept alive to one server
+    "pool_size": 10,
+}
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class RegisterRetry(Retry):
+    """The retry policy of the register api sessions, which is the only
+    layer retrying the requests. The idempotent methods (urllib3's
+    default) are retried on RETRY_STATUS, the others (such as POST
+    creating an org, a key or a consumer) only on 429 with Retry-After,
+    which is refused before being processed, so no duplicate is created.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if not self._is_method_retryable(method):
+            return bool(self.total and status_code == 429 and has_retry_after)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+# the ids in the api paths, which are replaced for the latency counters
+ENDPOINT_ID_RE = re.compile(r"/(?:[0-9a-fA-F-]{32,36}|\d+)(?=/|$)")
+
+JSON_DECODER = json.JSONDecoder()
+
+_sessions = dict()
+_sessions_lock = threading.Lock()
+_latency = dict()
+_latency_lock = threading.Lock()
+
+
+def http_settings():
+    """
+    Get the session settings updated by [http] of virtwho.ini.
+    :return: dict of the settings
+    """
+    data = dict(HTTP_SETTINGS)
+    section = getattr(config, "http", dict())
+    for key, value in data.items():
+        if section.get(key):
+            data[key] = type(value)(section.get(key))
+    return data
+
+
+def http_session(url, auth, verify=False):
+    """
+    Get the session shared by all the requests to the server of the url
+    with the same auth, the connections are kept alive in its pool so
+    the TCP and TLS handshakes are done once per connection. The
+    connection pool of requests/urllib3 is thread-safe, so the session
+    is shared by the threads too.
+    :param url: API URL
+    :param auth: authentication with format (username, password)
+    :param verify: a boolean to control whether we verify the server's
+        TLS certificate
+    :return: requests.Session
+    """
+    server = urlsplit(url)
+    key = (server.scheme, server.netloc, tuple(auth or ()), verify)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            settings = http_settings()
+            retry = RegisterRetry(
+                total=settings["retries"],
+                backoff_factor=settings["backoff"],
+                status_forcelist=RETRY_STATUS,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                max_retries=retry,
+                pool_connections=1,
+                pool_maxsize=settings["pool_size"],
+            )
+            session = requests.Session()
+            session.mount(f"{server.scheme}://", adapter)
+            session.auth = tuple(auth) if auth else None
+            session.verify = verify
+            _sessions[key] = session
+        return session
+
+
+def http_close():
+    """Close all the sessions and their connections."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def http_request(method, url, auth, verify=False, **kwargs):
+    """
+    Send a request by the shared session of the server, and count its
+    latency by the endpoint.
+    :param method: GET, POST, PUT or DELETE
+    :param url: API URL
+    :param auth: authentication with format (username, password)
+    :param verify: a boolean to control whether we verify the server's
+        TLS certificate
+    :param kwargs: the other arguments of requests, such as params
+    :return: requests.Response
+    """
+    settings = http_settings()
+    kwargs.setdefault(
+        "timeout", (settings["connect_timeout"], settings["read_timeout"])
+    )
+    # the session verify is overridden by REQUESTS_CA_BUNDLE, so it's
+    # passed for each request as requests.request() does
+    kwargs.setdefault("verify", verify)
+    session = http_session(url, auth, verify)
+    start = time.monotonic()
+    try:
+        res = session.request(method, url, **kwargs)
+    finally:
+        endpoint = f"{method} {ENDPOINT_ID_RE.sub('/{id}', urlsplit(url).path)}"
+        latency_count(endpoint, time.monotonic() - start)
+    return res
+
+
+def latency_count(endpoint, seconds):
+    """
+    Add a request to the latency counter of an endpoint.
+    :param endpoint: such as 'GET /subscription/consumers/{id}'
+    :param seconds: the latency of the request
+    """
+    with _latency_lock:
+        counter = _latency.setdefault(endpoint, {"count": 0, "total": 0.0, "max": 0.0})
+        counter["count"] += 1
+        counter["total"] += seconds
+        counter["max"] = max(counter["max"], seconds)
+
+
+def http_latency(reset=False):
+    """
+    Get the latency counters of the endpoints.
+    :param reset: clear the counters after getting them
+    :return: dict of {endpoint: {count, total, mean, max}} in seconds
+    """
+    with _latency_lock:
+        data = {
+            endpoint: {
+                "count": counter["count"],
+                "total": round(counter["total"], 3),
+                "mean": round(counter["total"] / counter["count"], 3),
+                "max": round(counter["max"], 3),
+            }
+            for endpoint, counter in _latency.items()
+        }
+        if reset:
+            _latency.clear()
+    return data
+
+
+def json_items(chunks):
+    """
+    Decode the items of a json array one by one from the chunks of a
+    streamed response, only the undecoded rest of the array is buffered.
+    :param chunks: iterable of the bytes chunks
+    :return: generator of the decoded items
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("The response is not a json array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                item, position = JSON_DECODER.raw_decode(buffer, position)
+            except ValueError:
+                # the item is not complete yet
+                break
+            yield item
+        buffer = buffer[position:]
+    raise ValueError("The json array is not complete")
+
+
 def request_get(url, auth, verify=False):
     """Sends a GET request.
     :param url: API URL
@@ -579,7 +1720,7 @@ def request_get(url, auth, verify=False):
         TLS certificate
     :return: response status code and json output.
     """
-    res = requests.get(url=url, auth=auth, verify=verify)
+    res = http_request("GET", url, auth, verify)
     logger.info(f"Making request: GET {url}")
     return res.status_code, res.json()
 
@@ -594,7 +1735,7 @@ def request_post(url, auth, params, verify=False):
         TLS certificate
     :return: response status code
     """
-    res = requests.post(url=url, auth=auth, params=params, verify=verify)
+    res = http_request("POST", url, auth, verify, params=params)
     logger.info(f"Making request: POST {url}")
     return res.status_code
 
@@ -609,9 +1750,7 @@ def request_put(url, auth, headers, json_data, verify=False):
         TLS certificate
     :return: response status code
     """
-    res = requests.put(
-        url=url, auth=auth, headers=headers, json=json_data, verify=verify
-    )
+    res = http_request("PUT", url, auth, verify, headers=headers, json=json_data)
     logger.info(f"Making request: PUT {url}")
     return res.status_code
 
@@ -624,6 +1763,6 @@ def request_delete(url, auth, verify=False):
         TLS certificate
     :return: response status code
     """
-    res = requests.delete(url=url, auth=auth, verify=verify)
+    res = http_request("DELETE", url, auth, verify)
     logger.info(f"Making request: DELETE {url}")
     return res.status_code
@@ -0,0 +1,854 @@
+"""Follow and analyze the rhsm.log of the virt-who host.
+
+This module only depends on the python standard library (python>=3.6),
+so it can be used on the test controller and on the virt-who host as
+well. It's uploaded to the virt-who host and run as an analysis agent,
+which waits for virt-who and prints the analyzer data as compact json:
+
+    # python3 rhsmlog.py --wait 450 --prefix /subscription --with-log-on-failure
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from array import array
+from itertools import accumulate
+
+logger = logging.getLogger(__name__)
+
+RHSM_LOG_FILE = "/var/log/rhsm/rhsm.log"
+
+# 2023-06-13 04:33:37,164 [virtwho.main DEBUG] MainProcess(26434):MainThread
+# @executor.py:send_report:110 - message
+HEADER_RE = re.compile(r"(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d[,.]?\d*) \[([^\]]*)\] ?(.*)")
+SOURCE_RE = re.compile(r"\S+\(\d+\):(\S+) @\S+ - (.*)")
+REPORTER_ID_RE = re.compile(r"reporter_id='(.*?)'")
+INTERVAL_RE = re.compile(r"Starting infinite loop with(.*?)seconds interval")
+REPORT_RE = re.compile(r'Report for config "(.*?)" gathered, placing in datastore')
+RESPONSE_RE = re.compile(r'Response: status=(20\d).*requestUuid.*request="(\w+) (\S+)')
+MAPPING_RE = re.compile(r"Host-to-guest mapping being sent to '(.*?)'")
+SERVER_500_RE = re.compile(
+    r"RemoteServerException: Server error attempting a GET.*returned status 500"
+)
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+JSON_DECODER = json.JSONDecoder(strict=False)
+
+
+class RhsmLogFollower:
+    """Fetch the rhsm.log incrementally instead of reading the whole file
+    again and again. The byte offset and the inode of the file are
+    remembered, only the newly appended bytes are transferred. File
+    truncation (such as 'truncate -s 0') and rotation (a new inode) are
+    detected on the remote side in the same command.
+
+    The fetched lines are parsed on the fly to self.parsed (RhsmLog).
+
+    Usage:
+        follower = RhsmLogFollower(ssh)
+        new_log = follower.poll()
+        whole_log = follower.text
+        errors = follower.parsed.errors
+    """
+
+    def __init__(self, ssh, log_file=RHSM_LOG_FILE):
+        """
+        :param ssh: ssh access of the virt-who host.
+        :param log_file: the log file to follow.
+        """
+        self.ssh = ssh
+        self.log_file = log_file
+        self.inode = None
+        self.offset = 0
+        self._partial = b""
+        self.parsed = RhsmLog()
+        self.exited = False
+
+    def reset(self, offset=0, inode=None):
+        """
+        Drop the accumulated log and start following from the offset.
+        :param offset: byte offset to start from.
+        :param inode: inode of the log file, None means unknown.
+        """
+        self.offset = offset
+        self.inode = inode
+        self._partial = b""
+        self.parsed = RhsmLog()
+
+    @property
+    def text(self):
+        """All the complete lines fetched since the last reset."""
+        return self.parsed.content
+
+    def poll(self):
+        """
+        Fetch the bytes appended since the last poll by one ssh command.
+        The content is read from the beginning when the file is rotated
+        (inode changed) or truncated (size smaller than the offset).
+        :return: the new complete lines, an uncompleted last line is kept
+            until it's finished.
+        """
+        inode = self.inode or ""
+        cmd = (
+            f"f={self.log_file}; "
+            f"i=$(stat -c %i $f) && s=$(stat -c %s $f) || exit 1; "
+            f'echo "$i $s"; '
+            f'if [ -z "{inode}" -o "$i" = "{inode}" ] && [ "$s" -ge {self.offset} ]; '
+            f"then tail -c +{self.offset + 1} $f; else cat $f; fi"
+        )
+        ret, output = self.ssh.runcmd(cmd, raw=True)
+        if ret != 0 or not output:
+            return ""
+        header, _, data = output.partition(b"\n")
+        inode, size = header.decode().split()
+        size = int(size)
+        same_file = self.inode is None or inode == self.inode
+        if not same_file:
+            logger.info(f"{self.log_file} is rotated, read the new file")
+            self.offset = 0
+            self._partial = b""
+        elif size < self.offset:
+            logger.info(f"{self.log_file} is truncated, read it again")
+            self.reset()
+        self.inode = inode
+        self.offset += len(data)
+        return self.feed(data)
+
+    def feed(self, data):
+        """
+        Append the raw bytes read from the log file.
+        :param data: bytes following the current content.
+        :return: the new complete lines
+        """
+        data = self._partial + data
+        end = data.rfind(b"\n") + 1
+        self._partial = data[end:]
+        if not end:
+            return ""
+        new_log = data[:end].decode("utf-8", errors="replace")
+        self.parsed.feed(new_log)
+        return new_log
+
+    def stream(self, process="virt-who", timeout=450, grace=10):
+        """
+        Follow the log by one long-lived 'tail -F' channel instead of
+        polling, together with a watch of the process on the remote
+        side. The generator ends when the process exits, and sets
+        self.exited to True. The consumer can stop it at any time, the
+        remote commands are terminated when the channel is closed.
+        :param process: the process name to watch.
+        :param timeout: seconds to follow the log at most.
+        :param grace: seconds to wait for the process to show up.
+        :return: generator of the new complete lines
+        """
+        self.exited = False
+        marker = f"{process}-exited"
+        cmd = (
+            f"f={self.log_file}; "
+            f"tail -c +{self.offset + 1} -F $f 2>/dev/null & t=$!; "
+            f"trap 'kill $t 2>/dev/null' EXIT; "
+            f"trap 'exit 1' PIPE HUP TERM; "
+            f"seen=0; n=0; "
+            f"while [ $n -lt {int(timeout * 5)} ]; do "
+            f"if pgrep -x {process} >/dev/null; then seen=1; "
+            f"elif [ $seen = 1 ] || [ $n -ge {int(grace * 5)} ]; then "
+            f"sleep 1; echo {marker} >&2; break; fi; "
+            f"printf . >&2; n=$((n+1)); sleep 0.2; done"
+        )
+        channel = self.ssh.open_channel(cmd)
+        channel.settimeout(0.5)
+        stderr = b""
+        deadline = time.time() + timeout + 5
+        try:
+            while time.time() < deadline:
+                try:
+                    data = channel.recv(65536)
+                except socket.timeout:
+                    data = None
+                while channel.recv_stderr_ready():
+                    stderr = stderr[-64:] + channel.recv_stderr(4096)
+                if data == b"":
+                    break
+                if data:
+                    self.offset += len(data)
+                    new_log = self.feed(data)
+                    if new_log:
+                        yield new_log
+            self.exited = marker.encode() in stderr
+        finally:
+            channel.close()
+
+
+class LogEvent:
+    """One record of rhsm.log, the lines not starting with a timestamp
+    (such as json blocks and tracebacks) belong to the previous record.
+    """
+
+    __slots__ = ("timestamp", "level", "logger", "thread", "message", "start", "end")
+
+    def __init__(self, timestamp, level, logger, thread, message, start):
+        self.timestamp = timestamp
+        self.level = level
+        self.logger = logger
+        self.thread = thread
+        self.message = message
+        self.start = start
+        self.end = start + 1
+
+    @property
+    def seconds(self):
+        """The time of the day in seconds."""
+        h, m, s = self.timestamp[11:19].split(":")
+        return int(h) * 3600 + int(m) * 60 + int(s)
+
+    @property
+    def time(self):
+        """The time of the day in seconds, including the milliseconds."""
+        fraction = self.timestamp[20:]
+        return self.seconds + (float(f"0.{fraction}") if fraction.isdigit() else 0)
+
+
+class RhsmLog:
+    """Parse rhsm.log into LogEvent records in one pass and index all the
+    messages needed by the analyzer, so any analyzer field is computed
+    without scanning the log again. The log can be fed incrementally by
+    complete lines.
+
+    The log is retained once as its fed text plus the start offset of
+    every line (8 bytes per line), the text of an event and its json
+    block are located by the offsets instead of keeping a list of lines.
+
+    Usage:
+        log = RhsmLog(rhsm_log)
+        log.feed(new_log)
+        log.send_number(prefix="/subscription")
+    """
+
+    def __init__(self, text=""):
+        """
+        :param text: the content of rhsm.log
+        """
+        self._chunks = list()
+        self._offsets = array("q", [0])
+        self.events = list()
+        self.debug = False
+        self.connection_debug = False
+        self.oneshot = 0
+        self.terminate = 0
+        self.reporter_id = None
+        self.interval = None
+        self.reports = list()
+        self.responses = list()
+        self.mapping_events = list()
+        self.domain_events = list()
+        self.errors = list()
+        self.warnings = list()
+        self.status_429 = False
+        self.status_500 = False
+        self.empty_report = 0
+        self.remote_sends = 0
+        self.local_sends = 0
+        self.feed(text)
+
+    def feed(self, text):
+        """
+        Parse the complete lines appended to the log.
+        :param text: new lines of rhsm.log
+        """
+        if not text:
+            return
+        if not text.endswith("\n"):
+            text += "\n"
+        self._chunks.append(text)
+        lines = text.split("\n")[:-1]
+        start = len(self._offsets) - 1
+        position = self._offsets[-1]
+        self._offsets.extend(
+            position + offset for offset in accumulate(len(line) + 1 for line in lines)
+        )
+        event = self.events[-1] if self.events else None
+        for index, line in enumerate(lines, start):
+            if "status=429" in line:
+                self.status_429 = True
+            match = HEADER_RE.match(line) if line[:2].isdigit() else None
+            if match is None:
+                if event is not None:
+                    event.end = index + 1
+                continue
+            event = self._event(match, index)
+            self.events.append(event)
+            self._index(event, len(self.events) - 1)
+
+    @staticmethod
+    def _event(match, index):
+        """Create the LogEvent from the matched header line."""
+        timestamp, tag, rest = match.groups()
+        names = tag.split()
+        level = ""
+        if names and names[-1] in LEVELS:
+            level = names.pop()
+        thread = ""
+        source = SOURCE_RE.match(rest)
+        if source:
+            thread, rest = source.groups()
+        return LogEvent(timestamp, level, " ".join(names), thread, rest, index)
+
+    def _index(self, event, position):
+        """Record the event to the indexes by its level and message."""
+        message = event.message
+        if event.level == "DEBUG":
+            self.debug = True
+            if event.logger in ("virtwho.main", "rhsm.connection"):
+                self.connection_debug = True
+        elif event.level == "ERROR":
+            self.errors.append(event)
+        elif event.level == "WARNING":
+            self.warnings.append(event)
+        if "stopped after running once" in message:
+            self.oneshot += 1
+        elif "virt-who terminated" in message:
+            self.terminate += 1
+        elif "Report for config" in message:
+            report = REPORT_RE.search(message)
+            if report:
+                self.reports.append((report.group(1), event))
+        elif "Response: status=20" in message:
+            response = RESPONSE_RE.search(message)
+            if response:
+                self.responses.append(response.groups())
+        elif "Host-to-guest mapping being sent to" in message:
+            mapping = MAPPING_RE.search(message)
+            if mapping:
+                self.mapping_events.append((mapping.group(1), position))
+        elif "Domain info:" in message:
+            self.domain_events.append(position)
+        elif "0 hypervisors and 0 guests found" in message:
+            self.empty_report += 1
+        elif "Sending updated Host-to-guest mapping to" in message:
+            self.remote_sends += 1
+        elif "Sending update in guests lists for config" in message:
+            self.local_sends += 1
+        elif "RemoteServerException" in message and SERVER_500_RE.search(message):
+            self.status_500 = True
+        if self.reporter_id is None and "reporter_id=" in message:
+            reporter_id = REPORTER_ID_RE.search(message)
+            if reporter_id:
+                self.reporter_id = reporter_id.group(1).strip()
+        if self.interval is None and "Starting infinite loop" in message:
+            interval = INTERVAL_RE.search(message)
+            if interval:
+                self.interval = int(interval.group(1).strip())
+
+    @property
+    def content(self):
+        """All the text fed to the log."""
+        if not self._chunks:
+            return ""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0]
+
+    def span(self, start, end):
+        """
+        Get the offsets of the lines in self.content.
+        :param start: the index of the first line
+        :param end: the index after the last line
+        :return: (start offset, end offset) without the last newline
+        """
+        return self._offsets[start], self._offsets[end] - 1
+
+    def text(self, event):
+        """
+        Get the full text of an event, including the following lines.
+        :param event: LogEvent
+        """
+        start, end = self.span(event.start, event.end)
+        return self.content[start:end]
+
+    def send_number(self, prefix=None, local=False):
+        """
+        Calculate virt-who mappings report number.
+        :param prefix: the api prefix of the register server, such as
+            /subscription and /rhsm, which is used in debug mode.
+        :param local: True for the local libvirt mode.
+        :return: virt-who report times
+        """
+        if self.empty_report:
+            return self.empty_report
+        if self.connection_debug:
+            if not prefix:
+                return 0
+            requests = [("PUT", f"{prefix}/consumers")]
+            if not local:
+                requests.append(("POST", f"{prefix}/hypervisors"))
+            for method, path in requests:
+                hits = [
+                    item
+                    for item in self.responses
+                    if item[1] == method and item[2].startswith(path)
+                ]
+                if hits:
+                    return len(hits)
+            return 0
+        if local:
+            return self.local_sends
+        return self.remote_sends
+
+    def loop_info(self, config=None):
+        """
+        Calculate the loop number and the loop interval time by the
+        reports of a config.
+        :param config: the config (section) name, default to the first
+            reported config.
+        :return: loop interval time (-1 when no loop) and loop number
+        """
+        if not self.reports:
+            return -1, 0
+        if config is None:
+            config = self.reports[0][0]
+        events = [event for name, event in self.reports if name == config]
+        loop_time = -1
+        if len(events) > 1:
+            loop_time = events[1].seconds - events[0].seconds
+        return loop_time, max(len(events) - 1, 0)
+
+    def error_warning(self, level="ERROR", context=20, config=None):
+        """
+        Get the number of error/warning records and the text of them,
+        including the following lines as 'grep -A' does, so the
+        multiline tracebacks are included.
+        :param level: ERROR or WARNING
+        :param context: the number of following lines to include
+        :param config: only the records of this config, see config_events()
+        :return: (number, text)
+        """
+        events = self.errors if level.upper() == "ERROR" else self.warnings
+        if config is not None:
+            events = self.config_events(config, events)
+        blocks = list()
+        last_end = -1
+        for event in events:
+            start = max(event.start, last_end)
+            end = min(event.start + context + 1, len(self._offsets) - 1)
+            if blocks and start > last_end:
+                blocks.append("--")
+            if start < end:
+                begin, stop = self.span(start, end)
+                blocks.append(self.content[begin:stop])
+            last_end = max(last_end, end)
+        text = "\n".join(blocks) + "\n" if blocks else ""
+        return len(events), text
+
+    def config_threads(self):
+        """
+        Get the threads of each config by its 'Report for config' records,
+        virt-who runs the configs of /etc/virt-who.d in separate threads.
+        :return: dict of {config: [thread]} in the order of the first report
+        """
+        threads = dict()
+        for name, event in self.reports:
+            config_threads = threads.setdefault(name, list())
+            if event.thread and event.thread not in config_threads:
+                config_threads.append(event.thread)
+        return threads
+
+    def config_events(self, name, events):
+        """
+        Filter the events of a config, which are logged by the threads of
+        the config or mention the config as "name" or [name].
+        :param name: the config (section) name
+        :param events: list of LogEvent, such as self.errors
+        :return: list of LogEvent
+        """
+        threads = set(self.config_threads().get(name, ())) - {"MainThread"}
+        marks = (f'"{name}"', f"[{name}]")
+        return [
+            event
+            for event in events
+            if event.thread in threads or any(mark in event.message for mark in marks)
+        ]
+
+    def payload(self, position, opener="{"):
+        """
+        Decode the json block printed by the event, such as the mapping
+        sent to the register server. The block is decoded in place from
+        its offset in self.content, the event text is not copied.
+        :param position: the position of the event in self.events
+        :param opener: '{' for a dict and '[' for a list
+        :return: the decoded json or None
+        """
+        event = self.events[position]
+        content = self.content
+        start, end = self.span(event.start, event.end)
+        colon = content.find(": ", start, end)
+        index = content.find(opener, colon + 2 if colon >= 0 else start, end)
+        if index < 0:
+            return None
+        try:
+            block, stop = JSON_DECODER.raw_decode(content, index)
+        except ValueError:
+            block, stop = None, None
+        if stop is None or stop > end:
+            logger.warning("Failed to decode the json block of rhsm.log")
+            return None
+        return block
+
+    def mapping_payloads(self):
+        """
+        Decode the last mapping sent to each organization, the earlier
+        mappings of the same organization are not decoded at all.
+        :return: dict of {org: mapping}, in the order of the last send.
+        """
+        last = dict()
+        for org, position in self.mapping_events:
+            last.pop(org, None)
+            last[org] = position
+        return {org: self.payload(position) for org, position in last.items()}
+
+    def domain_payload(self):
+        """
+        Decode the guests of the local mode printed by 'Domain info:'.
+        :return: list of guests or None
+        """
+        if not self.domain_events:
+            return None
+        return self.payload(self.domain_events[0], opener="[")
+
+    def finished(self, prefix=None, local=False, exited=False, until_exit=False):
+        """
+        Check if virt-who is finished according to the log.
+        :param prefix: the api prefix of the register server
+        :param local: True for the local libvirt mode.
+        :param exited: True when the virt-who process is not alive.
+        :param until_exit: True to ignore the errors and the sends, such
+            as running many configs once, which are reported one by one.
+        :return: the reason ('429', 'exited', 'error' or 'sent'), or None
+            when virt-who is still running.
+        """
+        if self.status_429:
+            return "429"
+        if exited:
+            return "exited"
+        if until_exit:
+            return None
+        if self.errors:
+            return "error"
+        if self.send_number(prefix, local) > 0:
+            return "sent"
+        return None
+
+
+def analyze(log, prefix=None, local=False, owners=None):
+    """
+    Get all the data needed by the analyzer from the parsed log, the
+    mappings are kept as the decoded json sent to each org. The data of
+    each reported config is under "configs", see analyze_config().
+    :param log: RhsmLog
+    :param prefix: the api prefix of the register server
+    :param local: True for the local libvirt mode.
+    :param owners: dict of {config: owner}, see config_owners(), which
+        is needed to split the mappings when many configs are reported.
+    :return: dict which can be dumped to json
+    """
+    owners = owners or dict()
+    loop, loop_num = log.loop_info()
+    error, error_msg = log.error_warning("ERROR")
+    warning, warning_msg = log.error_warning("WARNING")
+    return {
+        "debug": log.debug,
+        "oneshot": log.oneshot > 0,
+        "terminate": log.terminate > 0,
+        "send": log.send_number(prefix, local),
+        "reporter_id": log.reporter_id,
+        "interval": log.interval,
+        "config": log.reports[0][0] if log.reports else None,
+        "loop": loop,
+        "loop_num": loop_num,
+        "error": error,
+        "error_msg": error_msg,
+        "warning": warning,
+        "warning_msg": warning_msg,
+        "status_429": log.status_429,
+        "status_500": log.status_500,
+        "orgs": [org for org, _ in log.mapping_events],
+        "mappings": log.mapping_payloads(),
+        "domains": log.domain_payload(),
+        "configs": {
+            name: analyze_config(log, name, owners.get(name), prefix, local)
+            for name in log.config_threads()
+        },
+    }
+
+
+def config_owners(text):
+    """
+    Get the owner of each config section from the content of the config
+    files, such as 'cat /etc/virt-who.d/*.conf'.
+    :param text: the content of the config files
+    :return: dict of {config: owner}
+    """
+    owners = dict()
+    section = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1].strip()
+            continue
+        option, _, value = line.partition("=")
+        if section and option.strip() == "owner" and value.strip():
+            owners[section] = value.strip()
+    return owners
+
+
+def analyze_config(log, name, org=None, prefix=None, local=False):
+    """
+    Get the analyzer data of one config from the log of a virt-who run
+    with many configs. The errors and warnings are attributed to the
+    config by its threads and its name, the mappings are the ones sent to
+    the owner of the config. The configs with the same owner are sent
+    together by virt-who, so they share the same mappings and send number.
+    :param log: RhsmLog
+    :param name: the config (section) name
+    :param org: the owner of the config, all the orgs when not provided
+    :param prefix: the api prefix of the register server
+    :param local: True for the local libvirt mode.
+    :return: dict which can be dumped to json
+    """
+    reports = [event for config, event in log.reports if config == name]
+    loop, loop_num = log.loop_info(name)
+    error, error_msg = log.error_warning("ERROR", config=name)
+    warning, warning_msg = log.error_warning("WARNING", config=name)
+    payloads = log.mapping_payloads()
+    if org is not None:
+        payloads = {org: payloads[org]} if org in payloads else dict()
+    if not reports:
+        send = 0
+    elif org is not None and log.mapping_events:
+        send = sum(1 for item, _ in log.mapping_events if item == org)
+    else:
+        send = log.send_number(prefix, local)
+    return {
+        "reports": len(reports),
+        "threads": log.config_threads().get(name, list()),
+        "send": send,
+        "loop": loop,
+        "loop_num": loop_num,
+        "error": error,
+        "error_msg": error_msg,
+        "warning": warning,
+        "warning_msg": warning_msg,
+        "orgs": list(payloads),
+        "mappings": payloads,
+        "domains": log.domain_payload() if reports else None,
+    }
+
+
+class SegmentIndex:
+    """Local index of the rhsm.log segment written by each virt-who run,
+    so the log is never truncated and any past run can be pulled later
+    by its byte range. The index is a json-lines file, a record is
+    updated by appending a newer line of the same run.
+
+    Usage:
+        index = SegmentIndex(path)
+        run = index.start(host, log_file, inode, offset)
+        index.update(run, end=offset)
+        index.get(run)
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the local index file
+        """
+        self.path = path
+
+    def records(self):
+        """
+        Read all the runs, the last line of a run wins.
+        :return: dict of {run: record} in the order of the runs
+        """
+        records = dict()
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records.setdefault(record["run"], dict()).update(record)
+        return records
+
+    def get(self, run=None):
+        """
+        Get the record of a run.
+        :param run: the run id, default to the last run.
+        :return: dict or None
+        """
+        records = self.records()
+        if run is None:
+            return list(records.values())[-1] if records else None
+        return records.get(run)
+
+    def start(self, host, log_file, inode, offset, test=""):
+        """
+        Record the start marker of a new run.
+        :param host: the virt-who host
+        :param log_file: the followed log file
+        :param inode: inode of the log file
+        :param offset: byte offset where the run starts
+        :param test: the test case running virt-who
+        :return: the run id
+        """
+        run = f"{int(time.time() * 1000)}"
+        self.update(
+            run,
+            host=host,
+            file=log_file,
+            inode=inode,
+            start=offset,
+            end=None,
+            time=time.strftime("%Y-%m-%d %H:%M:%S"),
+            test=test,
+        )
+        return run
+
+    def update(self, run, **record):
+        """
+        Update the record of a run by appending one line.
+        :param run: the run id
+        """
+        record["run"] = run
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+class LocalShell:
+    """Run the commands on the local host with the same interface as
+    SSHConnect.runcmd(), so RhsmLogFollower also works on the virt-who
+    host itself."""
+
+    def runcmd(self, cmd, if_stdout=False, log_print=True, timeout=None, raw=False):
+        process = subprocess.Popen(
+            cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = process.communicate(timeout=timeout)
+        if raw:
+            return process.returncode, stdout
+        if if_stdout or not stderr:
+            return process.returncode, stdout.decode()
+        return process.returncode, stderr.decode()
+
+
+def agent(args):
+    """
+    Wait for virt-who on the virt-who host and print the analyzer data
+    in one line of json.
+    """
+    shell = LocalShell()
+    follower = RhsmLogFollower(shell, args.log)
+    follower.reset(args.offset, args.inode)
+    start = time.time()
+    seen = False
+    while True:
+        follower.poll()
+        _, output = shell.runcmd(f"pgrep -c -x {args.process}", if_stdout=True)
+        thread = int(output.strip() or 0)
+        seen = seen or thread > 0
+        exited = thread == 0 and (seen or time.time() - start >= args.grace)
+        reason = follower.parsed.finished(
+            args.prefix, args.local, exited, args.until_exit
+        )
+        if reason or time.time() - start >= args.wait:
+            break
+        time.sleep(args.interval)
+    owners = None
+    if len(follower.parsed.config_threads()) > 1:
+        _, output = shell.runcmd(
+            f"cat {args.config_dir}/*.conf 2>/dev/null", if_stdout=True
+        )
+        owners = config_owners(output)
+    report = analyze(follower.parsed, args.prefix, args.local, owners)
+    report["thread"] = thread
+    report["finished"] = reason
+    report["offset"] = follower.offset
+    report["inode"] = follower.inode
+    failed = reason in (None, "error") or report["error"] > 0
+    if args.with_log or (args.with_log_on_failure and failed):
+        report["log"] = base64.b64encode(
+            zlib.compress(follower.text.encode("utf-8"))
+        ).decode()
+    sys.stdout.write(json.dumps(report, separators=(",", ":")) + "\n")
+
+
+def arguments_parser():
+    """
+    Parse and convert the arguments from command line to parameters
+    for function using, and generate help and usage messages for
+    each arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log", default=RHSM_LOG_FILE, help="The rhsm.log path")
+    parser.add_argument(
+        "--offset", type=int, default=0, help="The byte offset to analyze from"
+    )
+    parser.add_argument("--inode", default=None, help="The inode of the log")
+    parser.add_argument(
+        "--prefix",
+        default=None,
+        help="The api prefix of the register server, /subscription or /rhsm",
+    )
+    parser.add_argument(
+        "--local", action="store_true", help="Analyze for the local libvirt mode"
+    )
+    parser.add_argument("--process", default="virt-who", help="The process to wait")
+    parser.add_argument(
+        "--config-dir",
+        default="/etc/virt-who.d",
+        help="The directory of the virt-who configs, to get their owners",
+    )
+    parser.add_argument(
+        "--wait",
+        type=int,
+        default=0,
+        help="Seconds to wait for virt-who to finish, default to analyze at once",
+    )
+    parser.add_argument(
+        "--grace",
+        type=int,
+        default=10,
+        help="Seconds to wait for the process to show up",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0.5, help="Seconds between two checks"
+    )
+    parser.add_argument(
+        "--until-exit",
+        action="store_true",
+        help="Wait for the process to exit even after errors or sends",
+    )
+    parser.add_argument(
+        "--with-log",
+        action="store_true",
+        help="Attach the log to the output, compressed and base64 encoded",
+    )
+    parser.add_argument(
+        "--with-log-on-failure",
+        action="store_true",
+        help="Attach the log only when virt-who failed or is not finished",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    agent(arguments_parser())
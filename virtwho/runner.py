@@ -1,14 +1,51 @@
+import base64
+import hashlib
 import json
-import re
+import os
 import threading
 import time
+import zlib
 from virtwho import logger, FailException, PRINT_JSON_FILE, HYPERVISOR
-from virtwho.base import msg_search
+from virtwho import rhsmlog
+from virtwho.base import wait_until
 from virtwho.configure import virtwho_ssh_connect, get_hypervisor_handler
+from virtwho.configure import get_register_handler
+from virtwho.mapping import Mappings
+from virtwho.rhsmlog import RhsmLog, RhsmLogFollower, SegmentIndex, analyze
+from virtwho.settings import TEMP_DIR
+
+# The analysis agent (virtwho/rhsmlog.py) uploaded to each virt-who
+# host in this session, as {(host, port): remote_file}.
+AGENT_UPLOADED = dict()
+
+
+class AnalyzerData(dict):
+    """The analyzer data dict. The rhsm.log analyzed on the virt-who host
+    by the analysis agent is not shipped back with its report, it's only
+    fetched when data["log"] is read."""
+
+    def __init__(self, log_get=None):
+        """
+        :param log_get: callable returning the analyzed rhsm.log
+        """
+        super().__init__()
+        self.log_get = log_get
+
+    def __missing__(self, key):
+        if key != "log" or self.log_get is None:
+            raise KeyError(key)
+        self["log"] = self.log_get()
+        return self["log"]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
 
 
 class VirtwhoRunner:
-    def __init__(self, mode, register_type):
+    def __init__(self, mode, register_type, stream=True, agent=False, fuzzy=False):
         """
         - self.config_file is used to define virt-who configuration.
         - self.print_json_file is used to store the json created by
@@ -16,13 +53,35 @@ class VirtwhoRunner:
 
         :param mode: the hypervisor mode.
             (esx, hyperv, rhevm, libvirt, kubevirt, local, fake)
-        :param register_type: the subscription server. (rhsm, satellite)
+        :param register_type: the subscription server. (rhsm, satellite, standin)
+        :param stream: follow rhsm.log by a long-lived 'tail -F' channel
+            and return once virt-who is finished, or poll it every 5
+            seconds when set False.
+        :param agent: wait for virt-who and analyze rhsm.log on the
+            virt-who host by the uploaded virtwho/rhsmlog.py, which
+            returns all the analyzer data in one ssh round trip.
+        :param fuzzy: match the uuids of the analyzed mappings case
+            insensitively and byte-swapped, see virtwho.mapping.
         """
         self.mode = mode
+        self.stream = stream
         self.register_type = register_type
         self.config_file = f"/etc/virt-who.d/{self.mode}.conf"
         self.rhsm_log_file = "/var/log/rhsm/rhsm.log"
         self.ssh = virtwho_ssh_connect(self.mode)
+        self.log = RhsmLogFollower(self.ssh, self.rhsm_log_file)
+        self.agent = agent
+        self.fuzzy = fuzzy
+        # Wait for virt-who to exit even after errors or sends, such as
+        # running many configs once, see run_until_exit().
+        self.until_exit = False
+        self.report = None
+        self.report_log = None
+        self.report_log_get = None
+        self.process_seen = False
+        self.process_since = time.monotonic()
+        self.segments = SegmentIndex(os.path.join(TEMP_DIR, "rhsm_log_segments.jsonl"))
+        self.segment = None
 
     def run_cli(
         self,
@@ -103,31 +162,78 @@ class VirtwhoRunner:
             interval_time: check the interval time by keywords
             loop: calculate the actual interval time
             loop_num: calculate virt-who loop number
-            mappings: get the host-to-guest mappings
+            mappings: get the host-to-guest mappings (Mappings)
             print_json: get the json output after by print function
             error: check the line number of error
             error_msg: get all error lines
             warning: check the line number of warning
             warning_msg: get all warning lines
+            configs: the above data of each config section, when many
+                configs run together, see config_result()
         """
-        data = dict()
-        data["debug"] = msg_search(rhsm_log, "\\[.*DEBUG\\]")
-        data["oneshot"] = msg_search(rhsm_log, "Thread '.*' stopped after running once")
-        data["terminate"] = msg_search(rhsm_log, "virt-who terminated")
-        data["thread"] = self.thread_number()
-        data["send"] = self.send_number(rhsm_log)
-        data["reporter_id"] = self.reporter_id(rhsm_log)
-        data["interval"] = self.interval_time(rhsm_log)
-        data["loop"], data["loop_num"] = self.loop_info()
-        data["mappings"] = self.mappings(rhsm_log)
+        report = self.log_report(rhsm_log)
+        if isinstance(rhsm_log, dict) and rhsm_log is self.report:
+            data = AnalyzerData(self.report_log_get)
+        else:
+            data = dict()
+        for key in (
+            "debug",
+            "oneshot",
+            "terminate",
+            "send",
+            "reporter_id",
+            "interval",
+            "loop",
+            "loop_num",
+        ):
+            data[key] = report[key]
+        if "thread" in report:
+            data["thread"] = report["thread"]
+        else:
+            data["thread"] = self.thread_number()
+        data["mappings"] = self.mappings(report)
         data["print_json"] = self.print_json(cli)
-        data["error"], data["error_msg"] = self.error_warning("error")
-        data["warning"], data["warning_msg"] = self.error_warning("warning")
+        for key in ("error", "error_msg", "warning", "warning_msg"):
+            data[key] = report[key]
         if HYPERVISOR != "local":
             data["hypervisor_id"] = self.hypervisor_id(data["mappings"])
+        data["configs"] = {
+            name: self.config_result(config_report)
+            for name, config_report in report.get("configs", dict()).items()
+        }
         # The below line is used to local debug.
         # logger.info(f'Got the data after run virt-who:-----\n{data}\n------')
-        data["log"] = rhsm_log
+        if not isinstance(data, AnalyzerData):
+            data["log"] = rhsm_log
+        return data
+
+    def config_result(self, config_report):
+        """
+        Convert the data of one config to the analyzer style.
+        :param config_report: dict of rhsmlog.analyze_config()
+        :return: a dict including below keys.
+            reports: the number of the reports of the config
+            threads: the virt-who threads running the config
+            send, loop, loop_num, error, error_msg, warning, warning_msg,
+            mappings and hypervisor_id: the same as analyzer() but only
+                for the config.
+        """
+        data = dict()
+        for key in (
+            "reports",
+            "threads",
+            "send",
+            "loop",
+            "loop_num",
+            "error",
+            "error_msg",
+            "warning",
+            "warning_msg",
+        ):
+            data[key] = config_report[key]
+        data["mappings"] = self.mappings(config_report)
+        if HYPERVISOR != "local":
+            data["hypervisor_id"] = self.hypervisor_id(data["mappings"])
         return data
 
     def associate_in_mapping(self, result_data, org, hypervisor, guest):
@@ -139,8 +245,7 @@ class VirtwhoRunner:
         :param hypervisor: hypervisor host name/uuid/hwuuid
         """
         mappings = result_data["mappings"]
-        hypervisor_in_mappings = mappings[org][guest]["guest_hypervisor"]
-        if hypervisor_in_mappings == hypervisor:
+        if mappings.associated(hypervisor, guest, org):
             logger.info("Host and guest is associated correctly in mapping.")
             return True
         logger.error("Host and guest is not associated in mapping.")
@@ -157,7 +262,8 @@ class VirtwhoRunner:
         """
         for i in range(4):
             rhsm_output = self.thread_start(cli, wait)
-            if msg_search(rhsm_output, "status=429"):
+            report = self.log_report(rhsm_output)
+            if report["status_429"]:
                 wait_time = 60 * (i + 3)
                 logger.warning(
                     f"429 code found, re-register virt-who host and try again "
@@ -165,11 +271,7 @@ class VirtwhoRunner:
                 )
                 # self.re_register() need to be defined here later
                 time.sleep(wait_time)
-            elif msg_search(
-                rhsm_output,
-                "RemoteServerException: Server error "
-                "attempting a GET.*returned status 500",
-            ):
+            elif report["status_500"]:
                 logger.warning(
                     "RemoteServerException return 500 code, restart "
                     "virt-who again after 30s"
@@ -180,6 +282,21 @@ class VirtwhoRunner:
                 return result_data
         raise FailException("Failed to run virt-who service.")
 
+    def run_until_exit(self, cli):
+        """
+        Run virt-who by command line and analyze the result after it
+        exits, even after the first send or error, such as running many
+        configs once or a large fake inventory.
+        :param cli: the command to run virt-who once, such as
+            "virt-who -d -o -c /etc/virt-who.d/fake.conf"
+        :return: analyzer data dict
+        """
+        self.until_exit = True
+        try:
+            return self.run_start(cli=cli)
+        finally:
+            self.until_exit = False
+
     def thread_start(self, cli, wait=0):
         """
         Start virt-who in a sub-thread (t1), analyze and get rhsm log in
@@ -188,13 +305,13 @@ class VirtwhoRunner:
         :param cli: the command to run virt-who, such as "virt-who -d -o",
             will start virt-who by service when no cli configured.
         :param wait: wait time after run virt-who
-        :return: output of rhsm log
+        :return: output of rhsm log, or the report of the analysis agent
+            when the log is not shipped back, see agent_get().
         """
-        self.stop()
-        self.log_clean()
+        self.reset()
         t1 = threading.Thread(target=self.start, args=(None, cli), daemon=True)
         t1.start()
-        rhsm_ouput = self.rhsm_log_get(wait)
+        rhsm_ouput = self.rhsm_log_get(wait, with_log=False)
         return rhsm_ouput
 
     def start(self, _unused=None, cli=None):
@@ -212,9 +329,75 @@ class VirtwhoRunner:
 
     def stop(self):
         """Stop virt-who service and then kill the pid"""
-        self.operate_service("virt-who", "stop")
-        if self.kill_pid("virt-who") is False:
+        self.reset(clean_log=False)
+
+    def reset(self, clean_log=True, timeout=30):
+        """
+        Stop virt-who service, kill the pid and clean the rhsm log by one
+        remote script. The script waits for the unit to be inactive by
+        polling its ActiveState every 0.1 second instead of sleeping a
+        fixed time.
+        :param clean_log: start a new log segment when set True, see
+            log_clean().
+        :param timeout: seconds to wait for the unit to be inactive.
+        :return: a dict including below keys.
+            state: the ActiveState of virt-who.service after stopping
+            wait: seconds waited for the unit to be inactive
+            killed: if any virt-who process is killed by pkill
+            alive: the virt-who process number after reset
+            log_inode: the inode of rhsm.log
+            log_size: the size of rhsm.log
+        """
+        name = "virt-who"
+        cmd = (
+            f"t0=$(date +%s%N); "
+            f"systemctl stop {name} >/dev/null 2>&1; "
+            f"n=0; while [ $n -lt {int(timeout * 10)} ]; do "
+            f"s=$(systemctl show -p ActiveState {name} 2>/dev/null); "
+            f"s=${{s#ActiveState=}}; "
+            f'case "$s" in inactive|failed|"") break;; esac; '
+            f"sleep 0.1; n=$((n+1)); done; "
+            f"t1=$(date +%s%N); "
+            f"pkill -9 -x {name} && k=1 || k=0; "
+            f"n=0; while pgrep -x {name} >/dev/null && [ $n -lt 50 ]; do "
+            f"sleep 0.1; n=$((n+1)); done; "
+            f"rm -f /var/run/{name}.pid; "
+        )
+        if clean_log:
+            cmd += self.log_mark_cmd()
+        cmd += (
+            f'echo "state=$s"; '
+            f'echo "wait=$(( (t1 - t0) / 1000000 ))"; '
+            f'echo "killed=$k"; '
+            f'echo "alive=$(pgrep -c -x {name})"; '
+            f'echo "log_inode=$(stat -c %i {self.rhsm_log_file} 2>/dev/null)"; '
+            f'echo "log_size=$(stat -c %s {self.rhsm_log_file} 2>/dev/null)"'
+        )
+        _, output = self.ssh.runcmd(cmd, if_stdout=True, log_print=False)
+        status = self.key_values(output)
+        status["wait"] = int(status.get("wait") or 0) / 1000
+        status["killed"] = status.get("killed") == "1"
+        status["alive"] = int(status.get("alive") or 0)
+        status["log_size"] = int(status.get("log_size") or 0)
+        logger.info(f"Reset virt-who: {status}")
+        if status["alive"]:
             raise FailException("Failed to stop and clean virt-who process")
+        if clean_log:
+            self.segment_start(status.get("log_inode") or None, status["log_size"])
+        return status
+
+    @staticmethod
+    def key_values(output):
+        """
+        Parse the 'key=value' lines printed by the remote scripts.
+        :param output: the output of the script
+        :return: dict
+        """
+        data = dict()
+        for line in output.strip().splitlines():
+            key, _, value = line.partition("=")
+            data[key.strip()] = value.strip()
+        return data
 
     def status(self, cmd):
         """
@@ -252,190 +435,493 @@ class VirtwhoRunner:
         logger.info(status_data)
         return status_data
 
-    def rhsm_log_get(self, wait=0):
+    def rhsm_log_get(self, wait=0, with_log=True):
         """
         Get and return rhsm log when the expected message found in log.
-        :param wait: wait time before starting analyzing log
-        :return: output of rhsm log
+        Only the newly appended log is fetched and parsed, the result
+        is kept in self.log.parsed for the whole log.
+        :param wait: keep observing virt-who for at most wait seconds
+            (plus a slack) before the log is analyzed, mainly used to
+            test the interval and the events, see log_wait().
+        :param with_log: return the log in the agent mode, otherwise the
+            agent only ships the log back when virt-who failed.
+        :return: output of rhsm log, or the report of the analysis agent
+            when the log is not shipped back, see agent_get().
         """
-        rhsm_output = ""
         if wait:
-            time.sleep(wait)
-        for i in range(90):
-            time.sleep(5)
-            _, rhsm_output = self.ssh.runcmd(f"cat {self.rhsm_log_file}")
-            if msg_search(rhsm_output, "status=429") is True:
-                logger.warning("429 code found when run virt-who")
-                break
-            if self.thread_number() == 0:
-                logger.info("Virt-who is terminated after run once")
-                break
-            if msg_search(rhsm_output, "\\[.*ERROR.*\\]") is True:
-                logger.info("Error found when run virt-who")
-                break
-            if self.send_number(rhsm_output) > 0:
-                logger.info("Succeed to send mapping after run virt-who")
-                break
-            if i == 89:
-                logger.info("Timeout when run virt-who")
-                break
-        return rhsm_output
+            self.log_wait(wait)
+        if self.agent:
+            try:
+                return self.agent_get(with_log=with_log)
+            except Exception as exc:
+                logger.warning(f"Failed to run the analysis agent: {exc}")
+        if self.stream:
+            try:
+                self.rhsm_log_stream()
+                self.segment_end(self.log.offset, self.log.inode)
+                return self.log.text
+            except Exception as exc:
+                logger.warning(f"Failed to stream rhsm log, poll it instead: {exc}")
+        self.log_scan(self.log.poll())
+        finished = wait_until(
+            lambda: self.log_poll() and self.log_finished(exited=self.log.exited),
+            timeout=450,
+            interval=1,
+        )
+        if not finished:
+            logger.info("Timeout when run virt-who")
+        self.segment_end(self.log.offset, self.log.inode)
+        return self.log.text
+
+    def log_poll(self, grace=10):
+        """
+        Fetch the new rhsm log and check if the virt-who process exited,
+        the process is considered exited when it's not alive after it's
+        seen, or after the grace seconds when it's never seen.
+        :param grace: seconds to wait for the process to show up.
+        :return: True, to be chained in the predicates.
+        """
+        self.log_scan(self.log.poll())
+        if self.thread_number() > 0:
+            self.process_seen = True
+            self.log.exited = False
+        else:
+            self.log.exited = self.process_seen or (
+                time.monotonic() - self.process_since >= grace
+            )
+        return True
+
+    def log_wait(self, wait, slack=30):
+        """
+        Keep observing virt-who after it's started, instead of sleeping a
+        fixed time. Return as soon as one of below is found in the log
+        appended since called, or after wait+slack seconds:
+            - a report following the first one (the next loop)
+            - a new error, or the 429 code
+            - the virt-who process exited
+        :param wait: the seconds virt-who was expected to run
+        :param slack: the extra seconds to wait for the next loop
+        :return: True when the condition is met, False when timeout.
+        """
+        self.process_seen = False
+        self.process_since = time.monotonic()
+        if not self.wait_interval_started(timeout=slack):
+            return True
+        log = self.log.parsed
+        errors = len(log.errors)
+
+        def observed():
+            self.log_poll()
+            if log is not self.log.parsed:
+                return True
+            if log.status_429 or self.log.exited:
+                return True
+            if len(log.errors) > errors:
+                return True
+            return log.loop_info()[1] >= 1
+
+        return wait_until(
+            observed,
+            timeout=wait + slack,
+            interval=1,
+            message=f"the next virt-who loop in {wait}s",
+        )
+
+    def wait_log(self, predicate, timeout=60, message=None):
+        """
+        Wait until the predicate is true for the followed rhsm log.
+        :param predicate: callable receiving the parsed RhsmLog
+        :param timeout: seconds to wait at most
+        :param message: description of the condition for the timeout log
+        :return: the value returned by the predicate
+        """
+        return wait_until(
+            lambda: predicate(self.log.parsed) if self.log_poll() else None,
+            timeout=timeout,
+            interval=0.5,
+            message=message,
+        )
+
+    def wait_interval_started(self, timeout=60):
+        """
+        Wait until the first 'Starting infinite loop' line is logged, it
+        stops early when virt-who runs once, logs an error or exits.
+        :param timeout: seconds to wait at most
+        :return: the interval time or None
+        """
+        self.wait_log(
+            lambda log: log.interval
+            or log.oneshot
+            or log.errors
+            or log.status_429
+            or self.log.exited,
+            timeout=timeout,
+            message="virt-who starting infinite loop",
+        )
+        return self.log.parsed.interval
+
+    def rhsm_log_stream(self, timeout=450):
+        """
+        Follow rhsm log by one remote 'tail -F' channel and return at the
+        moment the mapping is sent, an error or 429 code is logged, or
+        the virt-who process exits.
+        :param timeout: seconds to wait for virt-who at most.
+        """
+        self.log_scan(self.log.poll())
+        if self.log_finished():
+            return
+        for new_log in self.log.stream("virt-who", timeout):
+            self.log_scan(new_log)
+            if self.log_finished():
+                return
+        if not self.log_finished(exited=self.log.exited):
+            logger.info("Timeout when run virt-who")
+
+    def log_finished(self, exited=False):
+        """
+        Check if virt-who is finished according to the parsed rhsm log.
+        :param exited: True when the virt-who process is not alive.
+        :return: True or False
+        """
+        reason = self.log.parsed.finished(
+            *self.log_options(), exited=exited, until_exit=self.until_exit
+        )
+        if reason:
+            self.log_reason(reason)
+        return reason is not None
+
+    def log_reason(self, reason):
+        """
+        Print why virt-who is considered finished.
+        :param reason: the reason returned by RhsmLog.finished()
+        """
+        if reason == "429":
+            logger.warning("429 code found when run virt-who")
+        elif reason == "exited":
+            logger.info("Virt-who is terminated after run once")
+        elif reason == "error":
+            logger.info("Error found when run virt-who")
+        elif reason == "sent":
+            logger.info("Succeed to send mapping after run virt-who")
+        else:
+            logger.info("Timeout when run virt-who")
+
+    def log_options(self):
+        """
+        Get the api prefix of the register server and if it's the local
+        mode, which are needed to count the mapping reports.
+        :return: (prefix, local)
+        """
+        prefix = ""
+        if "satellite" in self.register_type:
+            prefix = "/rhsm"
+        elif "rhsm" in self.register_type:
+            prefix = "/subscription"
+        elif self.register_type == "standin":
+            prefix = get_register_handler("standin").prefix
+        return prefix, self.mode == "local"
+
+    def log_report(self, rhsm_log):
+        """
+        Get the analyzer data of rhsm log. The report returned by the
+        analysis agent is reused when rhsm_log is the log it returned,
+        otherwise the log is analyzed locally.
+        :param rhsm_log: the rhsm.log, the parsed RhsmLog or the report
+        :return: dict of rhsmlog.analyze()
+        """
+        if isinstance(rhsm_log, dict):
+            return rhsm_log
+        if self.report is not None and rhsm_log is self.report_log:
+            return self.report
+        log = self.log_parse(rhsm_log)
+        owners = None
+        if len(log.config_threads()) > 1:
+            owners = self.config_owners()
+        return analyze(log, *self.log_options(), owners=owners)
+
+    def config_owners(self, config_dir="/etc/virt-who.d"):
+        """
+        Get the owner of each virt-who config on the virt-who host.
+        :param config_dir: the directory of the virt-who configs
+        :return: dict of {config: owner}
+        """
+        _, output = self.ssh.runcmd(
+            f"cat {config_dir}/*.conf 2>/dev/null", if_stdout=True, log_print=False
+        )
+        return rhsmlog.config_owners(output or "")
+
+    def agent_upload(self):
+        """
+        Upload the analysis agent to the virt-who host once per session,
+        the file name includes the digest of the agent, so a changed
+        agent is uploaded again.
+        :return: the remote file of the agent
+        """
+        key = (self.ssh.host, self.ssh.port)
+        if key not in AGENT_UPLOADED:
+            with open(rhsmlog.__file__, "rb") as f:
+                digest = hashlib.md5(f.read()).hexdigest()[:12]
+            remote_file = f"/tmp/virtwho_rhsmlog_{digest}.py"
+            self.ssh.put_file(rhsmlog.__file__, remote_file)
+            AGENT_UPLOADED[key] = remote_file
+        return AGENT_UPLOADED[key]
+
+    def agent_get(self, timeout=450, with_log=False):
+        """
+        Wait for virt-who and analyze rhsm log on the virt-who host by
+        the analysis agent in one ssh command, the analyzer data is kept
+        as self.report. The log is only shipped back when asked or when
+        virt-who failed, otherwise it's fetched by the analyzer data when
+        it's read, see AnalyzerData.
+        :param timeout: seconds to wait for virt-who at most.
+        :param with_log: ship the log back with the report.
+        :return: output of rhsm log, or the report when the log is not
+            shipped back.
+        """
+        self.report = None
+        self.report_log = None
+        self.report_log_get = None
+        prefix, local = self.log_options()
+        cmd = (
+            f"$(command -v python3 || echo /usr/libexec/platform-python) "
+            f"{self.agent_upload()} --log {self.rhsm_log_file} "
+            f"--wait {timeout} "
+        )
+        cmd += "--with-log" if with_log else "--with-log-on-failure"
+        if self.segment:
+            cmd += f" --offset {self.segment['start']}"
+            if self.segment["inode"]:
+                cmd += f" --inode {self.segment['inode']}"
+        if prefix:
+            cmd += f" --prefix {prefix}"
+        if local:
+            cmd += " --local"
+        if self.until_exit:
+            cmd += " --until-exit"
+        ret, output = self.ssh.runcmd(cmd, if_stdout=True, log_print=False)
+        if ret != 0:
+            raise FailException(f"Failed to run the analysis agent: {output}")
+        report = json.loads(output)
+        self.log_reason(report["finished"])
+        self.report = report
+        self.segment_end(report["offset"], report["inode"])
+        if "log" not in report:
+            run = self.segment["run"] if self.segment else None
+            self.report_log_get = lambda: self.agent_log_get(report, run)
+            return report
+        rhsm_log = zlib.decompress(base64.b64decode(report.pop("log"))).decode()
+        self.log_scan(rhsm_log)
+        self.report_log = rhsm_log
+        return rhsm_log
+
+    def agent_log_get(self, report, run=None):
+        """
+        Fetch the rhsm log analyzed by the analysis agent.
+        :param report: the report of the agent
+        :param run: the run id of the log segment
+        :return: the analyzed rhsm log
+        """
+        rhsm_log = self.segment_get(run) if run is not None else None
+        if rhsm_log is None:
+            _, output = self.ssh.runcmd(
+                f"head -c {report['offset']} {self.rhsm_log_file}", raw=True
+            )
+            rhsm_log = output.decode("utf-8", errors="replace")
+        return rhsm_log
+
+    def log_scan(self, new_log):
+        """
+        Print the newly fetched rhsm log, which has been parsed by the
+        follower already.
+        :param new_log: the complete lines appended since last scan.
+        """
+        if new_log:
+            logger.info(f"<<< {self.rhsm_log_file}\n{new_log}")
+
+    def log_parse(self, rhsm_log):
+        """
+        Get the parsed rhsm log. The log parsed incrementally by the
+        follower is reused when rhsm_log is the followed log.
+        :param rhsm_log: the rhsm.log or the parsed RhsmLog
+        :return: RhsmLog
+        """
+        if isinstance(rhsm_log, RhsmLog):
+            return rhsm_log
+        if rhsm_log is self.log.text:
+            return self.log.parsed
+        return RhsmLog(rhsm_log)
 
     def log_clean(self):
         """
-        Clean all log files under /var/log/rhsm/
-        Clean the json file created by print function of virt-who
+        Start a new segment of rhsm.log instead of truncating it, only
+        the log written after the current end of rhsm.log is analyzed.
+        The other log files under /var/log/rhsm/ (such as the log files
+        per config) are still truncated, and the rotated logs are kept.
         """
-        self.ssh.runcmd("truncate -s 0 /var/log/rhsm/*.log")
-        self.ssh.runcmd("rm -f /var/log/rhsm/*.gz")
+        cmd = self.log_mark_cmd() + (
+            f'echo "log_inode=$(stat -c %i {self.rhsm_log_file} 2>/dev/null)"; '
+            f'echo "log_size=$(stat -c %s {self.rhsm_log_file} 2>/dev/null)"'
+        )
+        _, output = self.ssh.runcmd(cmd, if_stdout=True, log_print=False)
+        status = self.key_values(output)
+        self.segment_start(
+            status.get("log_inode") or None, int(status.get("log_size") or 0)
+        )
 
         # comment this line as we need the print json file for fake mode testing
         # self.ssh.runcmd(f"rm -rf {PRINT_JSON_FILE}")
 
-    def error_warning(self, msg="error"):
+    def log_mark_cmd(self):
         """
-        Analyze the rhsm log to calculate the error/warning number and
-        collect all lines including any trailing context (e.g. Python
-        tracebacks) that follow each marker line.
+        The shell snippet to truncate all the log files under the log
+        directory except the followed rhsm.log.
+        """
+        log_dir, log_name = os.path.split(self.rhsm_log_file)
+        return (
+            f"find {log_dir} -maxdepth 1 -type f -name '*.log' "
+            f"! -name '{log_name}' -exec truncate -s 0 {{}} +; "
+        )
 
-        Uses ``grep -c`` for the count (only lines with the marker) and
-        ``grep -A`` for the text (marker lines plus context) so that
-        multiline exceptions are captured.  Existing callers that do
-        ``string in result["error_msg"]`` will continue to match because
-        the extra context lines are appended, never removed.
+    def segment_start(self, inode, offset):
+        """
+        Follow rhsm.log from the offset, and record the start marker of
+        the new run to the local segment index.
+        :param inode: inode of rhsm.log, None means unknown.
+        :param offset: the size of rhsm.log before virt-who is started.
+        """
+        self.log_reset(inode=inode, offset=offset)
+        test = os.environ.get("PYTEST_CURRENT_TEST", "").split(" ")[0]
+        run = self.segments.start(
+            self.ssh.host, self.rhsm_log_file, inode, offset, test=test
+        )
+        self.segment = {"run": run, "inode": inode, "start": offset}
+        logger.info(f"Start rhsm.log segment {run} from {inode}:{offset}")
 
-        :param msg: 'error' or 'warning'
-        :return: (count_of_marker_lines, all_marker_lines_with_context)
+    def segment_end(self, offset, inode=None):
         """
-        tag = msg.upper()
-        marker = f"\\[.*{tag}.*\\]"
+        Record the end of the current run to the local segment index.
+        :param offset: byte offset the log is analyzed to.
+        :param inode: inode of rhsm.log, when it's rotated during the run.
+        """
+        if self.segment is None:
+            return
+        record = {"end": offset}
+        if inode and inode != self.segment["inode"]:
+            record.update(inode=inode, start=0)
+        self.segments.update(self.segment["run"], **record)
 
-        # Count: only lines that carry the [ERROR]/[WARNING] tag
-        cmd_count = f"grep -c '{marker}' {self.rhsm_log_file}"
-        _, count_out = self.ssh.runcmd(cmd_count)
-        msg_number = (
-            int(count_out.strip()) if count_out and count_out.strip().isdigit() else 0
+    def segment_get(self, run=None):
+        """
+        Pull the rhsm.log segment of a past run by the local index,
+        the segment is read from the file of the same inode, so it's
+        also found after the log is rotated (but not compressed).
+        :param run: the run id, default to the last run.
+        :return: the log written by the run, or None when not found.
+        """
+        record = self.segments.get(run)
+        if not record:
+            return None
+        log_dir = os.path.dirname(record["file"])
+        start = int(record["start"] or 0)
+        cmd = (
+            f"f=$(find {log_dir} -maxdepth 1 -inum {record['inode']} | head -1); "
+            f'[ -n "$f" ] || exit 1; tail -c +{start + 1} "$f"'
         )
+        if record.get("end") is not None:
+            cmd += f" | head -c {int(record['end']) - start}"
+        ret, output = self.ssh.runcmd(cmd, raw=True)
+        if ret != 0:
+            logger.warning(f"Failed to find the rhsm.log segment {record['run']}")
+            return None
+        return output.decode("utf-8", errors="replace")
 
-        # Text: include up to 20 context lines after each marker so
-        # multiline Python tracebacks are captured.
-        cmd_text = f"grep -A 20 '{marker}' {self.rhsm_log_file}"
-        _, output = self.ssh.runcmd(cmd_text)
-        if output is None:
-            output = ""
+    def log_reset(self, inode=None, offset=0):
+        """
+        Drop the followed log and the agent report, and follow the rhsm
+        log from the offset.
+        :param inode: inode of rhsm.log, None means unknown.
+        :param offset: byte offset to follow from.
+        """
+        self.log.reset(offset=offset, inode=inode)
+        self.report = None
+        self.report_log = None
+        self.report_log_get = None
+        self.process_seen = False
+        self.process_since = time.monotonic()
+
+    def error_warning(self, msg="error"):
+        """
+        Calculate the error/warning number of the followed rhsm log and
+        collect all lines including any trailing context (e.g. Python
+        tracebacks) that follow each marker line, as 'grep -A 20' does.
+        Existing callers that do ``string in result["error_msg"]`` will
+        continue to match because the extra context lines are appended,
+        never removed.
 
-        return msg_number, output
+        :param msg: 'error' or 'warning'
+        :return: (count_of_marker_lines, all_marker_lines_with_context)
+        """
+        if self.report is not None:
+            return self.report[msg.lower()], self.report[f"{msg.lower()}_msg"]
+        return self.log.parsed.error_warning(msg.upper())
 
     def send_number(self, rhsm_log):
         """
         Calculate virt-who mappings report number by analyzing the rhsm
         log based on keywords.
-        :param rhsm_log: the rhsm.log
+        :param rhsm_log: the rhsm.log or the parsed RhsmLog
         :return: virt-who report times
         """
-        msg = ""
-        if "0 hypervisors and 0 guests found" in rhsm_log:
-            msg = "0 hypervisors and 0 guests found"
-        elif "virtwho.main DEBUG" in rhsm_log or "rhsm.connection DEBUG" in rhsm_log:
-            if "satellite" in self.register_type:
-                prefix = "/rhsm"
-            elif "rhsm" in self.register_type:
-                prefix = "/subscription"
-            else:
-                prefix = ""
-            if prefix:
-                if self.mode == "local":
-                    msg = (
-                        r"Response: status=20.*requestUuid.*request="
-                        rf'"PUT {prefix}/consumers'
-                    )
-                    return len(re.findall(msg, rhsm_log, re.I))
-                else:
-                    for pattern in [
-                        rf'"PUT {prefix}/consumers',
-                        rf'"POST {prefix}/hypervisors',
-                    ]:
-                        msg = r"Response: status=20.*requestUuid.*request=" + pattern
-                        hits = re.findall(msg, rhsm_log, re.I)
-                        if hits:
-                            return len(hits)
-        else:
-            if self.mode == "local":
-                msg = r"Sending update in guests lists for config"
-            else:
-                msg = r"Sending updated Host-to-guest mapping to"
-        res = re.findall(msg, rhsm_log, re.I)
-        return len(res)
+        prefix, local = self.log_options()
+        return self.log_parse(rhsm_log).send_number(prefix=prefix, local=local)
 
     def reporter_id(self, rhsm_log):
         """
         Get the reporter id from rhsm log based on keywords.
-        :param rhsm_log: the rhsm.log
+        :param rhsm_log: the rhsm.log or the parsed RhsmLog
         :return: reporter id
         """
-        res = re.findall(r"reporter_id='(.*?)'", rhsm_log)
-        if len(res) > 0:
-            reporter_id = res[0].strip()
-            return reporter_id
+        return self.log_parse(rhsm_log).reporter_id
 
     def interval_time(self, rhsm_log):
         """
         Get the interval time from rhsm log based on keywords.
-        :param rhsm_log: the rhsm.log
+        :param rhsm_log: the rhsm.log or the parsed RhsmLog
         :return: interval time
         """
-        res = re.findall(r"Starting infinite loop with(.*?)seconds interval", rhsm_log)
-        if len(res) > 0:
-            interval_time = res[0].strip()
-            return int(interval_time)
+        return self.log_parse(rhsm_log).interval
 
     def loop_info(self):
         """
-        Calculate the virt-who loop times and loop interval time, which
-        mainly for interval function testing.
-        :return: virt-who loop number and loop interval time
-        """
-        loop_time = -1
-        key, loop_num = self.loop_number()
-        if loop_num != 0:
-            cmd = f"grep '{key}' {self.rhsm_log_file} | head -2"
-            _, output = self.ssh.runcmd(cmd)
-            output = output.split("\n")
-            if len(output) > 0:
-                d1 = re.findall(r"\d{2}:\d{2}:\d{2}", output[0])[0]
-                d2 = re.findall(r"\d{2}:\d{2}:\d{2}", output[1])[0]
-                h, m, s = d1.strip().split(":")
-                s1 = int(h) * 3600 + int(m) * 60 + int(s)
-                h, m, s = d2.strip().split(":")
-                s2 = int(h) * 3600 + int(m) * 60 + int(s)
-                loop_time = s2 - s1
-        return loop_time, loop_num
+        Calculate the virt-who loop times and loop interval time of the
+        followed rhsm log, which mainly for interval function testing.
+        :return: virt-who loop interval time and loop number
+        """
+        if self.report is not None:
+            return self.report["loop"], self.report["loop_num"]
+        return self.log.parsed.loop_info()
 
     def loop_number(self):
         """
-        Analyzing rhsm log to calculate the virt-who loop number.
+        Analyzing the followed rhsm log to calculate the virt-who loop
+        number.
         :return: keywords and loop number
         """
-        key = ""
-        loop_num = 0
-        cmd = f"""grep 'Report for config' {self.rhsm_log_file} |
-                 grep 'placing in datastore' |
-                 head -1"""
-        _, output = self.ssh.runcmd(cmd)
-        keys = re.findall(r'Report for config "(.*?)"', output)
-        if output is not None and output != "" and len(keys) > 0:
-            key = f'Report for config "{keys[0]}" gathered, placing in datastore'
-            cmd = f"grep '{key}' {self.rhsm_log_file} | wc -l"
-            _, output = self.ssh.runcmd(cmd)
-            if output is not None or output != "":
-                loop_num = int(output) - 1
-        return key, loop_num
+        if self.report is not None:
+            config = self.report["config"]
+        else:
+            reports = self.log.parsed.reports
+            config = reports[0][0] if reports else None
+        if not config:
+            return "", 0
+        key = f'Report for config "{config}" gathered, placing in datastore'
+        return key, self.loop_info()[1]
 
     def mappings(self, rhsm_log):
         """
         Get mapping facts from log.
-        :param rhsm_log: the rhsm.log
-        :return: dict including all mapping facts
+        :param rhsm_log: the rhsm.log, the parsed RhsmLog or the report
+        :return: Mappings including all mapping facts
         """
         if self.mode == "local":
             data = self.mappings_local(rhsm_log)
@@ -446,94 +932,47 @@ class VirtwhoRunner:
     def mappings_local(self, rhsm_log):
         """
         Analyzing mappings of local mode from log.
-        :param rhsm_log:
-        :return: dict with local mode mapping facts
+        :param rhsm_log: the rhsm.log, the parsed RhsmLog or the report
+        :return: Mappings with local mode guests
         """
-        data = dict()
-        key = "Domain info:"
-        if key in rhsm_log:
-            rex = re.compile(r"(?<=Domain info: )\[.*?\]\n+(?=\d\d\d\d|$)", re.S)
-            mapping_info = rex.findall(rhsm_log)[0]
-            try:
-                mapping_info = json.loads(mapping_info.replace("\n", ""), strict=False)
-            except Exception:
-                logger.warning(f"json.loads failed: {mapping_info}")
-                return data
-            for item in mapping_info:
-                guestId = item["guestId"]
-                attr = dict()
-                attr["state"] = item["state"]
-                attr["active"] = item["attributes"]["active"]
-                attr["type"] = item["attributes"]["virtWhoType"]
-                data[guestId] = attr
+        data = Mappings(fuzzy=self.fuzzy)
+        if isinstance(rhsm_log, dict):
+            domains = rhsm_log["domains"]
+        else:
+            domains = self.log_parse(rhsm_log).domain_payload()
+        if domains is not None:
+            data.add_local(domains)
         return data
 
     def mappings_remote(self, rhsm_log):
         """
-        Analyzing mappings of remote mode from log.
-        :param rhsm_log:
-        :return: dict with remote mode mapping facts
+        Analyzing mappings of remote mode from log. The last mapping
+        sent to each org is decoded from the json block following its
+        "Host-to-guest mapping being sent to '<org>'" record.
+        :param rhsm_log: the rhsm.log, the parsed RhsmLog or the report
+        :return: Mappings with remote mode mapping facts
         """
-        data = dict()
-        orgs = re.findall(r"Host-to-guest mapping being sent to '(.*?)'", rhsm_log)
-        if len(orgs) > 0:
-            data["orgs"] = orgs
-            org_data = dict()
-            for org in orgs:
-                # key = f"Host-to-guest mapping being sent to '{org}'"
-                rex = re.compile(r"(?<=: ){.*?}\n+(?=202|$)", re.S)
-                mapping_info = rex.findall(rhsm_log)[-1]
-                try:
-                    mapping_info = json.loads(
-                        mapping_info.replace("\n", ""), strict=False
-                    )
-                except Exception:
-                    logger.warning("Failed to run json.loads for rhsm.log")
-                    return data
-                hypervisors = mapping_info["hypervisors"]
-                org_data["hypervisor_num"] = len(hypervisors)
-                for item in hypervisors:
-                    hypervisorId = item["hypervisorId"]["hypervisorId"]
-                    if "name" in item.keys():
-                        hypervisor_name = item["name"]
-                    else:
-                        hypervisor_name = ""
-                    facts = dict()
-                    facts["name"] = hypervisor_name
-                    facts["type"] = item["facts"]["hypervisor.type"]
-                    facts["version"] = str(item["facts"]["hypervisor.version"])
-                    facts["socket"] = item["facts"]["cpu.cpu_socket(s)"]
-                    facts["dmi"] = item["facts"]["dmi.system.uuid"]
-                    if "hypervisor.cluster" in item["facts"].keys():
-                        facts["cluster"] = item["facts"]["hypervisor.cluster"]
-                    else:
-                        facts["cluster"] = ""
-                    guests = list()
-                    for guest in item["guestIds"]:
-                        guestId = guest["guestId"]
-                        guests.append(guestId)
-                        attr = dict()
-                        attr["guest_hypervisor"] = hypervisorId
-                        attr["state"] = guest["state"]
-                        attr["active"] = guest["attributes"]["active"]
-                        attr["type"] = guest["attributes"]["virtWhoType"]
-                        org_data[guestId] = attr
-                    facts["guests"] = guests
-                    org_data[hypervisorId] = facts
-                data[org] = org_data
+        data = Mappings(fuzzy=self.fuzzy)
+        if isinstance(rhsm_log, dict):
+            payloads, orgs = rhsm_log["mappings"], rhsm_log["orgs"]
+        else:
+            log = self.log_parse(rhsm_log)
+            payloads = log.mapping_payloads()
+            orgs = [org for org, _ in log.mapping_events]
+        for org, mapping_info in payloads.items():
+            if mapping_info is not None:
+                data.add(org, mapping_info)
+        data.orgs = orgs
         return data
 
     def hypervisor_id(self, mapping):
         """
         Get the hypervisor id by mapping
-        :param mapping: the host-to-guest mapping
+        :param mapping: the host-to-guest Mappings
         """
-        if mapping and self.mode and "orgs" in mapping:
+        if mapping and self.mode:
             guest_uuid = get_hypervisor_handler(self.mode).guest_uuid
-            for org in mapping["orgs"]:
-                org_dict = mapping.get(org)
-                if org_dict and guest_uuid in org_dict.keys():
-                    return org_dict[guest_uuid]["guest_hypervisor"]
+            return mapping.hypervisor_of(guest_uuid)
         return ""
 
     def print_json(self, cli):
@@ -563,12 +1002,16 @@ class VirtwhoRunner:
         """
         :param name: service name, default is virt-who
         :param action: start, stop, restart, status...
-        :param wait: wait time
+        :param wait: the max seconds to wait for the service to be
+            started (running with a MainPID, or exited) or stopped.
         :return: return code and output
         """
         cmd = f"systemctl {action} {name}"
         ret, output = self.ssh.runcmd(cmd)
-        time.sleep(wait)
+        if action in ("start", "restart", "try-restart", "reload", "force-reload"):
+            self.wait_unit(name, started=True, timeout=wait)
+        elif action == "stop":
+            self.wait_unit(name, started=False, timeout=wait)
         if action == "status":
             if "Active: active (running)" in output:
                 output = "running"
@@ -576,6 +1019,60 @@ class VirtwhoRunner:
                 output = "dead"
         return ret, output
 
+    def unit_state(self, name="virt-who"):
+        """
+        Get the state of the systemd unit.
+        :param name: service name, default is virt-who
+        :return: dict with ActiveState, SubState, MainPID and PIDFile,
+            the PIDFile is True when /var/run/{name}.pid exists.
+        """
+        cmd = (
+            f"systemctl show -p ActiveState -p SubState -p MainPID {name}; "
+            f"test -e /var/run/{name}.pid && echo PIDFile=1 || echo PIDFile=0"
+        )
+        _, output = self.ssh.runcmd(cmd, if_stdout=True, log_print=False)
+        state = dict()
+        for line in output.strip().splitlines():
+            key, _, value = line.partition("=")
+            state[key.strip()] = value.strip()
+        state["MainPID"] = int(state.get("MainPID") or 0)
+        state["PIDFile"] = state.get("PIDFile") == "1"
+        return state
+
+    def wait_unit(self, name="virt-who", started=True, timeout=10):
+        """
+        Wait until the systemd unit is started or stopped.
+        The virt-who is started when it's active with a MainPID and it
+        has created the pid file, or it has exited (such as oneshot).
+        :param name: service name, default is virt-who
+        :param started: wait for started when True, stopped when False.
+        :param timeout: seconds to wait at most
+        :return: the unit state or None when timeout
+        """
+
+        def reached():
+            state = self.unit_state(name)
+            active = state.get("ActiveState")
+            if active in ("activating", "deactivating", "reloading"):
+                return None
+            if not started:
+                return state if active in ("inactive", "failed") else None
+            if active == "active":
+                if not state["MainPID"]:
+                    return None
+                if name == "virt-who" and not state["PIDFile"]:
+                    return None
+            return state
+
+        state = wait_until(
+            reached,
+            timeout=timeout,
+            message=f"{name} to be {'started' if started else 'stopped'}",
+        )
+        if state:
+            logger.info(f"{name} is {state.get('ActiveState')}: {state}")
+        return state
+
     def kill_pid(self, process_name):
         """
         Kill an alive process id by process name.
@@ -0,0 +1,139 @@
+"""Run many virt-who config variants in one virt-who run.
+
+virt-who runs each config of /etc/virt-who.d in its own thread, so the
+variants of one option (such as owner, filter_hosts or hypervisor_id)
+can be checked by one virt-who run instead of one service restart per
+variant. Each variant is deployed as /etc/virt-who.d/<name>.conf with
+the section [<name>], virt-who is run once by 'virt-who -o -c ...', and
+the rhsm.log is split per config by the 'Report for config' records:
+
+    with ScenarioBatch(virtwho) as batch:
+        batch.add("virtwho-uuid", hypervisor_id="uuid")
+        batch.add("virtwho-hostname", hypervisor_id="hostname")
+        results = batch.run()
+    assert results["virtwho-uuid"]["error"] == 0
+
+The variants with the same owner are sent by virt-who in one report, so
+they share the mappings and the send number, use different owners when
+the mappings need to be checked per variant.
+"""
+
+import os
+
+from virtwho import logger, FailException, HYPERVISOR, REGISTER
+from virtwho.configure import VirtwhoHypervisorConfig
+from virtwho.rhsmlog import analyze_config
+
+
+class ScenarioBatch:
+    def __init__(self, virtwho, mode=HYPERVISOR, register_type=REGISTER):
+        """
+        :param virtwho: the VirtwhoRunner to run virt-who
+        :param mode: the hypervisor mode of the variants
+        :param register_type: the subscription server. (rhsm, satellite)
+        """
+        self.virtwho = virtwho
+        self.mode = mode
+        self.register_type = register_type
+        self.variants = dict()
+        self.result = None
+
+    def add(self, name, rhsm=True, **options):
+        """
+        Deploy a config variant, which is the basic config of the mode
+        updated by the options.
+        :param name: the variant name, used as the section name and the
+            file name /etc/virt-who.d/<name>.conf
+        :param rhsm: True is to add all rhsm related options
+        :param options: the options to update, the option is deleted when
+            the value is None.
+        :return: VirtwhoHypervisorConfig of the variant
+        """
+        if name in self.variants:
+            raise FailException(f"The config variant {name} is added already")
+        variant = VirtwhoHypervisorConfig(
+            self.mode,
+            self.register_type,
+            config_name=f"/etc/virt-who.d/{name}.conf",
+            section=name,
+        )
+        with variant.batch():
+            variant.create(rhsm=rhsm)
+            for option, value in options.items():
+                if value is None:
+                    variant.delete(option)
+                else:
+                    variant.update(option, value)
+        self.variants[name] = variant
+        return variant
+
+    def owner(self, name):
+        """
+        Get the owner of a variant.
+        :param name: the variant name
+        :return: the owner or None
+        """
+        variant = self.variants[name]
+        return variant.cfg.config.get(variant.section, "owner", fallback=None) or None
+
+    def command(self, debug=True):
+        """
+        The command to run all the variants once.
+        :param debug: use '-d' option when set True.
+        """
+        cmd = "virt-who "
+        if debug is True:
+            cmd += "-d "
+        cmd += "-o "
+        for variant in self.variants.values():
+            cmd += f"-c {variant.remote_file} "
+        return cmd
+
+    def run(self, debug=True):
+        """
+        Run virt-who once for all the variants, wait for it to exit and
+        split the result per variant.
+        :param debug: use '-d' option when set True.
+        :return: dict of {name: result}, the result has the same keys as
+            the analyzer for debug, oneshot and thread, plus the data of
+            the variant from VirtwhoRunner.config_result(). The result of
+            the whole run is self.result.
+        """
+        if not self.variants:
+            raise FailException("No config variant is added")
+        self.result = self.virtwho.run_until_exit(self.command(debug))
+        configs = self.result["configs"]
+        prefix, local = self.virtwho.log_options()
+        results = dict()
+        for name in self.variants:
+            data = dict()
+            for key in ("debug", "oneshot", "thread"):
+                data[key] = self.result[key]
+            if name in configs:
+                data.update(configs[name])
+            else:
+                # the variant is never reported, such as a config error
+                report = analyze_config(
+                    self.virtwho.log.parsed, name, self.owner(name), prefix, local
+                )
+                data.update(self.virtwho.config_result(report))
+            logger.info(
+                f"Config {name}: {data['reports']} report(s), {data['send']} "
+                f"send(s), {data['error']} error(s)"
+            )
+            results[name] = data
+        return results
+
+    def destroy(self):
+        """Remove the local and remote files of all the variants."""
+        for variant in self.variants.values():
+            variant.remote_ssh.remove_file(variant.remote_file)
+            if os.path.exists(variant.local_file):
+                os.remove(variant.local_file)
+        self.variants = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.destroy()
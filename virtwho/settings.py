@@ -1,9 +1,16 @@
 """Define and instantiate the configuration class for virtwho-test."""
 
+import fcntl
+import hashlib
 import os
+import tempfile
 from configparser import ConfigParser
+from contextlib import contextmanager
+from io import StringIO
 from logging import getLogger
 
+from virtwho.logger import WORKER_ID
+
 logger = getLogger(__name__)
 
 
@@ -34,20 +41,135 @@ class Configure:
         self.remote_ssh = remote_ssh
         self.config = ConfigParser(dict_type=AttrDict)
         self.config.read(self.local_file)
+        self._batch_depth = 0
+        self._pending = False
+        self._uploaded = None
+        self._section_names = set()
         self.save()
 
+    def read(self):
+        """Return the current content of local_file."""
+        try:
+            with open(self.local_file) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, content):
+        """Write content to local_file atomically under an exclusive lock,
+        the file is replaced by a complete temporary file, so the
+        concurrent readers never get a partial file and the concurrent
+        writers never interleave.
+        :param content: the file content
+        """
+        local_file = os.path.abspath(self.local_file)
+        directory = os.path.dirname(local_file)
+        os.makedirs(directory, exist_ok=True)
+        lock_file = os.path.join(
+            tempfile.gettempdir(), f"virtwho{local_file.replace(os.sep, '_')}.lock"
+        )
+        with open(lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                fd, tmp_file = tempfile.mkstemp(
+                    prefix=f".{os.path.basename(self.local_file)}.", dir=directory
+                )
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        f.write(content)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_file, self.local_file)
+                except BaseException:
+                    if os.path.exists(tmp_file):
+                        os.remove(tmp_file)
+                    raise
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _sections(self):
+        """Expose the sections as the attributes of the instance, the
+        attributes of the removed sections are dropped."""
+        for key in self._section_names - set(self.config._sections.keys()):
+            delattr(self, key)
+        for key in self.config._sections.keys():
+            setattr(self, key, getattr(self.config._sections, key))
+        self._section_names = set(self.config._sections.keys())
+
+    def render(self):
+        """Return the file content rendered from the current settings."""
+        output = StringIO()
+        self.config.write(output, space_around_delimiters=False)
+        return output.getvalue()
+
     def save(self):
         """Save changes to local_file, and upload the local_file to
         remote server if remote_ parameters provided to achieve updating
-        remote file.
+        remote file. Inside batch() the save is deferred to the end of
+        the batch. The local_file is only written when its content is
+        changed, and the upload is skipped when the content is the same
+        as the last uploaded one and the remote file is not removed or
+        changed by others, such as 'rm -rf /etc/virt-who.d/*'.
         """
-        for key in self.config._sections.keys():
-            setattr(self, key, getattr(self.config._sections, key))
-        with open(self.local_file, "w") as f:
-            self.config.write(f, space_around_delimiters=False)
+        if self._batch_depth > 0:
+            self._pending = True
+            return
+        self._pending = False
+        self._sections()
+        content = self.render()
+        if content != self.read():
+            self.write(content)
 
         if self.remote_ssh and self.remote_file:
+            if content == self._uploaded and self.remote_same(content):
+                logger.info(f"No change for {self.remote_file}, skip uploading")
+                return
             self.remote_ssh.put_file(self.local_file, self.remote_file)
+            self._uploaded = content
+
+    def reset(self):
+        """Drop all the settings, such as after the local and remote
+        files are removed. The empty file is saved as usual, so it's
+        deferred to the end of the running batch."""
+        self.config = ConfigParser(dict_type=AttrDict)
+        self._uploaded = None
+        self.save()
+
+    def remote_same(self, content):
+        """Check the remote file has the content by its md5sum."""
+        ret, output = self.remote_ssh.runcmd(
+            f"md5sum {self.remote_file}", log_print=False
+        )
+        md5 = hashlib.md5(content.encode()).hexdigest()
+        return ret == 0 and output.split()[:1] == [md5]
+
+    @contextmanager
+    def batch(self):
+        """Collect all update()/delete() calls in memory and save them
+        once when the block exits. Nested batches are saved by the
+        outermost one. The settings are rolled back and nothing is saved
+        when the block raises an exception.
+
+        Usage:
+            with cfg.batch():
+                cfg.update("global", "debug", "True")
+                cfg.update("global", "interval", "60")
+        """
+        snapshot = self.render() if self._batch_depth == 0 else None
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if snapshot is not None:
+                self.config = ConfigParser(dict_type=AttrDict)
+                self.config.read_string(snapshot)
+                self._sections()
+                self._pending = False
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0 and self._pending:
+            self.save()
 
     def update(self, section, option, value):
         """Used to add section, add option or update option in a file.
@@ -78,9 +200,13 @@ DOCS_DIR = os.path.join(
     os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir)), "docs"
 )
 
+# Each worker has its own temp directory for the local copies of the
+# configuration files, so the parallel workers don't overwrite each other.
 TEMP_DIR = os.path.join(
-    os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir)), "temp"
-)
+    os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir)),
+    "temp",
+    WORKER_ID,
+).rstrip(os.sep)
 
 TEST_DATA = os.path.join(
     os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir)), "virtwho.ini"
@@ -1,5 +1,6 @@
 import os
 import socket
+import threading
 import paramiko
 from virtwho import logger, FailException
 
@@ -24,6 +25,8 @@ class SSHConnect:
         self.timeout = timeout
         self.err = "passwd or rsafile can not be None"
         self._ssh = None
+        self._sftp = None
+        self._sftp_lock = threading.RLock()
 
     def _connect(self):
         """SSH command execution connection with pooling.
@@ -36,7 +39,8 @@ class SSHConnect:
             transport = self._ssh.get_transport()
             if transport is not None and transport.is_active():
                 return self._ssh
-            self._ssh = None
+            # the dead transport and its thread are released
+            self._client_close()
         if self.pwd:
             self._ssh = self.pwd_connect()
         elif self.rsa:
@@ -46,7 +50,14 @@ class SSHConnect:
         return self._ssh
 
     def close(self):
-        """Explicitly close the cached connection."""
+        """Explicitly close the cached sftp session and connection, after
+        the running sftp operation of the other threads."""
+        with self._sftp_lock:
+            self._sftp_close()
+            self._client_close()
+
+    def _client_close(self):
+        """Close the cached SSHClient with its transport."""
         if self._ssh is not None:
             try:
                 self._ssh.close()
@@ -54,15 +65,55 @@ class SSHConnect:
                 pass
             self._ssh = None
 
+    def _sftp_alive(self):
+        """Check if the cached sftp session can still be used."""
+        if self._sftp is None:
+            return False
+        channel = self._sftp.get_channel()
+        if channel is None or channel.closed:
+            return False
+        transport = channel.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _sftp_close(self):
+        """Close the cached sftp session, the transport is kept."""
+        if self._sftp is not None:
+            try:
+                self._sftp.close()
+            except Exception:
+                pass
+            self._sftp = None
+
     def _transfer(self):
-        """Sftp download/upload execution connection"""
-        if self.pwd:
-            return self.pwd_transfer()
-        elif self.rsa:
-            return self.rsa_transfer()
-        else:
-            # it will try to use keys from SSH AutoAgent
-            return self.pwd_transfer()
+        """Sftp download/upload execution connection with pooling.
+        One long-lived SFTPClient is opened on the same cached transport
+        used by runcmd(), and it is reopened automatically when the
+        transport is dead.
+        """
+        if self._sftp_alive():
+            return self._sftp
+        self._sftp_close()
+        self._sftp = self._connect().open_sftp()
+        return self._sftp
+
+    def _sftp_run(self, func, *args, retry=True):
+        """Run a sftp operation on the pooled session. Retry once on a
+        new connection when the operation failed because the transport
+        was dropped, other errors (e.g. missing file) are raised.
+        :param func: callable receiving the SFTPClient as first argument
+        :param retry: False when the operation can't be run again, such
+            as uploading from a stream which is partly read.
+        """
+        with self._sftp_lock:
+            sftp = self._transfer()
+            try:
+                return func(sftp, *args)
+            except Exception:
+                if not retry or self._sftp_alive():
+                    raise
+                logger.warning(f"Sftp session to {self.host} is dropped, reconnect")
+                self.close()
+                return func(self._transfer(), *args)
 
     def pwd_connect(self):
         """SSH command execution connection by password"""
@@ -95,41 +146,21 @@ class SSHConnect:
         ssh.connect(self.host, self.port, self.user, pkey=pkey, timeout=self.timeout)
         return ssh
 
-    def pwd_transfer(self):
-        """Sftp download/upload execution connection by password"""
-        # transport = paramiko.Transport((self.host, self.port))
-        # transport.connect(username=self.user, password=self.pwd)
-        # sftp = paramiko.SFTPClient.from_transport(transport)
-        # return sftp, transport
-        try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(self.host, self.port, self.user, self.pwd, timeout=self.timeout)
-            return ssh.open_sftp(), ssh.get_transport()
-        except Exception as exc:
-            raise ConnectionError(f"Failed to ssh connect the {self.host}.") from exc
-
-    def rsa_transfer(self):
-        """Sftp download/upload execution connection by key file"""
-        pkey = paramiko.RSAKey.from_private_key_file(self.rsa)
-        transport = paramiko.Transport((self.host, self.port))
-        transport.connect(username=self.user, pkey=pkey)
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        return sftp, transport
-
-    def runcmd(self, cmd, if_stdout=False, log_print=True, timeout=None):
+    def runcmd(self, cmd, if_stdout=False, log_print=True, timeout=None, raw=False):
         """Executes SSH command on remote hostname.
         :param str cmd: The command to run
         :param str if_stdout: default to return to stderr
         :param str log_print: default to print the output
         :param int timeout: timeout in seconds for command execution (default: None for no timeout)
+        :param bool raw: return the undecoded stdout bytes without
+            printing them, used to read file content by byte offset.
         """
         ssh = self._connect()
         logger.info(f"[{self.host}:{self.port}] >>> {cmd}")
         try:
             stdin, stdout, stderr = ssh.exec_command(cmd)
         except Exception:
-            self._ssh = None
+            self.close()
             ssh = self._connect()
             stdin, stdout, stderr = ssh.exec_command(cmd)
 
@@ -137,13 +168,20 @@ class SSHConnect:
             stdout.channel.settimeout(timeout)
 
         try:
-            code = stdout.channel.recv_exit_status()
-            stdout, stderr = stdout.read(), stderr.read()
+            if raw:
+                channel = stdout.channel
+                stdout, stderr = stdout.read(), stderr.read()
+                code = channel.recv_exit_status()
+            else:
+                code = stdout.channel.recv_exit_status()
+                stdout, stderr = stdout.read(), stderr.read()
         except socket.timeout:
             logger.error(f"Command execution timed out after {timeout} seconds: {cmd}")
             self.close()
             raise FailException(f"Command timed out after {timeout} seconds: {cmd}")
 
+        if raw:
+            return code, stdout
         if if_stdout or not stderr:
             if log_print:
                 logger.info("<<< stdout\n{}".format(stdout.decode()))
@@ -153,35 +191,60 @@ class SSHConnect:
                 logger.info("<<< stderr\n{}".format(stderr.decode()))
             return code, stderr.decode()
 
+    def open_channel(self, cmd):
+        """Start a command on the pooled connection and return its
+        channel without waiting, the caller reads the output while the
+        command is still running and closes the channel.
+        :param str cmd: The command to run
+        :return: paramiko Channel
+        """
+        logger.info(f"[{self.host}:{self.port}] >>> (stream) {cmd}")
+        try:
+            channel = self._connect().get_transport().open_session()
+        except Exception:
+            self.close()
+            channel = self._connect().get_transport().open_session()
+        channel.exec_command(cmd)
+        return channel
+
     def get_file(self, remote_file, local_file):
         """Download a remote file to the local machine."""
-        sftp, conn = self._transfer()
-        sftp.get(remote_file, local_file)
-        conn.close()
+        self._sftp_run(lambda sftp: sftp.get(remote_file, local_file))
 
     def put_file(self, local_file, remote_file):
         """Upload a local file to a remote machine
         :param local_file: either a file path or a file-like object to be uploaded.
         :param remote_file: a remote file path where the uploaded file will be placed.
         """
-        sftp, conn = self._transfer()
-        sftp.put(local_file, remote_file)
-        conn.close()
+        if not hasattr(local_file, "read"):
+            self._sftp_run(lambda sftp: sftp.put(local_file, remote_file))
+            return
+        # the retry uploads the file object again from the same position
+        seekable = hasattr(local_file, "seekable") and local_file.seekable()
+        start = local_file.tell() if seekable else None
+
+        def put(sftp):
+            if seekable:
+                local_file.seek(start)
+            sftp.putfo(local_file, remote_file)
+
+        self._sftp_run(put, retry=seekable)
 
     def remove_file(self, remote_file):
         """Remove the file at the given path.
         :param remote_file: a remote file path to remove
         """
-        sftp, conn = self._transfer()
-        sftp.remove(remote_file)
-        conn.close()
+        self._sftp_run(lambda sftp: sftp.remove(remote_file))
 
     def put_dir(self, local_dir, remote_dir):
         """Upload all files from directory to a remote directory
         :param local_dir: all files from local path to be uploaded.
         :param remote_dir: a remote path where the uploaded files will be placed.
         """
-        sftp, conn = self._transfer()
+        self._sftp_run(self._put_dir, local_dir, remote_dir)
+
+    def _put_dir(self, sftp, local_dir, remote_dir):
+        """Upload all files from directory by the given sftp session."""
         for root, dirs, files in os.walk(local_dir):
             for filespath in files:
                 local_file = os.path.join(root, filespath)
@@ -200,4 +263,3 @@ class SSHConnect:
                     sftp.mkdir(remote_path)
                 except Exception as e:
                     logger.info(e)
-        conn.close()